@@ -37,6 +37,7 @@ import os
 from tkinter import *
 from tkinter import ttk
 
+from .Assets import AssetCache
 from lib.tools import get_absolute_path
 from lib.text_view import view_text
 
@@ -86,7 +87,7 @@ class AboutDialog(Toplevel):
         tk_patch_level = self.tk.call('info', 'patchlevel')
         ext = '.png' if tk_patch_level >= '8.6' else '.gif'
         icon = get_absolute_path('icons', f'desenhando_48{ext}')
-        self.icon_image = PhotoImage(file=icon)
+        self.icon_image = AssetCache.get_instance().get(icon)
         logo = Label(frame_background, image=self.icon_image, bg=self.bg)
         logo.grid(row=0, column=0, sticky=W, rowspan=2, padx=10, pady=10)
 
@@ -0,0 +1,174 @@
+"""
++----------------------------------------------------------------------------------------+
+|                                 This file is part of:                                  |
+|                                      DESENHANDO                                        |
+|                                 www.github.com/...                                     |
++----------------------------------------------------------------------------------------+
+|     Copyright (c) 2021 João Vitor, ...                                                 |
+|                                                                                        |
+|     Permission is hereby granted, free of charge, to any person obtaining a copy       |
+|     of this software and associated documentation files (the "Software"), to deal      |
+|     in the Software without restriction, including without limitation the rights       |
+|     to use, copy, modify, merge, publish, distribute, sublicense, and/or sell          |
+|     copies of the Software, and to permit persons to whom the Software is              |
+|     furnished to do so, subject to the following conditions:                           |
+|                                                                                        |
+|     The above copyright notice and this permission notice shall be included in         |
+|     all copies or substantial portions of the Software.                                |
+|                                                                                        |
+|     THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR         |
+|     IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,           |
+|     FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE        |
+|     AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER             |
+|     LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,      |
+|     OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN          |
+|     THE SOFTWARE.                                                                      |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+|                                         ABSTRACT                                       |
++----------------------------------------------------------------------------------------+
+| Images shared by the whole application, decoded once and preloaded in background.      |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+"""
+
+import base64
+import logging
+import math
+import os
+import queue
+from threading import Thread
+
+from tkinter import *
+
+
+class AssetCache:
+    """
+    Images of the application (icons, logos), each file decoded at most once
+    per session. Images are keyed by path and size: a size other than the
+    one of the file is made from the decoded image with subsample or zoom,
+    and kept as well.
+
+    preload() reads the files in a background thread. Tk objects can only be
+    created on the main thread, so the bytes are turned into PhotoImages
+    there, a few per turn of the event loop.
+    """
+
+    poll_interval = 20  # ms
+    images_per_turn = 4
+
+    def __new__(cls, *args, **kwargs):
+        if not hasattr(cls, 'instance'):
+            cls.instance = super().__new__(cls)
+        return cls.instance
+
+    def __init__(self, master):
+        """
+        :param master: Tk root
+        """
+        self.master = master
+        # (path, size) -> PhotoImage; size None is the image as stored in the file
+        self._images = {}
+        # path -> base64 contents read by the background thread, not decoded yet
+        self._data = {}
+        self._loaded = queue.Queue()
+        # Files that could not be read or decoded
+        self._failed = set()
+        self._waiting = []
+        self._job = None
+
+    @classmethod
+    def get_instance(cls):
+        if hasattr(cls, 'instance'):
+            return cls.instance
+        else:
+            raise AttributeError('function object has no attribute instance')
+
+    def get(self, path, size=None):
+        """
+        Image of a file, decoded now unless it already was.
+
+        :param path: image file
+        :param size: longest side wanted in pixels (default: the size of the file);
+                     reached with an integer subsample or zoom, so it may be smaller
+        :return: PhotoImage
+        """
+        # The same file reached through different paths is still one image
+        path = os.path.realpath(path)
+        image = self._images.get((path, size))
+        if image is not None:
+            return image
+        image = self._images.get((path, None))
+        if image is None:
+            data = self._data.pop(path, None)
+            if data is not None:
+                image = PhotoImage(master=self.master, data=data)
+            else:
+                image = PhotoImage(master=self.master, file=path)
+            self._images[path, None] = image
+        if size is not None:
+            image = self._images[path, size] = self._scaled(image, size)
+        return image
+
+    @staticmethod
+    def _scaled(image, size):
+        side = max(image.width(), image.height())
+        if size < side:
+            return image.subsample(math.ceil(side / size))
+        if size >= 2 * side:
+            return image.zoom(size // side)
+        return image
+
+    def preload(self, paths, size=None, callback=None):
+        """
+        Read images in the background; callback, if given, receives the list
+        of images on the main thread once all of them are ready (the ones
+        that could not be loaded are left out).
+
+        :param paths: image files
+        :param size: as in get
+        :param callback: function(images)
+        :return: None
+        """
+        paths = [os.path.realpath(path) for path in paths]
+        if callback is not None:
+            self._waiting.append((paths, size, callback))
+        missing = [path for path in paths if (path, None) not in self._images and path not in self._data
+                   and path not in self._failed]
+        if missing:
+            Thread(target=self._read, args=(missing,), daemon=True).start()
+        if self._job is None:
+            self._job = self.master.after(self.poll_interval if missing else 0, self._poll)
+
+    def _read(self, paths):
+        for path in paths:
+            try:
+                with open(path, 'rb') as file:
+                    self._loaded.put((path, base64.b64encode(file.read()).decode('ascii')))
+            except OSError as error:
+                logging.error(f'Error reading {path}: {error}')
+                self._loaded.put((path, None))
+
+    def _poll(self):
+        self._job = None
+        for _ in range(self.images_per_turn):
+            try:
+                path, data = self._loaded.get_nowait()
+            except queue.Empty:
+                break
+            if data is not None and (path, None) not in self._images:
+                self._data[path] = data
+            try:
+                self.get(path)
+            except TclError as error:
+                logging.error(f'Error decoding {path}: {error}')
+                self._failed.add(path)
+        still_waiting = []
+        for paths, size, callback in self._waiting:
+            if all((path, None) in self._images or path in self._failed for path in paths):
+                callback([self.get(path, size) for path in paths if path not in self._failed])
+            else:
+                still_waiting.append((paths, size, callback))
+        self._waiting = still_waiting
+        if self._waiting or not self._loaded.empty():
+            self._job = self.master.after(self.poll_interval, self._poll)
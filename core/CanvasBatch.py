@@ -0,0 +1,222 @@
+"""
++----------------------------------------------------------------------------------------+
+|                                 This file is part of:                                  |
+|                                      DESENHANDO                                        |
+|                                 www.github.com/...                                     |
++----------------------------------------------------------------------------------------+
+|     Copyright (c) 2021 João Vitor, ...                                                 |
+|                                                                                        |
+|     Permission is hereby granted, free of charge, to any person obtaining a copy       |
+|     of this software and associated documentation files (the "Software"), to deal      |
+|     in the Software without restriction, including without limitation the rights       |
+|     to use, copy, modify, merge, publish, distribute, sublicense, and/or sell          |
+|     copies of the Software, and to permit persons to whom the Software is              |
+|     furnished to do so, subject to the following conditions:                           |
+|                                                                                        |
+|     The above copyright notice and this permission notice shall be included in         |
+|     all copies or substantial portions of the Software.                                |
+|                                                                                        |
+|     THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR         |
+|     IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,           |
+|     FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE        |
+|     AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER             |
+|     LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,      |
+|     OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN          |
+|     THE SOFTWARE.                                                                      |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+|                                         ABSTRACT                                       |
++----------------------------------------------------------------------------------------+
+| Queue canvas commands and send them to Tcl in a single evaluation.                     |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+
+Tkinter sends every canvas method call to Tcl on its own. A CanvasBatch
+queues them instead and runs the whole queue through one call of a small
+Tcl procedure, which returns the results of all the commands at once.
+"""
+
+from tkinter import TclError
+
+# Runs canvas subcommands on a widget and returns the list of their results
+# followed by the list of the failed commands, as index and error message
+# pairs; a failed command leaves an empty result and the batch goes on.
+# The commands come in pairs with the positions of their arguments that hold
+# the index of an earlier result of the batch, eg. the id of an item created
+# in it, which is put in place before the command runs.
+BATCH_COMMAND = '::desenhando::canvas_batch'
+BATCH_PROCEDURE = '''
+namespace eval ::desenhando {}
+proc ::desenhando::canvas_batch {widget commands} {
+    set results {}
+    set errors {}
+    foreach {references command} $commands {
+        foreach position $references {
+            lset command $position [lindex $results [lindex $command $position]]
+        }
+        if {[catch {$widget {*}$command} result]} {
+            lappend errors [llength $results] $result
+            set result {}
+        }
+        lappend results $result
+    }
+    return [list $results $errors]
+}
+'''
+
+
+class ItemRef:
+    """
+    Item created through a CanvasBatch. Its canvas id is only known once
+    the batch is flushed; until then the reference can be given as the item
+    of other commands of the same batch. After the flush, id stays None
+    when the item could not be created.
+    """
+
+    __slots__ = ('index', 'id')
+
+    def __init__(self, index):
+        self.index = index
+        self.id = None
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.index}, id={self.id})'
+
+
+class CanvasBatch:
+    """
+    Queue of canvas commands, run with a single Tcl call by flush().
+
+    The methods mirror the tkinter.Canvas ones used on document items:
+    create_* return ItemRef objects instead of ids, the other methods
+    return nothing.
+    """
+
+    def __init__(self, canvas):
+        """
+        :param canvas: tkinter Canvas the commands are meant for
+        """
+        self.canvas = canvas
+        # (command, error message) of the commands that failed in the last flush
+        self.errors = []
+        self._commands = []
+        self._created = []
+        if not canvas.tk.call('info', 'commands', BATCH_COMMAND):
+            canvas.tk.eval(BATCH_PROCEDURE)
+
+    def __len__(self):
+        return len(self._commands) // 2
+
+    def _add(self, name, items, *arguments):
+        """
+        Queue the subcommand name applied to items (ids, tags or ItemRef)
+        followed by arguments.
+        """
+        references = []
+        command = [name]
+        for item in items:
+            if isinstance(item, ItemRef):
+                if item.id is None:
+                    if item.index is None:
+                        raise ValueError(f'{item!r} was not created')
+                    references.append(len(command))
+                    command.append(item.index)
+                    continue
+                item = item.id
+            command.append(item)
+        command.extend(arguments)
+        self._commands.append(tuple(references))
+        self._commands.append(tuple(command))
+
+    @staticmethod
+    def _options(options):
+        arguments = []
+        for key, value in options.items():
+            if value is not None:
+                arguments += ('-' + key, value)
+        return arguments
+
+    def create(self, kind, coords, options):
+        """
+        Queue the creation of an item.
+
+        :param kind: canvas item type
+        :param coords: flat coordinate list
+        :param options: item options
+        :return: ItemRef
+        """
+        item = ItemRef(len(self._commands) // 2)
+        self._commands.append(())
+        self._commands.append(('create', kind, tuple(coords), *self._options(options)))
+        self._created.append(item)
+        return item
+
+    def create_line(self, *coords, **options):
+        return self.create('line', coords, options)
+
+    def create_rectangle(self, *coords, **options):
+        return self.create('rectangle', coords, options)
+
+    def create_oval(self, *coords, **options):
+        return self.create('oval', coords, options)
+
+    def create_polygon(self, *coords, **options):
+        return self.create('polygon', coords, options)
+
+    def create_arc(self, *coords, **options):
+        return self.create('arc', coords, options)
+
+    def create_text(self, *coords, **options):
+        return self.create('text', coords, options)
+
+    def coords(self, item, *coords):
+        self._add('coords', (item,), coords)
+
+    def itemconfigure(self, item, **options):
+        if options:
+            self._add('itemconfigure', (item,), *self._options(options))
+
+    def move(self, item, dx, dy):
+        self._add('move', (item,), dx, dy)
+
+    def delete(self, *items):
+        if items:
+            self._add('delete', items)
+
+    def tag_lower(self, item, below=None):
+        self._add('lower', (item,) if below is None else (item, below))
+
+    def tag_raise(self, item, above=None):
+        self._add('raise', (item,) if above is None else (item, above))
+
+    def flush(self):
+        """
+        Run the queued commands, in order, with one Tcl call. Failed commands
+        do not stop the others; they are listed in errors. When the call
+        itself fails nothing is known of what ran, errors holds (None, message)
+        and no item gets an id.
+
+        :return: list of the ItemRef created since the last flush, ids filled in
+        """
+        self.errors = []
+        if not self._commands:
+            return []
+        commands, self._commands = self._commands, []
+        created, self._created = self._created, []
+        tk = self.canvas.tk
+        try:
+            results, errors = tk.splitlist(tk.call(BATCH_COMMAND, self.canvas._w, tuple(commands)))
+            results = tk.splitlist(results)
+            errors = tk.splitlist(errors)
+        except (TclError, ValueError) as error:
+            self.errors.append((None, str(error)))
+            results = None
+        else:
+            self.errors = [(commands[2 * tk.getint(index) + 1], message)
+                           for index, message in zip(errors[0::2], errors[1::2])]
+        for item in created:
+            result = str(results[item.index]) if results is not None else ''
+            item.id = tk.getint(result) if result else None
+            # The index means nothing in the next batches
+            item.index = None
+        return created
@@ -59,8 +59,14 @@ class DesenhandoBase(ttk.Frame):
 
         # Components menu
         self.file = Files.SalveAs(self)
+        self.drawing_file = Files.DrawingFile(self)
+        self.export = Files.Export(self)
+        self.import_image = Files.ImportImage(self)
         self.help = Help.About(self)
+        self.diagnostics = Help.Diagnostics(self)
         self.editions = Editions.PageSize(self)
+        self.layers = Editions.Layers(self)
+        self.undo_redo = Editions.UndoRedo(self)
 
         # Components
         self.drawing_area = DrawingArea.DrawingArea(self, column=0, row=2, sticky=(N, S, E, W))
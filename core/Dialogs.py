@@ -40,20 +40,62 @@ from .DrawingArea import DrawingArea
 
 
 class LoadingDialog(Toplevel):
+    """
+    Modal progress window. Without a task the bar just spins; with a task
+    (an object with progress, bytes_written and cancel, like SaveImage) it
+    shows how much was done and offers to cancel it.
+    """
 
-    def __init__(self, parent, **kwargs):
+    refresh_interval = 100  # ms
+
+    def __init__(self, parent, task=None, **kwargs):
         super().__init__(parent, **kwargs)
         self.title('Loading...')
         self.resizable(False, False)
         self.protocol("WM_DELETE_WINDOW", self.ok)
         self.transient(parent)
         self.grab_set()
+        self.task = task
+        self._job = None
         self.frame = ttk.Frame(self)
         self.frame.grid(column=0, row=0, sticky=(N, S, E, W), padx=5, pady=5)
 
-        self.progress_bar = ttk.Progressbar(self.frame, orient=HORIZONTAL, mode='indeterminate')
+        if task is None:
+            self.progress_bar = ttk.Progressbar(self.frame, orient=HORIZONTAL, mode='indeterminate')
+            self.progress_bar.grid(column=0, row=0, sticky=(N, S, E, W), padx=5, pady=5)
+            self.progress_bar.start()
+            return
+
+        self.progress_bar = ttk.Progressbar(self.frame, orient=HORIZONTAL, mode='determinate',
+                                            length=250, maximum=100)
         self.progress_bar.grid(column=0, row=0, sticky=(N, S, E, W), padx=5, pady=5)
-        self.progress_bar.start()
+        self.status = ttk.Label(self.frame, text='')
+        self.status.grid(column=0, row=1, sticky=(E, W), padx=5)
+        self.cancel_button = ttk.Button(self.frame, text='Cancel', command=self.cancel)
+        self.cancel_button.grid(column=0, row=2, pady=5)
+        self.update_progress()
+
+    def update_progress(self):
+        """
+        Show the progress of the task and schedule the next refresh.
+
+        :return: None
+        """
+        task = self.task
+        self.progress_bar['value'] = task.progress * 100
+        self.status['text'] = f'{task.progress:.0%} - {task.bytes_written / 2 ** 20:.1f} MiB'
+        self._job = self.after(self.refresh_interval, self.update_progress)
+
+    def cancel(self):
+        self.task.cancel()
+        self.cancel_button.state(['disabled'])
+        self.status['text'] = 'Cancelling...'
+
+    def destroy(self):
+        if self._job is not None:
+            self.after_cancel(self._job)
+            self._job = None
+        super().destroy()
 
     def ok(self, event=None):
         pass
@@ -126,3 +168,93 @@ class PageSizeDialog(Toplevel):
         x = self.size_x.get()
         y = self.size_y.get()
         self.draw_area.update_workspace_size(x, y)
+
+
+class LayersDialog(Toplevel):
+
+    def __init__(self, parent, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.title('Layers')
+        self.resizable(False, False)
+        self.protocol("WM_DELETE_WINDOW", self.ok)
+        self.transient(parent)
+        self.draw_area = DrawingArea.get_instance_of_drawing_area()
+        self.layers = self.draw_area.layers
+
+        self.frame = frame = ttk.Frame(self)
+        self.frame.grid(column=0, row=0, sticky=(N, S, E, W), padx=5, pady=5)
+
+        self.tree = ttk.Treeview(frame, columns=('visible', 'locked'), height=8, selectmode='browse')
+        self.tree.heading('#0', text='Layer')
+        self.tree.heading('visible', text='Visible')
+        self.tree.heading('locked', text='Locked')
+        self.tree.column('visible', width=60, anchor=CENTER)
+        self.tree.column('locked', width=60, anchor=CENTER)
+        self.tree.grid(column=0, row=0, columnspan=4, sticky=(N, S, E, W))
+        self.tree.bind('<<TreeviewSelect>>', self.activate_layer)
+
+        ttk.Button(frame, text='Add', command=self.add_layer).grid(column=0, row=1, pady=5)
+        ttk.Button(frame, text='Remove', command=self.remove_layer).grid(column=1, row=1, pady=5)
+        ttk.Button(frame, text='Up', command=lambda: self.move_layer(1)).grid(column=2, row=1, pady=5)
+        ttk.Button(frame, text='Down', command=lambda: self.move_layer(-1)).grid(column=3, row=1, pady=5)
+        ttk.Button(frame, text='Show/Hide', command=self.toggle_visible).grid(column=0, row=2, columnspan=2)
+        ttk.Button(frame, text='Lock/Unlock', command=self.toggle_locked).grid(column=2, row=2, columnspan=2)
+
+        ttk.Label(frame, text='Opacity ').grid(column=0, row=3, pady=5)
+        self.opacity = ttk.Scale(frame, orient=HORIZONTAL, from_=0, to=100)
+        self.opacity.grid(column=1, row=3, columnspan=3, sticky=(E, W), pady=5)
+        self.opacity.bind('<ButtonRelease-1>', self.set_opacity)
+
+        self.update_list()
+
+    def ok(self, event=None):
+        self.destroy()
+
+    def update_list(self):
+        """
+        List the layers with the top one first and select the active one.
+
+        :return: None
+        """
+        self.tree.delete(*self.tree.get_children())
+        for layer in reversed(self.draw_area.document.layers):
+            self.tree.insert('', END, iid=str(layer.id), text=layer.name,
+                             values=('yes' if layer.visible else 'no', 'yes' if layer.locked else 'no'))
+        active = self.layers.active
+        self.tree.selection_set(str(active.id))
+        self.opacity.set(active.opacity * 100)
+
+    def activate_layer(self, event=None):
+        selection = self.tree.selection()
+        if selection and int(selection[0]) != self.layers.active.id:
+            self.layers.activate(int(selection[0]))
+            self.opacity.set(self.layers.active.opacity * 100)
+
+    def add_layer(self):
+        self.layers.add()
+        self.update_list()
+
+    def remove_layer(self):
+        try:
+            self.layers.remove(self.layers.active.id)
+        except ValueError:
+            return
+        self.update_list()
+
+    def move_layer(self, step):
+        active = self.layers.active
+        self.layers.move(active.id, self.draw_area.document.layer_position(active.id) + step)
+        self.update_list()
+
+    def toggle_visible(self):
+        active = self.layers.active
+        self.layers.set_visible(active.id, not active.visible)
+        self.update_list()
+
+    def toggle_locked(self):
+        active = self.layers.active
+        self.layers.set_locked(active.id, not active.locked)
+        self.update_list()
+
+    def set_opacity(self, event=None):
+        self.layers.set_opacity(self.layers.active.id, self.opacity.get() / 100)
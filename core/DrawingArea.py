@@ -32,10 +32,21 @@
 +----------------------------------------------------------------------------------------+
 """
 
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+
 from tkinter import *
 from tkinter import ttk
 
+from .CanvasBatch import CanvasBatch
 from .CustomComponents import AutoHideScrollbar
+from .Layers import LayerStack, PhotoLayer
+from lib.document import Document
+from lib.geometry import bbox_contains, bbox_intersects
+from lib.history import History
+from lib.session import MOTION, PRESS, RELEASE
 from .Tools import PencilTool  # test
 
 
@@ -61,6 +72,7 @@ class StatusBar(ttk.Frame):
         self.zoom.bind('<<ComboboxSelected>>', self.set_zoom)
         self.zoom.bind('<Return>', self.set_zoom)
         self.zoom.grid(column=4, row=0)
+        self.zoom.set('100%')
 
     def set_zoom(self, event=None):
         s = self.zoom.get()
@@ -68,21 +80,126 @@ class StatusBar(ttk.Frame):
         try:
             value = int(s)
             self.zoom.set('{}%'.format(value))
+            self.event_generate('<<ZoomChanged>>')
         except ValueError:
             pass
 
     def _format_input(self, value):
         return int(value.replace('%', ''))
 
+    def get_zoom(self):
+        return self._format_input(self.zoom.get()) / 100
+
+    def show_zoom(self, zoom):
+        self.zoom.set('{}%'.format(round(zoom * 100)))
+
     def set_position(self, x, y):
         self.mouse_position['text'] = self.format_position.format(x, y)
 
     def set_page_size(self, x, y):
         self.page_size['text'] = self.format_page_size.format(x, y)
 
+    def show_profile(self, text):
+        """
+        Show the live event measures (see DrawingArea.start_profiling), or hide them when text is None.
+
+        :return: None
+        """
+        if text is None:
+            if hasattr(self, 'profile'):
+                self.profile.grid_remove()
+            return
+        if not hasattr(self, 'profile'):
+            self.profile = ttk.Label(self, text='', font=('courier', 9))
+        self.profile['text'] = text
+        self.profile.grid(column=5, row=0, padx=10)
+
+
+class MotionCoalescer:
+    """
+    Keeps only the latest of a burst of motion events and hands it to the
+    callback at most rate times per second, through after/after_idle. With
+    a rate of 0 (or less) every event is handed over at once.
+    """
+
+    def __init__(self, widget, callback, rate=60):
+        """
+        :param widget: any tkinter widget, used to schedule the flush
+        :param callback: function called with the latest pending event
+        :param rate: maximum number of flushes per second, 0 for no limit
+        """
+        self.widget = widget
+        self.callback = callback
+        self.rate = rate
+        self._event = None
+        self._job = None
+        self._last_flush = 0.0
+
+    @property
+    def interval(self):
+        return 1.0 / self.rate if self.rate > 0 else 0.0
+
+    def push(self, event):
+        self._event = event
+        if self.rate <= 0:
+            self.flush()
+        elif self._job is None:
+            delay = self.interval - (time.perf_counter() - self._last_flush)
+            if delay <= 0:
+                self._job = self.widget.after_idle(self.flush)
+            else:
+                self._job = self.widget.after(max(1, int(delay * 1000)), self.flush)
+
+    def flush(self):
+        """
+        Deliver the pending event now, if there is one.
+
+        :return: None
+        """
+        if self._job is not None:
+            self.widget.after_cancel(self._job)
+            self._job = None
+        event, self._event = self._event, None
+        if event is not None:
+            self._last_flush = time.perf_counter()
+            self.callback(event)
+
+
+class ProfiledTool:
+    """
+    Stands for the tool while the events are profiled, timing its callbacks.
+    Everything else is forwarded to the tool itself.
+    """
+
+    callbacks = ('start', 'sample', 'update', 'finish')
+
+    def __init__(self, tool, profiler):
+        object.__setattr__(self, 'tool', tool)
+        object.__setattr__(self, 'profiler', profiler)
+
+    def __getattr__(self, name):
+        value = getattr(self.tool, name)
+        if name in self.callbacks:
+            value = self.profiler.wrap(f'{type(self.tool).__name__}.{name}', value)
+            object.__setattr__(self, name, value)
+        return value
+
+    def __setattr__(self, name, value):
+        setattr(self.tool, name, value)
+
 
 class DrawingArea:
 
+    # Maximum number of status bar and tool preview updates per second
+    motion_rate = 60
+
+    min_zoom = 0.1
+    max_zoom = 8.0
+    zoom_step = 1.25
+
+    # Area kept on the canvas around the visible region, as a fraction of the window size
+    viewport_margin = 0.5
+
     def __new__(cls, *args, **kwargs):
         if not hasattr(cls, 'instance'):
             cls.instance = super().__new__(cls)
@@ -104,14 +221,14 @@ class DrawingArea:
                                           takefocus=False,
                                           command=drawing_area.xview)
         self.scroll_x.grid(column=0, row=1, sticky=(E, W))
-        drawing_area['xscrollcommand'] = self.scroll_x.set
+        drawing_area['xscrollcommand'] = self._on_xview_changed
 
         self.scroll_y = AutoHideScrollbar(frame,
                                           orient=VERTICAL,
                                           takefocus=False,
                                           command=drawing_area.yview)
         self.scroll_y.grid(column=1, row=0, sticky=(N, S))
-        drawing_area['yscrollcommand'] = self.scroll_y.set
+        drawing_area['yscrollcommand'] = self._on_yview_changed
 
         ttk.Separator(frame, orient=HORIZONTAL).grid(column=0, row=2, pady=10, sticky=(E, W), columnspan=2)
 
@@ -119,41 +236,768 @@ class DrawingArea:
         self.status_bar = StatusBar(frame)
         self.status_bar.grid(column=0, row=3, sticky=(E, W))
 
+        # Origin of the visible region, so that window coordinates can be
+        # converted without a canvasx/canvasy round trip to Tcl
+        self._origin = None
+        self._status_motion = MotionCoalescer(drawing_area, self._show_mouse_position, self.motion_rate)
+        self._preview_motion = MotionCoalescer(drawing_area, self._update_tool_preview, self.motion_rate)
+
         self.drawing_area.bind('<Motion>', self.update_mouse_position)
         self.drawing_area.bind('<Button-1>', self.start_drawing)
         self.drawing_area.bind('<B1-Motion>', self.update_drawing)
         self.drawing_area.bind('<B1-ButtonRelease>', self.finish_drawing)
 
+        # Zoom with the status bar combobox or Ctrl + mouse wheel
+        self.zoom = 1.0
+        self.status_bar.bind('<<ZoomChanged>>', self._on_zoom_selected)
+        self.drawing_area.bind('<Control-MouseWheel>', self._on_zoom_wheel)
+        self.drawing_area.bind('<Control-Button-4>', self._on_zoom_wheel)
+        self.drawing_area.bind('<Control-Button-5>', self._on_zoom_wheel)
+
+        # Python side model of the drawing; canvas items are only its mirror.
+        # Document coordinates are page pixels, canvas ones are scaled by zoom.
+        self.document = Document(1024, 720)
+        self._canvas_ids = {}
+        self._document_ids = {}
+        self._materialized = []
+        # Canvas commands of bulk operations are queued and sent to Tcl at once, see batched
+        self.canvas_batch = CanvasBatch(drawing_area)
+        self._batch_depth = 0
+        self._redraw_job = None
+        self._raise_layers_above = False
+        # Page region whose items currently exist on the canvas
+        self._region = None
+        self._viewport_job = None
+        self.drawing_area.bind('<Configure>', self._on_view_changed, add='+')
+
+        # Pixel layer below the vector items, created on first use
+        self.raster = None
+        self._raster_view = None
+
+        # Imported image shown below everything else (core.ReferenceImage)
+        self.reference = None
+
+        # Only the active layer lives in Tk, the others are cached bitmaps
+        self.layers = LayerStack(self)
+
+        # Each gesture is recorded as one undo step
+        self.history = History(self)
+        self._gesture_open = False
+
+        # Autosave journal (lib.journal.Journal), see attach_journal
+        self.journal = None
+
+        # lib.profiling.EventProfiler while the handlers are measured, see start_profiling
+        self.profiler = None
+        self._profile_job = None
+
+        # lib.session.SessionWriter while the input is recorded, see start_recording
+        self.recorder = None
+
         self.update_workspace_size(1024, 720)
         self.tool = None
 
+    @property
+    def tool(self):
+        return self._tool
+
+    @tool.setter
+    def tool(self, tool):
+        if self.profiler is not None and tool is not None and not isinstance(tool, ProfiledTool):
+            tool = ProfiledTool(tool, self.profiler)
+        self._tool = tool
+
+    # Handlers timed by start_profiling, with the events they are bound to
+    profiled_handlers = (('start_drawing', '<Button-1>'), ('update_drawing', '<B1-Motion>'),
+                         ('finish_drawing', '<B1-ButtonRelease>'), ('update_mouse_position', '<Motion>'))
+    # Pointer events counted by start_profiling for the events per second
+    profiled_motion = ('<Motion>', '<B1-Motion>')
+
+    def start_profiling(self, overlay=True):
+        """
+        Measure the latency of the event handlers and of the tool callbacks,
+        the events per second and the number of items (lib.profiling.EventProfiler).
+
+        :param overlay: show the live measures in the status bar
+        :return: EventProfiler
+        """
+        from lib.profiling import EventProfiler
+
+        if self.profiler is not None:
+            return self.profiler
+        self.profiler = profiler = EventProfiler(
+            lambda: {'canvas items': len(self._canvas_ids), 'document items': len(self.document)})
+        for name, sequence in self.profiled_handlers:
+            setattr(self, name, profiler.wrap(name, getattr(self, name)))
+            self.drawing_area.bind(sequence, getattr(self, name))
+        for sequence in self.profiled_motion:
+            # update_drawing calls update_mouse_position, so handler calls would count drags twice
+            self.drawing_area.bind(sequence, lambda event: profiler.count('motion'), add='+')
+        self._status_motion.callback = profiler.wrap('show_mouse_position', self._show_mouse_position)
+        self._preview_motion.callback = profiler.wrap('update_tool_preview', self._update_tool_preview)
+        self.tool = self.tool
+        if overlay:
+            self._show_profile()
+        return profiler
+
+    def stop_profiling(self):
+        """
+        Stop measuring; the handlers run without any overhead again.
+
+        :return: EventProfiler with the measures taken, or None
+        """
+        profiler, self.profiler = self.profiler, None
+        if profiler is None:
+            return None
+        for name, sequence in self.profiled_handlers:
+            del self.__dict__[name]
+            self.drawing_area.bind(sequence, getattr(self, name))
+        self._status_motion.callback = self._show_mouse_position
+        self._preview_motion.callback = self._update_tool_preview
+        if isinstance(self._tool, ProfiledTool):
+            self._tool = self._tool.tool
+        if self._profile_job is not None:
+            self.drawing_area.after_cancel(self._profile_job)
+            self._profile_job = None
+        self.status_bar.show_profile(None)
+        return profiler
+
+    def _show_profile(self):
+        profiler = self.profiler
+        text = f'{profiler.rate("motion"):4.0f} ev/s'
+        if profiler.histograms:
+            # The handler with the worst latency is the one worth looking at
+            name, histogram = max(profiler.histograms.items(), key=lambda entry: entry[1].percentile(0.99))
+            text += (f'  {name} p50 {histogram.percentile(0.5) * 1000:.1f} ms'
+                     f' p99 {histogram.percentile(0.99) * 1000:.1f} ms')
+        self.status_bar.show_profile(f'{text}  {len(self._canvas_ids)} items')
+        self._profile_job = self.drawing_area.after(500, self._show_profile)
+
+    def start_recording(self, path, **info):
+        """
+        Write the button, motion and release events received from now on
+        to a session file (lib.session), to be replayed later.
+
+        :param path: session file
+        :param info: extra values stored in its header
+        :return: None
+        """
+        from lib.session import SessionWriter
+
+        self.stop_recording()
+        self.recorder = SessionWriter(path, zoom=self.zoom, width=self.document.width,
+                                      height=self.document.height, motion_rate=self.motion_rate, **info)
+
+    def stop_recording(self):
+        """
+        :return: number of events recorded, or None when not recording
+        """
+        recorder, self.recorder = self.recorder, None
+        if recorder is None:
+            return None
+        recorder.close()
+        return recorder.events
+
+    def _record(self, kind, event):
+        x, y = self.canvas_position(event)
+        state = event.state if isinstance(event.state, int) else 0
+        self.recorder.add(kind, x, y, state, getattr(event, 'time', None))
+
+    def flush_motion(self):
+        """
+        Deliver the coalesced motion updates now instead of at the next frame.
+
+        :return: None
+        """
+        self._status_motion.flush()
+        self._preview_motion.flush()
+
+    def set_motion_rate(self, rate):
+        """
+        Limit the status bar and tool preview updates to rate per second.
+
+        :param rate: updates per second, 0 to update on every event
+        :return: None
+        """
+        self.motion_rate = rate
+        self._status_motion.rate = rate
+        self._preview_motion.rate = rate
+
+    def canvas_position(self, event):
+        """
+        Position of a mouse event on the page, in document coordinates.
+
+        :param event: tkinter mouse event
+        :return: (x, y)
+        """
+        if self._origin is None:
+            self._origin = self.drawing_area.canvasx(0), self.drawing_area.canvasy(0)
+        return (event.x + self._origin[0]) / self.zoom, (event.y + self._origin[1]) / self.zoom
+
+    def visible_region(self):
+        """
+        Part of the page shown in the window, in document coordinates.
+
+        :return: (x1, y1, x2, y2)
+        """
+        canvas = self.drawing_area
+        zoom = self.zoom
+        return (canvas.canvasx(0) / zoom, canvas.canvasy(0) / zoom,
+                canvas.canvasx(canvas.winfo_width()) / zoom, canvas.canvasy(canvas.winfo_height()) / zoom)
+
+    def set_zoom(self, zoom, x=None, y=None):
+        """
+        Change the scale of the view, keeping the page point under the window
+        position (x, y) in place. Only the items around the visible region are
+        recreated, so the cost does not depend on the document size.
+
+        :param zoom: new scale (1.0 = 100%)
+        :param x: window x coordinate of the zoom center (default: middle of the canvas)
+        :param y: window y coordinate of the zoom center (default: middle of the canvas)
+        :return: None
+        """
+        zoom = max(self.min_zoom, min(self.max_zoom, zoom))
+        self.status_bar.show_zoom(zoom)
+        if zoom == self.zoom:
+            return
+
+        canvas = self.drawing_area
+        if x is None or y is None:
+            x, y = canvas.winfo_width() / 2, canvas.winfo_height() / 2
+        page_x = canvas.canvasx(x) / self.zoom
+        page_y = canvas.canvasy(y) / self.zoom
+
+        self.zoom = zoom
+        width, height = self.document.width * zoom, self.document.height * zoom
+        canvas.configure(scrollregion=(0, 0, width, height))
+        canvas.xview_moveto((page_x * zoom - x) / width)
+        canvas.yview_moveto((page_y * zoom - y) / height)
+        self._origin = None
+        self.redraw()
+        if self._raster_view is not None:
+            self._raster_view.reset(zoom)
+
+    def _on_zoom_selected(self, event=None):
+        try:
+            zoom = self.status_bar.get_zoom()
+        except ValueError:
+            return
+        self.set_zoom(zoom)
+
+    def _on_zoom_wheel(self, event):
+        if event.num == 5 or event.delta < 0:
+            self.set_zoom(self.zoom / self.zoom_step, event.x, event.y)
+        else:
+            self.set_zoom(self.zoom * self.zoom_step, event.x, event.y)
+        return 'break'
+
+    def redraw(self):
+        """
+        Recreate the canvas items from the document at the current zoom.
+
+        :return: None
+        """
+        with self.batched():
+            self._commands.delete('document')
+            self._canvas_ids.clear()
+            self._document_ids.clear()
+            self._materialized.clear()
+            self._region = None
+            self.update_viewport()
+
+    def update_viewport(self):
+        """
+        Keep on the canvas only the items around the visible region. Items that
+        enter it are recreated from the document and the ones that left it are
+        deleted, so Tk never holds more than what is on screen plus a margin.
+
+        :return: None
+        """
+        if self._viewport_job is not None:
+            self.drawing_area.after_cancel(self._viewport_job)
+            self._viewport_job = None
+
+        x1, y1, x2, y2 = visible = self.visible_region()
+        if self._region is not None and bbox_contains(self._region, visible):
+            return
+        active = self.document.active_layer
+        mx = (x2 - x1) * self.viewport_margin
+        my = (y2 - y1) * self.viewport_margin
+        self._region = region = (x1 - mx, y1 - my, x2 + mx, y2 + my)
+        if self.reference is not None:
+            self.reference.update(region, self.zoom)
+        self.layers.update_view(region)
+
+        document = self.document
+        with self.batched():
+            evicted = [item_id for item_id in self._materialized
+                       if not bbox_intersects(region, document.get(item_id).bbox)]
+            if evicted:
+                self._evict(evicted)
+            if not active.visible:
+                return
+            for item_id in document.find_overlapping(*region, layers=(active.id,)):
+                if item_id not in self._canvas_ids:
+                    self._materialize(item_id)
+
+    def _evict(self, item_ids):
+        canvas_ids = [self._canvas_ids.pop(item_id) for item_id in item_ids]
+        for canvas_id in canvas_ids:
+            del self._document_ids[canvas_id]
+        self._commands.delete(*canvas_ids)
+        evicted = set(item_ids)
+        self._materialized = [item_id for item_id in self._materialized if item_id not in evicted]
+
+    def set_reference_image(self, pyramid):
+        """
+        Show an image pyramid below the drawing, replacing the previous one.
+        The page grows to hold the whole image.
+
+        :param pyramid: lib.pyramid.Pyramid, or None to remove the image
+        :return: None
+        """
+        if self.reference is not None:
+            self.reference.clear()
+            self.reference = None
+        if pyramid is not None:
+            from .ReferenceImage import ReferenceImage
+            self.reference = ReferenceImage(self.drawing_area, pyramid)
+            if pyramid.width > self.document.width or pyramid.height > self.document.height:
+                self.update_workspace_size(max(pyramid.width, self.document.width),
+                                           max(pyramid.height, self.document.height))
+        self._region = None
+        self.update_viewport()
+
+    def raster_layer(self):
+        """
+        Pixel layer of the drawing, shown below the vector items through a
+        single PhotoImage. It is allocated the first time a tool asks for it.
+
+        :return: RasterLayer
+        """
+        if self.raster is None:
+            from lib.raster import RasterLayer
+            self.raster = RasterLayer(self.document.width, self.document.height)
+            self._raster_view = PhotoLayer(self.drawing_area, 'raster')
+            self.drawing_area.tag_lower('raster')
+            self._raster_view.show(self.raster, self.zoom)
+        return self.raster
+
+    def flush_raster(self):
+        """
+        Upload the dirty rectangles of the raster layer to its PhotoImage.
+
+        :return: None
+        """
+        if self._raster_view is not None:
+            self._raster_view.flush(self.zoom)
+
+    def _on_view_changed(self, event=None):
+        self._origin = None
+        if self._viewport_job is None:
+            self._viewport_job = self.drawing_area.after_idle(self.update_viewport)
+
+    def _materialize(self, item_id):
+        """
+        Create the canvas item of a document item, scaled to the current zoom
+        and placed at its position in the stacking order.
+        """
+        item = self.document.get(item_id)
+        coords = self._to_canvas(self.document.lod_coords(item_id, self.zoom))
+        commands = self._commands
+        canvas_id = getattr(commands, 'create_' + item.kind)(*coords, **self._view_options(item.options))
+
+        position = bisect.bisect(self._materialized, item_id)
+        if position < len(self._materialized):
+            commands.tag_lower(canvas_id, self._canvas_ids[self._materialized[position]])
+        elif self._batch_depth:
+            # Tk looks up a tag through every item, so the cached layers are
+            # raised once over all the new items when the batch is flushed
+            self._raise_layers_above = True
+        else:
+            commands.tag_lower(canvas_id, 'layers_above')
+        self._materialized.insert(position, item_id)
+        self._canvas_ids[item_id] = canvas_id
+        self._document_ids[canvas_id] = item_id
+        return canvas_id
+
+    def _to_canvas(self, coords):
+        zoom = self.zoom
+        return coords if zoom == 1 else [c * zoom for c in coords]
+
+    def _view_options(self, options):
+        """
+        Canvas options of an item at the current zoom: line widths and font
+        sizes are scaled with the geometry.
+        """
+        options = dict(options)
+        tags = options.get('tags', ())
+        options['tags'] = (tags,) + ('document',) if isinstance(tags, str) else tuple(tags) + ('document',)
+        zoom = self.zoom
+        if zoom != 1:
+            if 'width' in options:
+                options['width'] = float(options['width']) * zoom
+            font = options.get('font')
+            if isinstance(font, (tuple, list)) and len(font) > 1:
+                size = int(font[1])
+                scaled = max(1, round(abs(size) * zoom))
+                options['font'] = (font[0], scaled if size >= 0 else -scaled) + tuple(font[2:])
+        return options
+
+    def _on_xview_changed(self, lo, hi):
+        self.scroll_x.set(lo, hi)
+        self._on_view_changed()
+
+    def _on_yview_changed(self, lo, hi):
+        self.scroll_y.set(lo, hi)
+        self._on_view_changed()
+
     def update_mouse_position(self, event=None):
-        x = self.drawing_area.canvasx(event.x)
-        y = self.drawing_area.canvasy(event.y)
-        self.status_bar.set_position(x, y)
+        self._status_motion.push(event)
+
+    def _show_mouse_position(self, event):
+        self.status_bar.set_position(*self.canvas_position(event))
+
+    def _update_tool_preview(self, event):
+        if hasattr(self.tool, 'update'):
+            self.tool.update(event)
+        self.flush_raster()
 
     def update_workspace_size(self, width, height):
+        width, height = int(width), int(height)
         self.drawing_area.configure(width=width,
                                     height=height,
-                                    scrollregion=(0, 0, width, height))
+                                    scrollregion=(0, 0, width * self.zoom, height * self.zoom))
+        self.document.resize(width, height)
+        if self.raster is not None:
+            self.raster.resize(width, height)
+            self._raster_view.reset(self.zoom)
+        self.layers.refresh()
         self.status_bar.set_page_size(width, height)
+        if self.journal is not None:
+            self.journal.page_size(width, height)
+
+    def load_document(self, document, raster=None, path=None):
+        """
+        Show another drawing, eg. one opened from a file. The undo history is cleared.
+
+        :param document: lib.document.Document
+        :param raster: RasterLayer with the pixels of the drawing, or None
+        :param path: file the drawing comes from, if any
+        :return: None
+        """
+        if self._gesture_open:
+            self._gesture_open = False
+            self.history.commit()
+        self.history.clear()
+        self.document = document
+        if raster is not None:
+            self.raster_layer().pixels = raster.pixels
+        elif self.raster is not None:
+            self.raster.clear_rect(0, 0, self.raster.width, self.raster.height)
+        self.layers.reset()
+        self.update_workspace_size(document.width, document.height)
+        self.redraw()
+        self.restart_journal(path)
+
+    def attach_journal(self, journal, resume=False):
+        """
+        Record every change of the drawing in an autosave journal.
+
+        :param journal: lib.journal.Journal
+        :param resume: continue the journal of a recovered drawing instead of starting a new one
+        :return: None
+        """
+        self.journal = journal
+        self.history.observer = self._journal_items
+        if resume:
+            journal.resume(self.document)
+        else:
+            self.restart_journal()
+
+    def restart_journal(self, path=None):
+        """
+        Start the journal over, eg. once the drawing is saved to path.
+
+        :return: None
+        """
+        if self.journal is None:
+            return
+        self.journal.start(self.document, path, self.raster)
+        if self.raster is not None:
+            self.raster.take_changes()
+
+    def _journal_items(self, item_ids):
+        if self.journal is not None:
+            self.journal.items(self.document, item_ids)
+
+    def journal_layers(self):
+        if self.journal is not None:
+            self.journal.layers(self.document)
+
+    def _journal_pixels(self):
+        if self.journal is not None and self.raster is not None:
+            rect = self.raster.take_changes()
+            if rect is not None:
+                self.journal.pixels(self.raster, rect)
 
     def get_canvas_size(self):
         return self.drawing_area.winfo_width(), self.drawing_area.winfo_height()
 
+    def create_item(self, kind, coords, **options):
+        """
+        Add an item to the document and mirror it on the canvas.
+
+        :param kind: canvas item type ('line', 'rectangle', 'oval', 'polygon' or 'text')
+        :param coords: flat coordinate list
+        :param options: canvas item options
+        :return: document id of the item
+        """
+        self.history.begin()
+        item_id = self.document.add(kind, coords, **options)
+        self.history.item_added(item_id)
+        if self.document.active_layer.visible:
+            self._materialize(item_id)
+            if kind == 'text':
+                # The size of a text is only known to Tk
+                if self._batch_depth:
+                    self._flush_batch()
+                canvas_id = self._canvas_ids.get(item_id)
+                bbox = self.drawing_area.bbox(canvas_id) if canvas_id is not None else None
+                if bbox:
+                    self.document.set_bbox(item_id, [c / self.zoom for c in bbox])
+                else:
+                    # Empty text, or the item could not be created: keep the anchor point
+                    x, y = coords[:2]
+                    self.document.set_bbox(item_id, [x, y, x, y])
+        self.history.commit()
+        return item_id
+
+    def restore_item(self, item_id, kind, coords, options, layer=None):
+        """
+        Put back an item with its old id, eg. when undoing its removal. Items
+        of a layer that no longer exists go to the active layer.
+
+        :return: None
+        """
+        if layer is not None:
+            try:
+                self.document.get_layer(layer)
+            except KeyError:
+                layer = None
+        self.history.begin()
+        self.document.add(kind, coords, layer=layer, item_id=item_id, **options)
+        self.history.item_added(item_id)
+        if self._region is not None and self._is_live(item_id) and \
+                bbox_intersects(self._region, self.document.get(item_id).bbox):
+            self._materialize(item_id)
+        self.history.commit()
+
+    def set_item_coords(self, item_id, coords):
+        self.history.begin()
+        self.history.before_change(item_id)
+        self.document.set_coords(item_id, coords)
+        canvas_id = self._canvas_ids.get(item_id)
+        if canvas_id is not None:
+            self._commands.coords(canvas_id, *self._to_canvas(coords))
+        elif self._region is not None and self._is_live(item_id) and \
+                bbox_intersects(self._region, self.document.get(item_id).bbox):
+            self._materialize(item_id)
+        self.history.commit()
+
+    def move_item(self, item_id, dx, dy):
+        """
+        Translate an item by (dx, dy) page pixels.
+
+        :return: None
+        """
+        self.history.begin()
+        self.history.before_change(item_id)
+        coords = self.document.get(item_id).coords
+        self.document.set_coords(item_id, [c + (dy if i % 2 else dx) for i, c in enumerate(coords)])
+        canvas_id = self._canvas_ids.get(item_id)
+        if canvas_id is not None:
+            self._commands.move(canvas_id, dx * self.zoom, dy * self.zoom)
+        self.history.commit()
+
+    def move_items(self, item_ids, dx, dy):
+        """
+        Translate several items by (dx, dy) page pixels, as one undo step and
+        with a single call to Tcl.
+
+        :return: None
+        """
+        self.history.begin()
+        with self.batched():
+            for item_id in item_ids:
+                self.move_item(item_id, dx, dy)
+        self.history.commit()
+
+    def configure_item(self, item_id, **options):
+        self.history.begin()
+        self.history.before_change(item_id, options.keys(), coords=False)
+        self.document.configure(item_id, **options)
+        canvas_id = self._canvas_ids.get(item_id)
+        if canvas_id is not None:
+            options = self._view_options(options)
+            del options['tags']
+            self._commands.itemconfigure(canvas_id, **options)
+        self.history.commit()
+
+    def delete_item(self, item_id):
+        if item_id not in self.document:
+            return
+        self.history.begin()
+        self.history.item_removed(item_id)
+        self.document.remove(item_id)
+        canvas_id = self._canvas_ids.pop(item_id, None)
+        if canvas_id is not None:
+            del self._document_ids[canvas_id]
+            del self._materialized[bisect.bisect_left(self._materialized, item_id)]
+            self._commands.delete(canvas_id)
+        self.history.commit()
+
+    def undo(self, event=None):
+        if self._gesture_open:
+            return
+        with self.batched():
+            undone = self.history.undo()
+        if undone:
+            self.layers.refresh()
+
+    def redo(self, event=None):
+        if self._gesture_open:
+            return
+        with self.batched():
+            redone = self.history.redo()
+        if redone:
+            self.layers.refresh()
+
+    @property
+    def _commands(self):
+        """
+        Where the canvas commands of the document items go: the batch inside
+        batched(), the canvas otherwise.
+        """
+        return self.canvas_batch if self._batch_depth else self.drawing_area
+
+    @contextmanager
+    def batched(self):
+        """
+        Queue the canvas commands of the document items issued in the block
+        and send them to Tcl with a single call at its end. Meanwhile the
+        canvas ids of the new items are CanvasBatch.ItemRef placeholders.
+        Blocks can be nested; the outermost one flushes.
+        """
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self._flush_batch()
+
+    def _flush_batch(self):
+        if self._raise_layers_above:
+            self._raise_layers_above = False
+            self.canvas_batch.tag_raise('layers_above', 'document')
+        batch = self.canvas_batch
+        for item in batch.flush():
+            item_id = self._document_ids.pop(item, None)
+            if item_id is None:
+                continue
+            if item.id is not None:
+                self._document_ids[item.id] = item_id
+                self._canvas_ids[item_id] = item.id
+            elif self._canvas_ids.get(item_id) is item:
+                # Not on the canvas: forget it, the redraw below creates it again
+                del self._canvas_ids[item_id]
+                del self._materialized[bisect.bisect_left(self._materialized, item_id)]
+        if batch.errors:
+            for command, message in batch.errors:
+                logging.error(f'Canvas command {command} failed: {message}')
+            # Some commands of the batch did not run: show the document again
+            if self._redraw_job is None:
+                self._redraw_job = self.drawing_area.after_idle(self._redraw_after_error)
+
+    def _redraw_after_error(self):
+        self._redraw_job = None
+        self.redraw()
+
+    def _is_live(self, item_id):
+        layer = self.document.active_layer
+        return layer.visible and self.document.get(item_id).layer == layer.id
+
+    def canvas_id(self, item_id):
+        return self._canvas_ids.get(item_id)
+
+    def document_id(self, canvas_id):
+        return self._document_ids.get(canvas_id)
+
+    def find_overlapping(self, x1, y1, x2, y2):
+        """
+        Items of the active layer whose bounding box intersects the rectangle, in
+        document coordinates. Replaces Canvas.find_overlapping, which scans every item.
+        Locked and hidden layers can not be edited, so nothing is found in them.
+
+        :return: list of document ids, bottom first
+        """
+        layer = self.document.active_layer
+        if layer.locked or not layer.visible:
+            return []
+        return self.document.find_overlapping(x1, y1, x2, y2, layers=(layer.id,))
+
+    def find_items_at(self, x, y, halo=3):
+        """
+        Items of the active layer under the point (x, y) given in document coordinates.
+
+        :return: list of document ids, bottom first
+        """
+        layer = self.document.active_layer
+        if layer.locked or not layer.visible:
+            return []
+        return self.document.find_at(x, y, halo, layers=(layer.id,))
+
     def start_drawing(self, event):
+        if self.recorder is not None:
+            self._record(PRESS, event)
+        layer = self.document.active_layer
+        if layer.locked or not layer.visible:
+            self.update_mouse_position(event)
+            return
+        if self._gesture_open:
+            # The release of the previous gesture was lost
+            self.history.commit()
+        self.history.begin()
+        self._gesture_open = True
         if hasattr(self.tool, 'start'):
             self.tool.start(event)
+        self.flush_raster()
         self.update_mouse_position(event)
 
     def update_drawing(self, event):
-        if hasattr(self.tool, 'update'):
-            self.tool.update(event)
+        """
+        Tools that need every point of the gesture receive it in sample();
+        update() is only called with the latest event once per frame.
+        """
+        if self.recorder is not None:
+            self._record(MOTION, event)
+        if hasattr(self.tool, 'sample'):
+            self.tool.sample(event)
+        self._preview_motion.push(event)
         self.update_mouse_position(event)
 
     def finish_drawing(self, event):
+        if self.recorder is not None:
+            self._record(RELEASE, event)
+        self._preview_motion.flush()
         if hasattr(self.tool, 'finish'):
             self.tool.finish(event)
+        if self._gesture_open:
+            self._gesture_open = False
+            self.history.commit()
+        self._journal_pixels()
+        self.flush_raster()
         self.update_mouse_position(event)
 
     @classmethod
@@ -37,7 +37,7 @@ import logging
 from tkinter import *
 from tkinter import ttk
 
-from .Dialogs import PageSizeDialog
+from .DrawingArea import DrawingArea
 
 
 class PageSize:
@@ -58,4 +58,56 @@ class PageSize:
                           "file menu. Attribute 'menu' not found in self.parent.")
 
     def show_dialog_for_page_size(self, event=None):
+        from .Dialogs import PageSizeDialog
+
         PageSizeDialog(self.root)
+
+
+class Layers:
+
+    def __init__(self, parent):
+
+        self.parent = parent
+        self.root = parent.root
+        self.add_option_to_menu()
+
+    def add_option_to_menu(self):
+        if hasattr(self.parent, 'menus') and 'edit' in self.parent.menus:
+            self.parent.menus['edit'].add_command(label='Layers', command=self.show_dialog_for_layers)
+
+        else:
+            logging.error("It was not possible to add the Layers function to the "
+                          "edit menu. Attribute 'menu' not found in self.parent.")
+
+    def show_dialog_for_layers(self, event=None):
+        from .Dialogs import LayersDialog
+
+        LayersDialog(self.root)
+
+
+class UndoRedo:
+
+    def __init__(self, parent):
+
+        self.parent = parent
+        self.root = parent.root
+        self.add_option_to_menu()
+        self.root.bind('<Control-z>', self.undo)
+        self.root.bind('<Control-y>', self.redo)
+        self.root.bind('<Control-Z>', self.redo)
+
+    def add_option_to_menu(self):
+        if hasattr(self.parent, 'menus') and 'edit' in self.parent.menus:
+            self.parent.menus['edit'].insert_command(0, label='Undo', accelerator='Ctrl+Z', command=self.undo)
+            self.parent.menus['edit'].insert_command(1, label='Redo', accelerator='Ctrl+Y', command=self.redo)
+            self.parent.menus['edit'].insert_separator(2)
+
+        else:
+            logging.error("It was not possible to add the Undo/Redo functions to the "
+                          "edit menu. Attribute 'menu' not found in self.parent.")
+
+    def undo(self, event=None):
+        DrawingArea.get_instance_of_drawing_area().undo()
+
+    def redo(self, event=None):
+        DrawingArea.get_instance_of_drawing_area().redo()
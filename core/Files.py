@@ -33,14 +33,16 @@
 """
 
 import logging
+import os
 
 from tkinter import *
 from tkinter import ttk
-from tkinter import filedialog
 from tkinter import messagebox
 
-from .Dialogs import LoadingDialog
-from lib.SaveImage import SaveImage
+from .DrawingArea import DrawingArea
+
+# The dialogs, exporters and file formats are imported by the menu actions
+# that use them, so that they do not delay the first window (see --profile-startup)
 
 
 class SalveAs:
@@ -55,10 +57,12 @@ class SalveAs:
         # Events triggered when the image is saved or an error occurs when saving
         self.root.bind('<<SavedFile>>', self.notify_that_the_file_has_been_saved)
         self.root.bind('<<ErrorSavingFile>>', self.warn_that_there_was_an_error_saving_the_image)
+        self.root.bind('<<SaveCancelled>>', self.close_loading_dialog)
 
     def add_option_to_menu(self):
         if hasattr(self.parent, 'menus') and 'file' in self.parent.menus:
             self.parent.menus['file'].add_command(label='Salve as...', command=self.save_vector_as_image)
+            self.parent.menus['file'].add_command(label='Export as SVG...', command=self.save_vector_as_svg)
 
         else:
             logging.error("It was not possible to add the SalveAs function to the "
@@ -70,17 +74,280 @@ class SalveAs:
 
         :return: None
         """
-        path = filedialog.asksaveasfilename(defaultextension='.png', parent=self.root)
-        t = SaveImage('nome', self.root)
+        from tkinter import filedialog
+        from .Dialogs import LoadingDialog
+        from lib.SaveImage import SaveImage
+
+        path = filedialog.asksaveasfilename(defaultextension='.png', parent=self.root,
+                                            filetypes=[('PNG image', '*.png')])
+        if not path:
+            return
+        drawing_area = DrawingArea.get_instance_of_drawing_area()
+        raster = drawing_area.raster.copy() if drawing_area.raster is not None else None
+        # The drawing can be edited while the thread renders the copy
+        t = SaveImage(path, self.root, drawing_area.document.snapshot(), raster=raster)
+        t.start()
+        self.loading_dialog = LoadingDialog(self.root, task=t)
+
+    def save_vector_as_svg(self):
+        """
+        Gets the current drawing and saves it as an SVG file.
+
+        :return: None
+        """
+        from tkinter import filedialog
+        from .Dialogs import LoadingDialog
+        from lib.SaveImage import SaveSVG
+
+        path = filedialog.asksaveasfilename(defaultextension='.svg', parent=self.root,
+                                            filetypes=[('SVG image', '*.svg')])
+        if not path:
+            return
+        drawing_area = DrawingArea.get_instance_of_drawing_area()
+        raster = drawing_area.raster.copy() if drawing_area.raster is not None else None
+        t = SaveSVG(path, self.root, drawing_area.document.snapshot(), raster=raster)
         t.start()
-        self.loading_dialog = LoadingDialog(self.root)
+        self.loading_dialog = LoadingDialog(self.root, task=t)
+
+    def close_loading_dialog(self, event=None):
+        if self.loading_dialog is not None:
+            self.loading_dialog.grab_release()
+            self.loading_dialog.destroy()
+            self.loading_dialog = None
 
     def notify_that_the_file_has_been_saved(self, event=None):
-        self.loading_dialog.grab_release()
-        self.loading_dialog.destroy()
+        self.close_loading_dialog()
         messagebox.showinfo(title='Salvo!', message='Imagem salva com sucesso!')
 
     def warn_that_there_was_an_error_saving_the_image(self, event=None):
-        self.loading_dialog.grab_release()
-        self.loading_dialog.destroy()
+        self.close_loading_dialog()
         messagebox.showerror(title='Error', message='Ocorreu um erro ao salvar a imagem.')
+
+
+class Export:
+    """
+    File > Export...: writes every output in presets from one snapshot of the
+    drawing, in parallel (see lib.SaveImage.ExportPipeline).
+    """
+
+    # (suffix added to the chosen name, format, scale, longest side in pixels)
+    presets = [
+        ('', 'png', 1.0, None),
+        ('@2x', 'png', 2.0, None),
+        ('_thumb', 'png', 1.0, 256),
+        ('', 'svg', 1.0, None),
+    ]
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.root = parent.root
+        self.loading_dialog = None
+        self.pipeline = None
+        self.saved = []
+        self.failed = []
+        self.add_option_to_menu()
+
+        self.root.bind('<<ExportedFile>>', self.collect_results)
+        self.root.bind('<<ErrorExportingFile>>', self.collect_results)
+        self.root.bind('<<ExportFinished>>', self.notify_that_the_export_has_finished)
+
+    def add_option_to_menu(self):
+        if hasattr(self.parent, 'menus') and 'file' in self.parent.menus:
+            self.parent.menus['file'].add_command(label='Export...', command=self.export)
+        else:
+            logging.error("It was not possible to add the Export function to the "
+                          "file menu. Attribute 'menu' not found in self.parent.")
+
+    def targets(self, path):
+        """
+        Output files for the name chosen by the user.
+
+        :return: list of ExportTarget
+        """
+        from lib.SaveImage import ExportTarget
+
+        base, _ = os.path.splitext(path)
+        return [ExportTarget(f'{base}{suffix}.{format_}', format_, scale, max_size)
+                for suffix, format_, scale, max_size in self.presets]
+
+    def export(self):
+        from tkinter import filedialog
+        from .Dialogs import LoadingDialog
+        from lib.SaveImage import ExportPipeline
+
+        path = filedialog.asksaveasfilename(parent=self.root, title='Export')
+        if not path:
+            return
+        drawing_area = DrawingArea.get_instance_of_drawing_area()
+        raster = drawing_area.raster.copy() if drawing_area.raster is not None else None
+        self.saved.clear()
+        self.failed.clear()
+        self.pipeline = ExportPipeline(self.targets(path), self.root, drawing_area.document.snapshot(), raster)
+        self.pipeline.start()
+        self.loading_dialog = LoadingDialog(self.root, task=self.pipeline)
+
+    def collect_results(self, event=None):
+        if self.pipeline is None:
+            return
+        while not self.pipeline.results.empty():
+            target, size, seconds, error = self.pipeline.results.get()
+            if error is None:
+                self.saved.append(target.path)
+            else:
+                self.failed.append(f'{target.path}: {error}')
+
+    def notify_that_the_export_has_finished(self, event=None):
+        self.collect_results()
+        if self.pipeline is not None and self.pipeline.error is not None:
+            # The targets the pool did not report were not written either
+            error = self.pipeline.error
+            self.failed.append(str(error) or type(error).__name__)
+        self.pipeline = None
+        if self.loading_dialog is not None:
+            self.loading_dialog.grab_release()
+            self.loading_dialog.destroy()
+            self.loading_dialog = None
+        if self.failed:
+            messagebox.showerror(title='Error', message='Não foi possível exportar:\n' + '\n'.join(self.failed))
+        else:
+            messagebox.showinfo(title='Exportado!', message=f'{len(self.saved)} arquivos exportados.')
+
+
+class DrawingFile:
+    """
+    Open and save drawings in the native .desenhando format.
+    """
+
+    filetypes = [('Desenhando drawing', '*.desenhando')]
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.root = parent.root
+        self.path = None
+        # Where the parts of the drawing are in the file at path, for incremental saves
+        self.layout = None
+        self.add_option_to_menu()
+        self.root.bind('<Control-o>', self.open)
+        self.root.bind('<Control-s>', self.save)
+
+    def add_option_to_menu(self):
+        if hasattr(self.parent, 'menus') and 'file' in self.parent.menus:
+            menu = self.parent.menus['file']
+            menu.insert_command(0, label='Open...', accelerator='Ctrl+O', command=self.open)
+            menu.insert_command(1, label='Save', accelerator='Ctrl+S', command=self.save)
+            menu.insert_command(2, label='Save drawing as...', command=self.save_as)
+            menu.insert_separator(3)
+        else:
+            logging.error("It was not possible to add the Open/Save functions to the "
+                          "file menu. Attribute 'menu' not found in self.parent.")
+
+    def open(self, event=None):
+        from tkinter import filedialog
+        from lib.drawing_file import FormatError, open_drawing_file
+
+        path = filedialog.askopenfilename(parent=self.root, filetypes=self.filetypes)
+        if not path:
+            return
+        try:
+            document, raster, layout = open_drawing_file(path)
+        except (OSError, FormatError) as error:
+            logging.error(f'Error opening {path}: {error}')
+            messagebox.showerror(title='Error', message='Não foi possível abrir o desenho.')
+            return
+        drawing_area = DrawingArea.get_instance_of_drawing_area()
+        drawing_area.load_document(document, raster, path)
+        layout.track_raster(drawing_area.raster)
+        self.path = path
+        self.layout = layout
+
+    def save(self, event=None):
+        if self.path is None:
+            self.save_as()
+        else:
+            self.write(self.path)
+
+    def save_as(self, event=None):
+        from tkinter import filedialog
+        from lib.drawing_file import EXTENSION
+
+        path = filedialog.asksaveasfilename(defaultextension=EXTENSION, parent=self.root,
+                                            filetypes=self.filetypes)
+        if path and self.write(path):
+            self.path = path
+
+    def write(self, path):
+        from lib.drawing_file import save_changes
+
+        drawing_area = DrawingArea.get_instance_of_drawing_area()
+        try:
+            self.layout = save_changes(drawing_area.document, path, drawing_area.raster, self.layout)
+        except OSError as error:
+            # The file may no longer match the layout: the next save writes it again
+            self.layout = None
+            logging.error(f'Error saving {path}: {error}')
+            messagebox.showerror(title='Error', message='Ocorreu um erro ao salvar o desenho.')
+            return False
+        # The saved file is the new starting point of the autosave journal
+        drawing_area.restart_journal(path)
+        return True
+
+
+class ImportImage:
+    """
+    Import a large image (a scan, a photo) as the reference shown below the drawing.
+    """
+
+    filetypes = [('Images', '*.png *.gif *.ppm *.pgm'), ('All files', '*')]
+
+    def __init__(self, parent):
+        self.parent = parent
+        self.root = parent.root
+        self.builder = None
+        self.loading_dialog = None
+        self.add_option_to_menu()
+
+        self.root.bind('<<ImageImported>>', self.show_image)
+        self.root.bind('<<ErrorImportingImage>>', self.warn_that_there_was_an_error_importing_the_image)
+        self.root.bind('<<ImportCancelled>>', self.close_loading_dialog)
+
+    def add_option_to_menu(self):
+        if hasattr(self.parent, 'menus') and 'file' in self.parent.menus:
+            self.parent.menus['file'].add_command(label='Import image...', command=self.import_image)
+        else:
+            logging.error("It was not possible to add the Import image function to the "
+                          "file menu. Attribute 'menu' not found in self.parent.")
+
+    def import_image(self):
+        from tkinter import filedialog
+        from .Dialogs import LoadingDialog
+        from .ReferenceImage import PyramidBuilder
+
+        path = filedialog.askopenfilename(parent=self.root, title='Import image', filetypes=self.filetypes)
+        if not path:
+            return
+        try:
+            self.builder = PyramidBuilder(path, self.root)
+        except OSError as error:
+            logging.error(f'Error importing {path}: {error}')
+            messagebox.showerror(title='Error', message='Não foi possível importar a imagem.')
+            return
+        self.loading_dialog = LoadingDialog(self.root, task=self.builder)
+        self.builder.start()
+
+    def close_loading_dialog(self, event=None):
+        if self.loading_dialog is not None:
+            self.loading_dialog.grab_release()
+            self.loading_dialog.destroy()
+            self.loading_dialog = None
+
+    def show_image(self, event=None):
+        self.close_loading_dialog()
+        if self.builder is not None:
+            DrawingArea.get_instance_of_drawing_area().set_reference_image(self.builder.pyramid)
+            self.builder = None
+
+    def warn_that_there_was_an_error_importing_the_image(self, event=None):
+        self.close_loading_dialog()
+        logging.error(f'Error importing {self.builder.path}: {self.builder.error}')
+        self.builder = None
+        messagebox.showerror(title='Error', message='Não foi possível importar a imagem.')
@@ -36,8 +36,9 @@ import logging
 
 from tkinter import *
 from tkinter import ttk
+from tkinter import messagebox
 
-from .AboutDialog import AboutDialog
+from .DrawingArea import DrawingArea
 
 
 class About:
@@ -62,4 +63,114 @@ class About:
 
         :return: None
         """
+        from .AboutDialog import AboutDialog
+
         window = AboutDialog(self.root)
+
+
+class Diagnostics:
+    """
+    Measure the event handlers of the drawing area and save what was measured
+    as a Chrome Trace Event file (see DrawingArea.start_profiling); record
+    input sessions and replay them (see lib.session).
+    """
+
+    def __init__(self, parent):
+
+        self.parent = parent
+        self.root = parent.root
+        self.profiling = BooleanVar(master=self.root, value=False)
+        self.recording = BooleanVar(master=self.root, value=False)
+        self.replayer = None
+        self.add_option_to_menu()
+
+    def add_option_to_menu(self):
+        if hasattr(self.parent, 'menus') and 'help' in self.parent.menus:
+            menu = self.parent.menus['help']
+            menu.add_separator()
+            menu.add_checkbutton(label='Profile events', variable=self.profiling, command=self.toggle_profiling)
+            menu.add_command(label='Save event trace...', command=self.save_trace)
+            menu.add_checkbutton(label='Record input session...', variable=self.recording,
+                                 command=self.toggle_recording)
+            menu.add_command(label='Replay input session...', command=self.replay_session)
+
+        else:
+            logging.error("It was not possible to add the Diagnostics functions to the "
+                          "help menu. Attribute 'menu' not found in self.parent.")
+
+    def toggle_profiling(self):
+        drawing_area = DrawingArea.get_instance_of_drawing_area()
+        if self.profiling.get():
+            drawing_area.start_profiling()
+        else:
+            drawing_area.stop_profiling()
+
+    def save_trace(self):
+        from tkinter import filedialog
+
+        profiler = DrawingArea.get_instance_of_drawing_area().profiler
+        if profiler is None:
+            messagebox.showinfo(title='Desenhando', message='Ative "Profile events" antes de salvar o trace.')
+            return
+        path = filedialog.asksaveasfilename(defaultextension='.json', parent=self.root, title='Save event trace',
+                                            filetypes=[('Chrome trace', '*.json')])
+        if not path:
+            return
+        try:
+            profiler.dump_trace(path)
+        except OSError as error:
+            logging.error(f'Error saving {path}: {error}')
+            messagebox.showerror(title='Error', message='Ocorreu um erro ao salvar o trace.')
+
+    def toggle_recording(self):
+        from tkinter import filedialog
+
+        drawing_area = DrawingArea.get_instance_of_drawing_area()
+        if not self.recording.get():
+            drawing_area.stop_recording()
+            return
+        path = filedialog.asksaveasfilename(defaultextension='.session', parent=self.root,
+                                            title='Record input session', filetypes=[('Input session', '*.session')])
+        if not path:
+            self.recording.set(False)
+            return
+        try:
+            drawing_area.start_recording(path)
+        except OSError as error:
+            logging.error(f'Error creating {path}: {error}')
+            self.recording.set(False)
+            messagebox.showerror(title='Error', message='Não foi possível gravar a sessão.')
+
+    def replay_session(self, path=None, speed=1.0, on_finish=None):
+        """
+        Replay a recorded input session on the current drawing.
+
+        :param path: session file (default: ask the user)
+        :param speed: 1.0 for real time, None for as fast as possible
+        :param on_finish: function(replayer) called at the end (default: show a summary)
+        :return: None
+        """
+        from lib.session import FormatError, Replayer, read_session
+
+        if path is None:
+            from tkinter import filedialog
+            path = filedialog.askopenfilename(parent=self.root, title='Replay input session',
+                                              filetypes=[('Input session', '*.session')])
+            if not path:
+                return
+        try:
+            info, events = read_session(path)
+        except (OSError, ValueError, FormatError) as error:
+            logging.error(f'Error reading {path}: {error}')
+            messagebox.showerror(title='Error', message='Não foi possível abrir a sessão.')
+            return
+        if self.replayer is not None:
+            self.replayer.cancel()
+        self.replayer = Replayer(DrawingArea.get_instance_of_drawing_area(), events, speed,
+                                 on_finish or self.notify_that_the_replay_has_finished)
+        self.replayer.start()
+
+    def notify_that_the_replay_has_finished(self, replayer):
+        self.replayer = None
+        messagebox.showinfo(title='Desenhando', message=f'{replayer.replayed} eventos reproduzidos '
+                                                        f'em {replayer.seconds:.2f} s.')
@@ -0,0 +1,358 @@
+"""
++----------------------------------------------------------------------------------------+
+|                                 This file is part of:                                  |
+|                                      DESENHANDO                                        |
+|                                 www.github.com/...                                     |
++----------------------------------------------------------------------------------------+
+|     Copyright (c) 2021 João Vitor, ...                                                 |
+|                                                                                        |
+|     Permission is hereby granted, free of charge, to any person obtaining a copy       |
+|     of this software and associated documentation files (the "Software"), to deal      |
+|     in the Software without restriction, including without limitation the rights       |
+|     to use, copy, modify, merge, publish, distribute, sublicense, and/or sell          |
+|     copies of the Software, and to permit persons to whom the Software is              |
+|     furnished to do so, subject to the following conditions:                           |
+|                                                                                        |
+|     The above copyright notice and this permission notice shall be included in         |
+|     all copies or substantial portions of the Software.                                |
+|                                                                                        |
+|     THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR         |
+|     IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,           |
+|     FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE        |
+|     AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER             |
+|     LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,      |
+|     OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN          |
+|     THE SOFTWARE.                                                                      |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+|                                         ABSTRACT                                       |
++----------------------------------------------------------------------------------------+
+| Layer stack of the drawing area and the cached tiles of its inactive layers.           |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+"""
+
+import base64
+import math
+
+from tkinter import *
+
+
+class PhotoLayer:
+    """
+    Shows a RasterLayer on the canvas through a single PhotoImage. Only the
+    dirty rectangles of the layer are uploaded, each one as a small PNG put
+    on its own sub-region of the image.
+    """
+
+    def __init__(self, canvas, tag):
+        """
+        :param canvas: tkinter Canvas
+        :param tag: canvas tag of the image item, also used to stack it
+        """
+        self.canvas = canvas
+        self.tag = tag
+        self.source = None
+        self.photo = PhotoImage(master=canvas)
+        canvas.create_image(0, 0, image=self.photo, anchor=NW, tags=(tag,))
+
+    def show(self, source, zoom):
+        """
+        Display another RasterLayer, or nothing when source is None.
+
+        :return: None
+        """
+        self.source = source
+        self.reset(zoom)
+
+    def reset(self, zoom):
+        """
+        Resize the image for the zoom and upload the whole layer again.
+
+        :return: None
+        """
+        self.photo.blank()
+        if self.source is None:
+            self.photo.configure(width=1, height=1)
+            return
+        self.photo.configure(width=math.ceil(self.source.width * zoom),
+                             height=math.ceil(self.source.height * zoom))
+        self.source.invalidate()
+        self.flush(zoom)
+
+    def flush(self, zoom):
+        """
+        Upload the dirty rectangles of the source layer.
+
+        :return: None
+        """
+        if self.source is None:
+            return
+        # NumPy is only loaded once there are pixels to show
+        from lib.png import encode_png
+
+        width = int(self.photo.width())
+        height = int(self.photo.height())
+        for x1, y1, x2, y2 in self.source.take_dirty():
+            vx1, vy1 = int(x1 * zoom), int(y1 * zoom)
+            vx2, vy2 = min(width, math.ceil(x2 * zoom)), min(height, math.ceil(y2 * zoom))
+            if vx1 >= vx2 or vy1 >= vy2:
+                continue
+            data = base64.b64encode(encode_png(self.source.region(vx1, vy1, vx2, vy2, zoom)))
+            self.canvas.tk.call(self.photo, 'put', data.decode('ascii'), '-format', 'png', '-to', vx1, vy1)
+
+
+class TiledLayers:
+    """
+    Shows some layers flattened into one picture, as tiles of tile_size
+    screen pixels rendered at the current zoom. Only the tiles meeting the
+    region around the view are rasterized, so the cost of a zoom or of a
+    change of the layers depends on the window, not on the page. Tiles that
+    left the view stay cached until the cache passes max_pixels.
+    """
+
+    tile_size = 512
+    max_pixels = 32 * 2 ** 20
+
+    def __init__(self, canvas, tag):
+        """
+        :param canvas: tkinter Canvas
+        :param tag: canvas tag of the tiles, also used to stack them
+        """
+        from lib.pyramid import LRUCache
+
+        self.canvas = canvas
+        self.tag = tag
+        # Empty image item marking the place of the tiles in the stacking order
+        self.anchor = canvas.create_image(0, 0, anchor=NW, tags=(tag,))
+        self.document = None
+        self.layers = ()
+        self.key = None
+        self.photos = LRUCache(self.max_pixels)
+        # (row, column) -> (canvas item, PhotoImage) of the tiles on the canvas
+        self.items = {}
+        self._zoom = None
+
+    def show(self, document, layers, key):
+        """
+        Display other layers, or the same ones after they changed.
+
+        :param layers: Layer objects, from the bottom to the top
+        :param key: hashable value that changes whenever their pixels do
+        :return: None
+        """
+        self.document = document
+        self.layers = [layer for layer in layers if layer.visible and layer.opacity > 0]
+        self.key = key
+        self._clear_items()
+
+    def update(self, region, zoom):
+        """
+        Show the tiles intersecting a page region at zoom.
+
+        :param region: (x1, y1, x2, y2) in page pixels
+        :param zoom: view scale
+        :return: None
+        """
+        if zoom != self._zoom:
+            self._clear_items()
+            self._zoom = zoom
+        if not self.layers:
+            return
+        size = self.tile_size
+        x1, y1, x2, y2 = region
+        columns = math.ceil(self.document.width * zoom / size)
+        rows = math.ceil(self.document.height * zoom / size)
+        wanted = {(row, column)
+                  for row in range(max(0, int(y1 * zoom // size)), min(rows, int(y2 * zoom // size) + 1))
+                  for column in range(max(0, int(x1 * zoom // size)), min(columns, int(x2 * zoom // size) + 1))}
+        for key in [key for key in self.items if key not in wanted]:
+            self.canvas.delete(self.items.pop(key)[0])
+        for row, column in sorted(wanted - self.items.keys()):
+            photo = self._photo(row, column, zoom)
+            item = self.canvas.create_image(column * size, row * size, image=photo, anchor=NW, tags=(self.tag,))
+            self.canvas.tag_lower(item, self.anchor)
+            self.items[row, column] = item, photo
+
+    def _photo(self, row, column, zoom):
+        """
+        PhotoImage of a tile, read from the cache or rendered with lib.rasterizer.
+        """
+        cache_key = (self.key, zoom, row, column)
+        photo = self.photos.get(cache_key)
+        if photo is not None:
+            return photo
+        # NumPy is only loaded once there are pixels to show
+        from lib.png import encode_png
+        from lib.raster import RasterLayer
+        from lib.rasterizer import draw_layers
+
+        size = self.tile_size
+        x1, y1 = column * size, row * size
+        target = RasterLayer(min(size, math.ceil(self.document.width * zoom) - x1),
+                             min(size, math.ceil(self.document.height * zoom) - y1))
+        draw_layers(self.document, self.layers, target, zoom, (x1 / zoom, y1 / zoom))
+        photo = PhotoImage(master=self.canvas, width=target.width, height=target.height)
+        if target.pixels[..., 3].any():
+            data = base64.b64encode(encode_png(target.pixels))
+            self.canvas.tk.call(photo, 'put', data.decode('ascii'), '-format', 'png')
+        self.photos.put(cache_key, photo, target.width * target.height)
+        return photo
+
+    def _clear_items(self):
+        for item, photo in self.items.values():
+            self.canvas.delete(item)
+        self.items.clear()
+
+    def clear(self):
+        """
+        Forget the tiles, eg. when another document is shown.
+
+        :return: None
+        """
+        self._clear_items()
+        self.photos.clear()
+        self.document = None
+        self.layers = ()
+        self.key = None
+
+
+class LayerStack:
+    """
+    Layer operations of the drawing area.
+
+    Tk only holds the items of the active layer. The visible layers below
+    and above it are shown flattened, as two sets of cached tiles (see
+    TiledLayers), each one rendered again only when one of the layers it
+    covers changes.
+    """
+
+    def __init__(self, drawing_area):
+        """
+        :param drawing_area: DrawingArea instance
+        """
+        self.drawing_area = drawing_area
+        canvas = drawing_area.drawing_area
+        self.below = TiledLayers(canvas, 'layers_below')
+        canvas.tag_lower('layers_below')
+        self.above = TiledLayers(canvas, 'layers_above')
+        # Page region around the view, see update_view
+        self._region = None
+
+    @property
+    def document(self):
+        return self.drawing_area.document
+
+    @property
+    def active(self):
+        return self.document.active_layer
+
+    def add(self, name=None):
+        """
+        Create a layer right above the active one and make it active.
+
+        :return: Layer
+        """
+        document = self.document
+        layer = document.add_layer(name, document.layer_position(self.active.id) + 1)
+        self.activate(layer.id)
+        return layer
+
+    def remove(self, layer_id):
+        """
+        Delete a layer and its items as a single undo step. The items go
+        through DrawingArea.delete_item, so the history, the spatial index
+        and the canvas all see them leave.
+
+        :return: None
+        """
+        document = self.document
+        if len(document.layers) == 1:
+            raise ValueError('a document needs at least one layer')
+        drawing_area = self.drawing_area
+        active = self.active
+        drawing_area.history.begin()
+        with drawing_area.batched():
+            for item_id in document.layer_ids(layer_id):
+                drawing_area.delete_item(item_id)
+        drawing_area.history.layer_removed(document.get_layer(layer_id), document.layer_position(layer_id))
+        document.remove_layer(layer_id)
+        drawing_area.history.commit()
+        self.refresh(redraw=layer_id == active.id)
+
+    def restore(self, layer_id, name, position, **options):
+        """
+        Put back a removed layer, empty, with its old id, eg. when undoing its removal.
+
+        :param options: visible, locked and opacity
+        :return: Layer
+        """
+        layer = self.document.add_layer(name, position, layer_id)
+        self.document.configure_layer(layer_id, **options)
+        self.refresh()
+        return layer
+
+    def move(self, layer_id, position):
+        self.document.move_layer(layer_id, position)
+        self.refresh()
+
+    def activate(self, layer_id):
+        self.document.set_active_layer(layer_id)
+        self.refresh(redraw=True)
+
+    def set_visible(self, layer_id, visible):
+        self.document.configure_layer(layer_id, visible=visible)
+        self.refresh(redraw=layer_id == self.active.id)
+
+    def set_locked(self, layer_id, locked):
+        self.document.configure_layer(layer_id, locked=locked)
+        self.drawing_area.journal_layers()
+
+    def set_opacity(self, layer_id, opacity):
+        self.document.configure_layer(layer_id, opacity=max(0.0, min(1.0, float(opacity))))
+        self.refresh()
+
+    def refresh(self, redraw=False):
+        """
+        Render again the flattened tiles whose layers changed and, if asked,
+        recreate the items of the active layer. Nothing is rasterized before
+        the view is known, nor outside of it.
+
+        :param redraw: the active layer changed
+        :return: None
+        """
+        document = self.document
+        position = document.layer_position(self.active.id)
+        for cache, layers in ((self.below, document.layers[:position]), (self.above, document.layers[position + 1:])):
+            key = (document.width, document.height,
+                   tuple((layer.id, layer.revision, layer.visible, layer.opacity) for layer in layers))
+            if key == cache.key:
+                continue
+            cache.show(document, layers, key)
+            if self._region is not None:
+                cache.update(self._region, self.drawing_area.zoom)
+        if redraw:
+            self.drawing_area.redraw()
+        self.drawing_area.journal_layers()
+
+    def update_view(self, region):
+        """
+        Show the tiles around the view, eg. after a scroll or a zoom.
+
+        :param region: (x1, y1, x2, y2) in page pixels
+        :return: None
+        """
+        self._region = region
+        zoom = self.drawing_area.zoom
+        self.below.update(region, zoom)
+        self.above.update(region, zoom)
+
+    def reset(self):
+        """
+        Forget the cached tiles, eg. when another document is shown.
+
+        :return: None
+        """
+        self.below.clear()
+        self.above.clear()
+        self._region = None
@@ -0,0 +1,296 @@
+"""
++----------------------------------------------------------------------------------------+
+|                                 This file is part of:                                  |
+|                                      DESENHANDO                                        |
+|                                 www.github.com/...                                     |
++----------------------------------------------------------------------------------------+
+|     Copyright (c) 2021 João Vitor, ...                                                 |
+|                                                                                        |
+|     Permission is hereby granted, free of charge, to any person obtaining a copy       |
+|     of this software and associated documentation files (the "Software"), to deal      |
+|     in the Software without restriction, including without limitation the rights       |
+|     to use, copy, modify, merge, publish, distribute, sublicense, and/or sell          |
+|     copies of the Software, and to permit persons to whom the Software is              |
+|     furnished to do so, subject to the following conditions:                           |
+|                                                                                        |
+|     The above copyright notice and this permission notice shall be included in         |
+|     all copies or substantial portions of the Software.                                |
+|                                                                                        |
+|     THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR         |
+|     IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,           |
+|     FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE        |
+|     AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER             |
+|     LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,      |
+|     OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN          |
+|     THE SOFTWARE.                                                                      |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+|                                         ABSTRACT                                       |
++----------------------------------------------------------------------------------------+
+| Large reference images shown below the drawing from a tiled pyramid cached on disk.    |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+"""
+
+import base64
+import logging
+import os
+
+import numpy as np
+from tkinter import *
+
+from lib.png import PNGReader, decode_png, encode_png
+from lib.pyramid import LRUCache, Pyramid, cache_directory
+from lib.raster import halve, resample
+
+
+class PyramidBuilder:
+    """
+    Cuts an image into the tiles of its pyramid (see lib.pyramid), a few
+    tiles on every turn of the event loop, so the window keeps responding.
+
+    PNG files are read one row of tiles at a time with lib.png.PNGReader.
+    Other formats are decoded by Tk, and the decoded image is released once
+    the full resolution tiles are written. Every tile of a coarser level is
+    the 2 x 2 average of the four tiles below it (lib.raster.halve), read
+    back from the cache, so no level skips pixels and nothing larger than a
+    band of tiles is held in memory.
+
+    When the cache already holds a complete pyramid of the image nothing is
+    decoded. Generates <<ImageImported>>, <<ErrorImportingImage>> or
+    <<ImportCancelled>> on object_.
+    """
+
+    tiles_per_step = 8
+
+    def __init__(self, path, object_, cache_root=None):
+        """
+        :param path: image file (any format Tk reads: PNG, GIF, PPM)
+        :param object_: widget that receives the events
+        :param cache_root: directory of the tile caches (default: ~/.desenhando/tiles)
+        """
+        self.path = path
+        self.object = object_
+        self.directory = cache_directory(path, cache_root)
+        self.pyramid = None
+        self.error = None
+        self.progress = 0.0
+        self.bytes_written = 0
+        self.cancelled = False
+        self._reader = None
+        self._source = None
+        self._scratch = None
+        self._tiles = None
+        self._done = 0
+
+    def start(self):
+        self.pyramid = Pyramid.load(self.directory)
+        if self.pyramid is not None:
+            self.progress = 1.0
+            self.object.event_generate('<<ImageImported>>', when='tail')
+            return
+        # Let the progress window show up before the (blocking) decoding
+        self.object.after(50, self._decode)
+
+    def cancel(self):
+        self.cancelled = True
+
+    def _decode(self):
+        if self.cancelled:
+            self._finish('<<ImportCancelled>>')
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            width, height = self._open()
+        except (TclError, OSError, ValueError) as error:
+            self.error = error
+            self._finish('<<ErrorImportingImage>>')
+            return
+        self.pyramid = Pyramid(self.directory, width, height)
+        self._tiles = self._write_tiles()
+        self._total = self.pyramid.tile_count()
+        self.object.after_idle(self._step)
+
+    def _open(self):
+        """
+        Open the image with PNGReader when it can read it, with Tk otherwise.
+
+        :return: (width, height)
+        """
+        file = open(self.path, 'rb')
+        try:
+            self._reader = PNGReader(file)
+            return self._reader.width, self._reader.height
+        except ValueError:
+            file.close()
+        self._source = PhotoImage(master=self.object, file=self.path)
+        self._scratch = PhotoImage(master=self.object)
+        return self._source.width(), self._source.height()
+
+    def _step(self):
+        if self.cancelled:
+            self._finish('<<ImportCancelled>>')
+            return
+        try:
+            for _ in self._tiles:
+                self._done += 1
+                self.progress = self._done / self._total
+                if self._done % self.tiles_per_step == 0:
+                    self.object.after_idle(self._step)
+                    return
+            self.pyramid.save_info()
+        except (TclError, OSError, ValueError) as error:
+            self.error = error
+            self._finish('<<ErrorImportingImage>>')
+            return
+        self._finish('<<ImageImported>>')
+
+    def _write_tiles(self):
+        """
+        Write every tile, level by level, pausing after each one.
+
+        :return: generator
+        """
+        pyramid = self.pyramid
+        size = pyramid.tile_size
+        columns, rows = pyramid.grid(0)
+        for row in range(rows):
+            band = self._reader.read_rows(size) if self._reader is not None else None
+            for column in range(columns):
+                path = pyramid.tile_path(0, row, column)
+                if band is None:
+                    self._scratch.tk.call(self._scratch, 'copy', self._source, '-from',
+                                          *pyramid.source_rect(0, row, column), '-shrink')
+                    self._scratch.write(path, format='png')
+                    self.bytes_written += os.path.getsize(path)
+                else:
+                    self._save(path, band[:, column * size:(column + 1) * size])
+                yield
+        self._close_source()
+        for level in range(1, pyramid.levels):
+            columns, rows = pyramid.grid(level)
+            for row in range(rows):
+                for column in range(columns):
+                    self._save(pyramid.tile_path(level, row, column), halve(self._children(level, row, column)))
+                    yield
+
+    def _children(self, level, row, column):
+        """
+        The (up to) 2 x 2 tiles of the level below covered by a tile, joined.
+
+        :return: uint8 array (rows, columns, 4)
+        """
+        columns, rows = self.pyramid.grid(level - 1)
+        band = []
+        for child_row in range(2 * row, min(2 * row + 2, rows)):
+            band.append(np.hstack([self._read(level - 1, child_row, child_column)
+                                   for child_column in range(2 * column, min(2 * column + 2, columns))]))
+        return np.vstack(band)
+
+    def _read(self, level, row, column):
+        with open(self.pyramid.tile_path(level, row, column), 'rb') as file:
+            return decode_png(file.read())
+
+    def _save(self, path, pixels):
+        data = encode_png(pixels, level=6)
+        with open(path, 'wb') as file:
+            file.write(data)
+        self.bytes_written += len(data)
+
+    def _close_source(self):
+        if self._reader is not None:
+            self._reader.file.close()
+        self._reader = self._source = self._scratch = None
+
+    def _finish(self, event):
+        self._close_source()
+        self._tiles = None
+        self.object.event_generate(event, when='tail')
+
+
+class ReferenceImage:
+    """
+    Shows an image pyramid below everything else on the canvas. Only the
+    tiles of the level matching the zoom that intersect the region around
+    the view become PhotoImages. Tiles that left it stay cached until the
+    cache passes max_pixels, so memory depends on the window, not on the image.
+    """
+
+    tag = 'reference'
+    max_pixels = 24 * 2 ** 20
+
+    def __init__(self, canvas, pyramid):
+        """
+        :param canvas: tkinter Canvas
+        :param pyramid: lib.pyramid.Pyramid of a complete cache
+        """
+        self.canvas = canvas
+        self.pyramid = pyramid
+        self.photos = LRUCache(self.max_pixels)
+        # (level, row, column) -> (canvas item, PhotoImage) of the tiles on the canvas
+        self.items = {}
+        self._view = None
+
+    def update(self, region, zoom):
+        """
+        Show the tiles intersecting a page region at zoom.
+
+        :param region: (x1, y1, x2, y2) in page pixels
+        :param zoom: view scale
+        :return: None
+        """
+        pyramid = self.pyramid
+        level = pyramid.level_for(zoom)
+        if self._view != (level, zoom):
+            self.canvas.delete(self.tag)
+            self.items.clear()
+            self._view = level, zoom
+        wanted = {(level, row, column) for row, column in pyramid.visible_tiles(region, level)}
+        for key in [key for key in self.items if key not in wanted]:
+            self.canvas.delete(self.items.pop(key)[0])
+        for key in wanted:
+            if key in self.items:
+                continue
+            # Rounding both edges on the screen grid makes neighbour tiles meet exactly
+            x1, y1, x2, y2 = (round(c * zoom) for c in pyramid.source_rect(*key))
+            photo = self._photo(key, zoom * 2 ** level, x2 - x1, y2 - y1)
+            item = self.canvas.create_image(x1, y1, image=photo, anchor=NW, tags=(self.tag,))
+            self.canvas.tag_lower(item)
+            self.items[key] = item, photo
+
+    def _photo(self, key, ratio, width, height):
+        """
+        PhotoImage of a tile shown at width x height screen pixels, read from
+        the cache when needed. Tk only scales by integer factors without loss
+        (its -subsample skips pixels), so other ratios are resampled with
+        lib.raster.resample.
+
+        :param ratio: screen pixels per tile pixel
+        """
+        photo = self.photos.get((key, width, height))
+        if photo is not None:
+            return photo
+        path = self.pyramid.tile_path(*key)
+        try:
+            if ratio == int(ratio):
+                photo = PhotoImage(master=self.canvas, file=path)
+                if ratio != 1:
+                    scaled = PhotoImage(master=self.canvas)
+                    scaled.tk.call(scaled, 'copy', photo, '-zoom', int(ratio), int(ratio))
+                    photo = scaled
+            else:
+                with open(path, 'rb') as file:
+                    pixels = resample(decode_png(file.read()), max(1, width), max(1, height))
+                photo = PhotoImage(master=self.canvas, width=pixels.shape[1], height=pixels.shape[0])
+                photo.tk.call(photo, 'put', base64.b64encode(encode_png(pixels)).decode('ascii'), '-format', 'png')
+        except (TclError, OSError, ValueError) as error:
+            logging.error(f'Error reading tile {key}: {error}')
+            photo = PhotoImage(master=self.canvas)
+        self.photos.put((key, width, height), photo, photo.width() * photo.height())
+        return photo
+
+    def clear(self):
+        self.canvas.delete(self.tag)
+        self.items.clear()
+        self.photos.clear()
+        self._view = None
@@ -0,0 +1,347 @@
+"""
++----------------------------------------------------------------------------------------+
+|                                 This file is part of:                                  |
+|                                      DESENHANDO                                        |
+|                                 www.github.com/...                                     |
++----------------------------------------------------------------------------------------+
+|     Copyright (c) 2021 João Vitor, ...                                                 |
+|                                                                                        |
+|     Permission is hereby granted, free of charge, to any person obtaining a copy       |
+|     of this software and associated documentation files (the "Software"), to deal      |
+|     in the Software without restriction, including without limitation the rights       |
+|     to use, copy, modify, merge, publish, distribute, sublicense, and/or sell          |
+|     copies of the Software, and to permit persons to whom the Software is              |
+|     furnished to do so, subject to the following conditions:                           |
+|                                                                                        |
+|     The above copyright notice and this permission notice shall be included in         |
+|     all copies or substantial portions of the Software.                                |
+|                                                                                        |
+|     THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR         |
+|     IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,           |
+|     FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE        |
+|     AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER             |
+|     LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,      |
+|     OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN          |
+|     THE SOFTWARE.                                                                      |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+|                                         ABSTRACT                                       |
++----------------------------------------------------------------------------------------+
+| Tools used to draw and edit items of the drawing area.                                 |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+"""
+
+from lib.geometry import StrokeSimplifier, coords_bbox
+
+
+class Tool:
+    """
+    Base class of the drawing tools.
+
+    DrawingArea forwards the mouse events to start, update and finish. Tools
+    change the drawing only through the DrawingArea item methods, so that the
+    document and its spatial index stay in sync with the canvas.
+    """
+
+    def __init__(self, drawing_area):
+        """
+        :param drawing_area: DrawingArea instance the tool draws on
+        """
+        self.drawing_area = drawing_area
+        self.canvas = drawing_area.drawing_area
+
+    def position(self, event):
+        """
+        Position of the event on the page, in document coordinates.
+
+        :param event: tkinter mouse event
+        :return: (x, y)
+        """
+        return self.drawing_area.canvas_position(event)
+
+    def items_under(self, event, halo=3):
+        """
+        Document items under the mouse, looked up in the spatial index.
+        Used by the eraser, handle and cut-out tools for hit-testing.
+
+        :param event: tkinter mouse event
+        :param halo: tolerance in pixels around the mouse position
+        :return: list of document ids, bottom first
+        """
+        x, y = self.position(event)
+        return self.drawing_area.find_items_at(x, y, halo)
+
+    def items_inside(self, x1, y1, x2, y2):
+        """
+        Document items overlapping a rectangle in document coordinates.
+
+        :return: list of document ids, bottom first
+        """
+        return self.drawing_area.find_overlapping(x1, y1, x2, y2)
+
+    def replace_items(self, items, changes):
+        """
+        Apply the result of lib.clipping.cut as a single undo step. An item
+        whose first replacement has its kind keeps its id and its place in
+        the stacking order; the other replacements are added on top.
+
+        :param items: document items given to cut, in stacking order
+        :param changes: dict item id -> list of (kind, coords, options)
+        :return: None
+        """
+        if not changes:
+            return
+        drawing_area = self.drawing_area
+        drawing_area.history.begin()
+        with drawing_area.batched():
+            for item in items:
+                pieces = changes.get(item.id)
+                if pieces is None:
+                    continue
+                if pieces and pieces[0][0] == item.kind:
+                    kind, coords, options = pieces.pop(0)
+                    drawing_area.set_item_coords(item.id, coords)
+                    changed = {name: value for name, value in options.items() if item.options.get(name) != value}
+                    if changed:
+                        drawing_area.configure_item(item.id, **changed)
+                else:
+                    drawing_area.delete_item(item.id)
+                for kind, coords, options in pieces:
+                    drawing_area.create_item(kind, coords, **options)
+        drawing_area.history.commit()
+
+    def start(self, event):
+        pass
+
+    def sample(self, event):
+        """
+        Called for every motion event of the gesture. Must not touch the
+        canvas; redrawing belongs to update, which runs once per frame.
+        """
+        pass
+
+    def update(self, event):
+        pass
+
+    def finish(self, event):
+        pass
+
+
+class PencilTool(Tool):
+    """
+    Freehand drawing. Each stroke is a single canvas line that grows through
+    coords() while the points are thinned by a StrokeSimplifier.
+    """
+
+    fill = '#000000'
+    width = 2
+    tolerance = 0.75
+
+    def __init__(self, drawing_area):
+        super().__init__(drawing_area)
+        self._item = None
+        self._stroke = None
+        self._changed = False
+
+    def start(self, event):
+        x, y = self.position(event)
+        self._stroke = StrokeSimplifier(self.tolerance)
+        self._stroke.add(x, y)
+        self._item = self.drawing_area.create_item('line', [x, y, x, y], fill=self.fill, width=self.width,
+                                                   capstyle='round', joinstyle='round')
+
+    def sample(self, event):
+        if self._item is not None:
+            x, y = self.position(event)
+            self._changed = self._stroke.add(x, y) or self._changed
+
+    def update(self, event):
+        if self._item is not None and self._changed:
+            self._changed = False
+            self.drawing_area.set_item_coords(self._item, self._stroke.coords)
+
+    def finish(self, event):
+        if self._item is None:
+            return
+        x, y = self.position(event)
+        self._stroke.add(x, y)
+        coords = self._stroke.finish()
+        if len(coords) == 2:
+            # A click without movement leaves a dot
+            coords = coords * 2
+        self.drawing_area.set_item_coords(self._item, coords)
+        self._item = None
+        self._stroke = None
+
+
+class BrushTool(Tool):
+    """
+    Soft round brush painting on the raster layer. Dabs are spaced along the
+    mouse path and each one only dirties its own bounding box.
+    """
+
+    color = '#000000'
+    radius = 6
+    spacing = 0.25
+    erase = False
+
+    def __init__(self, drawing_area):
+        super().__init__(drawing_area)
+        self._last = None
+
+    def start(self, event):
+        x, y = self.position(event)
+        self.drawing_area.raster_layer().dab(x, y, self.radius, self.color, erase=self.erase)
+        self._last = x, y
+
+    def sample(self, event):
+        if self._last is None:
+            return
+        x, y = self.position(event)
+        lx, ly = self._last
+        step = max(1.0, self.radius * 2 * self.spacing)
+        distance = ((x - lx) ** 2 + (y - ly) ** 2) ** 0.5
+        if distance < step:
+            return
+        layer = self.drawing_area.raster
+        count = int(distance / step)
+        for i in range(1, count + 1):
+            t = i * step / distance
+            layer.dab(lx + (x - lx) * t, ly + (y - ly) * t, self.radius, self.color, erase=self.erase)
+        self._last = lx + (x - lx) * count * step / distance, ly + (y - ly) * count * step / distance
+
+    def finish(self, event):
+        self.sample(event)
+        self._last = None
+
+
+class CutOutTool(Tool):
+    """
+    Freehand lasso combining the items of the active layer with the area it
+    encloses. With the default 'difference' it cuts that area out of them;
+    'intersection' keeps only what is inside it, 'union' and 'xor' merge it
+    into the filled items it touches (see lib.clipping.cut).
+
+    The result stays vector: cut lines keep their first piece in the original
+    item and get new items for the others, filled items become polygons.
+    The whole cut is a single undo step and a single call to Tcl.
+    """
+
+    operation = 'difference'
+    outline = '#1e90ff'
+
+    def __init__(self, drawing_area):
+        super().__init__(drawing_area)
+        self._points = None
+        self._preview = None
+
+    def start(self, event):
+        x, y = self.position(event)
+        self._points = [x, y]
+        zoom = self.drawing_area.zoom
+        self._preview = self.canvas.create_line(x * zoom, y * zoom, x * zoom, y * zoom, fill=self.outline,
+                                                dash=(4, 4), tags=('tool_preview',))
+
+    def sample(self, event):
+        if self._points is None:
+            return
+        x, y = self.position(event)
+        if abs(x - self._points[-2]) + abs(y - self._points[-1]) >= 1:
+            self._points += [x, y]
+
+    def update(self, event):
+        if self._preview is not None:
+            zoom = self.drawing_area.zoom
+            self.canvas.coords(self._preview, *[c * zoom for c in self._points + self._points[:2]])
+
+    def finish(self, event):
+        if self._points is None:
+            return
+        self.sample(event)
+        self.canvas.delete(self._preview)
+        points, self._points, self._preview = self._points, None, None
+        if len(points) >= 6:
+            self.apply(points)
+
+    def apply(self, points):
+        """
+        Combine the items under a polygon with it.
+
+        :param points: flat coordinate list of the polygon, in document coordinates
+        :return: None
+        """
+        document = self.drawing_area.document
+        x1, y1, x2, y2 = coords_bbox(points)
+        if self.operation == 'intersection':
+            # Cropping also removes everything away from the polygon
+            x1, y1 = min(x1, 0), min(y1, 0)
+            x2, y2 = max(x2, document.width), max(y2, document.height)
+        items = [document.get(item_id) for item_id in self.items_inside(x1, y1, x2, y2)]
+        # NumPy is only loaded once something is cut
+        from lib.clipping import cut
+
+        self.replace_items(items, cut(items, [points], self.operation))
+
+
+class EraserTool(Tool):
+    """
+    Vector eraser: removes the parts of the strokes (line items) of the
+    active layer under its path, splitting them where it crosses them. The
+    path drawn since the last frame is cut in one go, as a chain of capsules
+    of the eraser radius; only the strokes whose bounding box meets that
+    chain are looked up in the spatial index and clipped. The whole gesture
+    is a single undo step.
+    """
+
+    radius = 8
+
+    def __init__(self, drawing_area):
+        super().__init__(drawing_area)
+        self._path = None
+
+    def start(self, event):
+        x, y = self.position(event)
+        self._path = [(x, y)]
+        self.erase(self._path)
+
+    def sample(self, event):
+        if self._path is None:
+            return
+        x, y = self.position(event)
+        lx, ly = self._path[-1]
+        # Consecutive capsules overlap anyway, closer points only add work
+        if (x - lx) ** 2 + (y - ly) ** 2 >= (self.radius / 2) ** 2:
+            self._path.append((x, y))
+
+    def update(self, event):
+        if self._path is None or len(self._path) < 2:
+            return
+        self.erase(self._path)
+        del self._path[:-1]
+
+    def finish(self, event):
+        if self._path is None:
+            return
+        x, y = self.position(event)
+        if (x, y) != self._path[-1]:
+            self._path.append((x, y))
+        self.update(event)
+        self._path = None
+
+    def erase(self, points):
+        """
+        Erase the strokes under the path swept by the eraser.
+
+        :param points: list of (x, y)
+        :return: None
+        """
+        r = self.radius
+        document = self.drawing_area.document
+        items = [document.get(item_id) for item_id in
+                 self.items_inside(*coords_bbox([c for point in points for c in point], r))]
+        items = [item for item in items if item.kind == 'line']
+        if items:
+            from lib.clipping import capsule_chain, cut
+
+            self.replace_items(items, cut(items, capsule_chain(points, r), nonzero=True))
@@ -35,27 +35,16 @@
 """
 
 import sys
+import time
 
-try:
-    from tkinter import *
-except ImportError:
-    print("** Desenhando can't import Tkinter.\n"
-          "Your Python may not be configured for Tk. **", file=sys.__stderr__)
-
-from tkinter import messagebox
-
-if TkVersion < 8.5:
-    root_ = Tk()
-    root_.withdraw()
-    messagebox.showerror("Desenhando Cannot Start",
-                         f"Desenhando requires tcl/tk 8.5+, not {TkVersion}.")
-    raise SystemError(1)
+# Beginning of the startup, for --profile-startup
+_started = time.perf_counter()
 
 import os
 from platform import system
 import logging
 
-from core import DesenhandoBase
+from lib.profiling import PhaseTimer
 from lib.tools import set_copyright
 
 __version__ = '1.4.0'
@@ -145,8 +134,34 @@ def parse_arguments():
     parser.add_argument('-d', '--debug', help='enable debug', action='store_true')
     parser.add_argument("--license", action="store_true", help="Show full copyright notice and software license")
 
+    # headless batch rendering, no window is created
+    parser.add_argument('--render', nargs='+', metavar='IN',
+                        help='render drawings (or directories of drawings) and exit')
+    parser.add_argument('--out', metavar='DIR', default='.', help='output directory of --render')
+    parser.add_argument('--format', choices=('png', 'svg'), default='png', help='output format of --render')
+    parser.add_argument('--scale', type=float, default=1.0, metavar='N', help='PNG pixels per page pixel')
+    parser.add_argument('--jobs', type=int, metavar='N', help='processes used by --render (default: CPU count)')
+
+    parser.add_argument('--trace-events', metavar='FILE',
+                        help='measure the event handlers and write a Chrome Trace Event file on exit')
+    parser.add_argument('--record', metavar='FILE', help='record the input events of the session to FILE')
+    parser.add_argument('--replay', metavar='FILE', help='replay a recorded input session, print its timing and quit')
+    parser.add_argument('--replay-speed', type=float, default=0, metavar='N',
+                        help='1 replays in real time, 2 twice as fast...; 0 (default) as fast as possible')
+    parser.add_argument('--profile-startup', nargs='?', type=float, const=0, metavar='TARGET_MS',
+                        help='print the time of every startup phase up to the first idle of the main '
+                             'loop, then quit; with TARGET_MS, exit with status 1 when slower')
+
     if not is_release():
-        parser.add_argument('-t', '--runtests', action='store_true', help='run test suite (for developers)')
+        parser.add_argument('-t', '--runtests', action='store_true',
+                            help='run the benchmark suite without a display (for developers)')
+        parser.add_argument('--bench-out', metavar='FILE', help='write the benchmark results to FILE as JSON')
+        parser.add_argument('--bench-baseline', metavar='FILE',
+                            help='compare the benchmarks with the results in FILE, exit with status 1 on regressions')
+        parser.add_argument('--bench-tolerance', type=float, default=15, metavar='PERCENT',
+                            help='slowdown or memory growth accepted by --bench-baseline (default: 15)')
+        parser.add_argument('--bench-only', metavar='TEXT', help='run only the benchmarks whose name contains TEXT')
+        parser.add_argument('--bench-quick', action='store_true', help='run the benchmarks with smaller sizes')
 
     arg_options = vars(parser.parse_args())
 
@@ -157,7 +172,33 @@ def parse_arguments():
     return arg_options
 
 
+def check_tk():
+    """
+    Make sure Tk can be used before any window is created. Kept out of the
+    module level: the --render workers import this file again when they
+    are spawned, and must not load Tk.
+
+    :return: None
+    """
+    try:
+        from tkinter import Tk, TkVersion, messagebox
+    except ImportError:
+        print("** Desenhando can't import Tkinter.\n"
+              "Your Python may not be configured for Tk. **", file=sys.__stderr__)
+        raise SystemError(1)
+
+    if TkVersion < 8.5:
+        root_ = Tk()
+        root_.withdraw()
+        messagebox.showerror("Desenhando Cannot Start",
+                             f"Desenhando requires tcl/tk 8.5+, not {TkVersion}.")
+        raise SystemError(1)
+
+
 def set_application_icon(root):
+    from tkinter import TkVersion
+    from core.Assets import AssetCache
+
     icondir = os.path.join(get_cwd(), 'icons')
 
     if system() == 'Windows':
@@ -172,9 +213,35 @@ def set_application_icon(root):
             sizes = (16, 32, 48)
         icon_files = [os.path.join(icondir, 'desenhando_%d%s' % (size, ext))
                       for size in sizes]
-        icons = [PhotoImage(master=root, file=icon_file)
-                 for icon_file in icon_files]
-        root.wm_iconphoto(True, *icons)
+        # Not needed for the first frame: decoded once the main loop runs
+        AssetCache.get_instance().preload(icon_files, callback=lambda icons: root.wm_iconphoto(True, *icons))
+
+
+def start_autosave(root, drawing_area):
+    """
+    Attach the autosave journal to the drawing area. When the last session
+    did not end cleanly, its drawing is recovered from the journal first.
+
+    :return: Journal
+    """
+    from tkinter import messagebox
+    from lib.journal import Journal
+
+    # A directory no other running instance uses, preferring one left by a crash
+    journal = Journal.claim()
+    if journal.unclean():
+        try:
+            document, raster = Journal.recover(journal.directory)
+        except Exception:
+            logging.exception('Could not recover the drawing of the last session')
+        else:
+            drawing_area.load_document(document, raster)
+            drawing_area.attach_journal(journal, resume=True)
+            messagebox.showinfo(title='Desenhando',
+                                message='O desenho da última sessão foi recuperado.', parent=root)
+            return journal
+    drawing_area.attach_journal(journal)
+    return journal
 
 
 def main():
@@ -185,6 +252,14 @@ def main():
         os.environ['DS_VERSION'] = get_version_digits_str()
         args = parse_arguments()
         init_logging(args.get('debug', False))
+        if args.get('render'):
+            from lib.batch import render_batch
+            failed = render_batch(args['render'], args['out'], args['format'], args['scale'], args['jobs'])
+            sys.exit(1 if failed else 0)
+        if args.get('runtests'):
+            from lib.benchmark import main as run_benchmarks
+            sys.exit(run_benchmarks(args['bench_out'], args['bench_baseline'], args['bench_quick'], args['bench_only'],
+                                    tolerance=args['bench_tolerance'] / 100))
         print(copyright())
 
     except Exception as e:
@@ -198,13 +273,62 @@ def main():
     os.environ['DS_FROZEN'] = 'Yes' if is_build() else 'No'
     os.environ['DS_RELEASE'] = 'Yes' if is_release() else 'No'
 
+    startup = PhaseTimer(_started)
+    profile = args.get('profile_startup')
+
+    check_tk()
+    # Imported here so that --render never loads the Tk widgets
+    from tkinter import Tk
+    from core import DesenhandoBase
+    from core.Assets import AssetCache
+    startup.mark('imports')
+
     root = Tk(className='Desenhando')
     root.columnconfigure(0, weight=1)
     root.rowconfigure(0, weight=1)
+    AssetCache(root)
+    startup.mark('Tk init')
     set_application_icon(root)
+    startup.mark('icons')
     base = DesenhandoBase.DesenhandoBase(root)
+    startup.mark('widgets')
+    if args.get('trace_events'):
+        base.drawing_area.start_profiling()
+        base.diagnostics.profiling.set(True)
+    if args.get('record'):
+        base.drawing_area.start_recording(args['record'])
+        base.diagnostics.recording.set(True)
+
+    def first_idle():
+        root.update_idletasks()
+        startup.mark('first idle')
+        logging.debug(startup.report('Startup'))
+        if profile is not None:
+            print(startup.report('Startup', profile))
+            root.destroy()
+
+    root.after_idle(first_idle)
+    if args.get('replay'):
+        def replay_finished(replayer):
+            print(f'{replayer.replayed} events replayed in {replayer.seconds:.3f} s '
+                  f'({replayer.replayed / max(replayer.seconds, 1e-9):.0f} events/s)')
+            root.destroy()
+        root.after_idle(lambda: base.diagnostics.replay_session(args['replay'], args['replay_speed'] or None,
+                                                                replay_finished))
+    # The journal is opened once the window is shown, so it does not delay it
+    autosave = []
+    if profile is None:
+        root.after_idle(lambda: autosave.append(start_autosave(root, base.drawing_area)))
 
     root.mainloop()
+    base.drawing_area.stop_recording()
+    for journal in autosave:
+        journal.close()
+    if args.get('trace_events') and base.drawing_area.profiler is not None:
+        print(base.drawing_area.profiler.summary())
+        base.drawing_area.profiler.dump_trace(args['trace_events'])
+    if profile and not startup.within(profile):
+        sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -32,25 +32,330 @@
 +----------------------------------------------------------------------------------------+
 """
 
+import logging
+import math
+import multiprocessing
+import os
+import queue
 import time
-from threading import Thread
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from threading import Event, Thread
+
+from lib.png import PNGWriter
+from lib.raster import RasterLayer
+from lib.rasterizer import draw_page
+from lib.svg import export_svg
 
 
 class SaveImage(Thread):
     """
     Class to save the drawing as an image
+
+    The page is rendered in horizontal bands of band_height rows, and every
+    band is compressed and written before the next one is drawn, so memory
+    does not grow with the page size. The file is written next to its final
+    path and only renamed once complete.
+
+    When the thread ends it generates <<SavedFile>>, <<ErrorSavingFile>> or,
+    after cancel(), <<SaveCancelled>> on object_.
     """
 
-    def __init__(self, file, object_):
-        super().__init__()
+    band_height = 128
+
+    def __init__(self, file, object_, document, scale=1.0, background='#ffffff', raster=None, level=6):
+        """
+        :param file: path of the PNG file
+        :param object_: widget that receives the events
+        :param document: lib.document.Document, not edited while saving (see Document.snapshot)
+        :param scale: pixels per page pixel
+        :param background: page color, or None for a transparent page
+        :param raster: optional RasterLayer with the pixel layer of the drawing
+        :param level: zlib compression level
+        """
+        super().__init__(daemon=True)
         self.file = file
         self.object_ = object_
+        self.document = document
+        self.scale = scale
+        self.background = background
+        self.raster = raster
+        self.level = level
+        self.width = max(1, math.ceil(document.width * scale))
+        self.height = max(1, math.ceil(document.height * scale))
+        self.rows_written = 0
+        self.bytes_written = 0
+        self._cancelled = Event()
+
+    @property
+    def progress(self):
+        """
+        Fraction of the rows already written, between 0 and 1.
+        """
+        return self.rows_written / self.height
+
+    def cancel(self):
+        """
+        Stop after the current band; the partial file is removed.
+
+        :return: None
+        """
+        self._cancelled.set()
+
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def run(self):
+        try:
+            finished = self.export()
+        except Exception:
+            logging.exception(f'Error saving {self.file}')
+            self.object_.event_generate('<<ErrorSavingFile>>')
+        else:
+            self.object_.event_generate('<<SavedFile>>' if finished else '<<SaveCancelled>>')
+
+    def export(self):
+        """
+        Render and write the image.
+
+        :return: True when the file was written, False when cancelled
+        """
+        partial = self.file + '.part'
+        finished = False
+        try:
+            with open(partial, 'wb') as file:
+                writer = PNGWriter(file, self.width, self.height, level=self.level)
+                band = RasterLayer(self.width, min(self.band_height, self.height))
+                for top in range(0, self.height, self.band_height):
+                    if self.cancelled():
+                        break
+                    rows = min(self.band_height, self.height - top)
+                    if rows != band.height:
+                        band = RasterLayer(self.width, rows)
+                    else:
+                        band.pixels[...] = 0
+                    draw_page(self.document, band, self.scale, (0, top / self.scale), self.background, self.raster)
+                    band.take_dirty()
+                    writer.write_rows(band.pixels)
+                    self.rows_written = writer.rows_written
+                    self.bytes_written = writer.bytes_written
+                else:
+                    writer.close()
+                    self.bytes_written = writer.bytes_written
+                    finished = True
+            # A cancel() arriving after the last band no longer stops the export
+            if not finished:
+                os.remove(partial)
+                return False
+            os.replace(partial, self.file)
+            return True
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+
+
+class ExportTarget:
+    """
+    One output of an export: a file path, its format and its size, given
+    either as a scale or as the longest side in pixels (for thumbnails).
+    """
+
+    def __init__(self, path, format_='png', scale=1.0, max_size=None):
+        self.path = path
+        self.format = format_
+        self.scale = scale
+        self.max_size = max_size
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.path!r}, {self.format!r})'
+
+    def scale_for(self, document):
+        if self.max_size:
+            return min(1.0, self.max_size / max(document.width, document.height))
+        return self.scale
+
+
+class SaveSVG(Thread):
+    """
+    Class to save the drawing as an SVG file
+
+    Same events, progress and cancellation as SaveImage; progress counts items.
+    """
+
+    def __init__(self, file, object_, document, raster=None, precision=2):
+        """
+        :param file: path of the SVG file
+        :param object_: widget that receives the events
+        :param document: lib.document.Document, not edited while saving (see Document.snapshot)
+        :param raster: optional RasterLayer with the pixel layer of the drawing
+        :param precision: decimal places of coordinates
+        """
+        super().__init__(daemon=True)
+        self.file = file
+        self.object_ = object_
+        self.document = document
+        self.raster = raster
+        self.precision = precision
+        self.items_written = 0
+        self.bytes_written = 0
+        self._cancelled = Event()
+
+    @property
+    def progress(self):
+        return self.items_written / max(1, len(self.document))
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def cancelled(self):
+        return self._cancelled.is_set()
 
     def run(self):
         try:
-            print('entrando')
-            time.sleep(3)
-            self.object_.event_generate('<<SavedFile>>')
-            print('saindo')
-        except:
+            finished = self.export()
+        except Exception:
+            logging.exception(f'Error saving {self.file}')
             self.object_.event_generate('<<ErrorSavingFile>>')
+        else:
+            self.object_.event_generate('<<SavedFile>>' if finished else '<<SaveCancelled>>')
+
+    def export(self):
+        """
+        Write the file.
+
+        :return: True when the file was written, False when cancelled
+        """
+        partial = self.file + '.part'
+        try:
+            size = export_svg(self.document, partial, self.precision, raster=self.raster,
+                              progress=self._update)
+            if size is None:
+                os.remove(partial)
+                return False
+            self.items_written = len(self.document)
+            self.bytes_written = size
+            os.replace(partial, self.file)
+            return True
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+
+    def _update(self, items):
+        self.items_written = items
+        return not self.cancelled()
+
+
+def export_png(document, raster, target):
+    task = SaveImage(target.path, None, document, scale=target.scale_for(document), raster=raster)
+    task.export()
+    return task.bytes_written
+
+
+def export_svg_target(document, raster, target):
+    task = SaveSVG(target.path, None, document, raster=raster)
+    task.export()
+    return task.bytes_written
+
+
+# Functions writing one target, by format: function(document, raster, target) -> bytes written
+EXPORTERS = {'png': export_png, 'svg': export_svg_target}
+
+# Drawing received once by every worker process
+_worker_drawing = None
+
+
+def _init_export_worker(document, raster):
+    global _worker_drawing
+    _worker_drawing = document, raster
+
+
+def _export_target(target):
+    document, raster = _worker_drawing
+    start = time.perf_counter()
+    size = EXPORTERS[target.format](document, raster, target)
+    return size, time.perf_counter() - start
+
+
+class ExportPipeline(Thread):
+    """
+    Writes several outputs of the same drawing in parallel.
+
+    The snapshot of the drawing is sent once to each process of a pool and
+    every target is rendered by one process, so the whole export takes about
+    as long as its slowest target. As targets finish, (target, size, seconds,
+    error) tuples are put on results and <<ExportedFile>> or
+    <<ErrorExportingFile>> is generated on object_; <<ExportFinished>> comes last.
+    When the pool itself fails, its exception is kept in error.
+    """
+
+    def __init__(self, targets, object_, document, raster=None, max_workers=None):
+        """
+        :param targets: list of ExportTarget
+        :param object_: widget that receives the events
+        :param document: lib.document.Document, not edited while exporting (see Document.snapshot)
+        :param raster: optional RasterLayer with the pixel layer of the drawing
+        :param max_workers: size of the process pool (default: one per target, up to the CPU count)
+        """
+        super().__init__(daemon=True)
+        self.targets = list(targets)
+        self.object_ = object_
+        self.document = document
+        self.raster = raster
+        self.max_workers = max_workers or max(1, min(len(self.targets), os.cpu_count() or 1))
+        self.results = queue.Queue()
+        self.finished = 0
+        self.bytes_written = 0
+        # Error of the pool itself, eg. when its processes could not start
+        self.error = None
+        self._cancelled = Event()
+
+    @property
+    def progress(self):
+        return self.finished / max(1, len(self.targets))
+
+    def cancel(self):
+        """
+        Skip the targets that have not started yet.
+
+        :return: None
+        """
+        self._cancelled.set()
+
+    def run(self):
+        try:
+            # Forking the Tk process could copy a lock held by one of its threads
+            # (journal writer, asset loader) into the workers: start them afresh
+            with ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context('spawn'),
+                                     initializer=_init_export_worker,
+                                     initargs=(self.document, self.raster)) as pool:
+                futures = {pool.submit(_export_target, target): target for target in self.targets}
+                pending = set(futures)
+                while pending:
+                    done, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                    if self._cancelled.is_set():
+                        for future in pending:
+                            future.cancel()
+                    for future in done:
+                        self._report(futures[future], future)
+        except Exception as error:
+            logging.exception('Error exporting the drawing')
+            self.error = error
+            self.object_.event_generate('<<ErrorExportingFile>>')
+        self.object_.event_generate('<<ExportFinished>>')
+
+    def _report(self, target, future):
+        self.finished += 1
+        if future.cancelled():
+            self.results.put((target, 0, 0, 'cancelled'))
+            return
+        error = future.exception()
+        if error is not None:
+            logging.error(f'Error exporting {target.path}: {error}')
+            self.results.put((target, 0, 0, error))
+            self.object_.event_generate('<<ErrorExportingFile>>')
+            return
+        size, seconds = future.result()
+        self.bytes_written += size
+        self.results.put((target, size, seconds, None))
+        self.object_.event_generate('<<ExportedFile>>')
@@ -0,0 +1,129 @@
+"""
++----------------------------------------------------------------------------------------+
+|                                 This file is part of:                                  |
+|                                      DESENHANDO                                        |
+|                                 www.github.com/...                                     |
++----------------------------------------------------------------------------------------+
+|     Copyright (c) 2021 João Vitor, ...                                                 |
+|                                                                                        |
+|     Permission is hereby granted, free of charge, to any person obtaining a copy       |
+|     of this software and associated documentation files (the "Software"), to deal      |
+|     in the Software without restriction, including without limitation the rights       |
+|     to use, copy, modify, merge, publish, distribute, sublicense, and/or sell          |
+|     copies of the Software, and to permit persons to whom the Software is              |
+|     furnished to do so, subject to the following conditions:                           |
+|                                                                                        |
+|     The above copyright notice and this permission notice shall be included in         |
+|     all copies or substantial portions of the Software.                                |
+|                                                                                        |
+|     THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR         |
+|     IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,           |
+|     FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE        |
+|     AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER             |
+|     LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,      |
+|     OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN          |
+|     THE SOFTWARE.                                                                      |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+|                                         ABSTRACT                                       |
++----------------------------------------------------------------------------------------+
+| Headless batch rendering of drawings to PNG or SVG, without Tk, on a process pool.     |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+"""
+
+import glob
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from lib.SaveImage import EXPORTERS, ExportTarget
+from lib.drawing_file import EXTENSION, open_drawing
+
+
+def input_files(paths):
+    """
+    Drawing files to render: directories are replaced by the drawings they hold.
+
+    :param paths: files and directories
+    :return: (list of file paths, list of (path, reason) that gave nothing to render)
+    """
+    files = []
+    missing = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = sorted(glob.glob(os.path.join(path, '*' + EXTENSION)))
+            if not found:
+                missing.append((path, f'no {EXTENSION} files in this directory'))
+            files.extend(found)
+        elif os.path.isfile(path):
+            files.append(path)
+        else:
+            missing.append((path, 'no such file or directory'))
+    return files, missing
+
+
+def output_path(source, directory, format_):
+    name, _ = os.path.splitext(os.path.basename(source))
+    return os.path.join(directory, f'{name}.{format_}')
+
+
+def render_file(source, directory, format_='png', scale=1.0):
+    """
+    Render one drawing file. Runs in the worker processes of render_batch.
+
+    :param source: .desenhando file
+    :param directory: output directory
+    :param format_: 'png' or 'svg'
+    :param scale: output pixels per page pixel (PNG only)
+    :return: (output path, bytes written, seconds)
+    """
+    start = time.perf_counter()
+    document, raster = open_drawing(source)
+    target = ExportTarget(output_path(source, directory, format_), format_, scale)
+    size = EXPORTERS[format_](document, raster, target)
+    return target.path, size, time.perf_counter() - start
+
+
+def render_batch(paths, directory, format_='png', scale=1.0, jobs=None, file=sys.stdout):
+    """
+    Render many drawings in parallel, one file per task, printing a line per
+    file as it finishes and a throughput summary at the end.
+
+    :param paths: drawing files and directories of drawings
+    :param directory: output directory, created when missing
+    :param format_: 'png' or 'svg'
+    :param scale: output pixels per page pixel (PNG only)
+    :param jobs: number of worker processes (default: the CPU count)
+    :param file: where the report is printed
+    :return: number of inputs that could not be rendered, missing ones included
+    """
+    sources, missing = input_files(paths)
+    for path, reason in missing:
+        print(f'FAILED {path}: {reason}', file=file, flush=True)
+    os.makedirs(directory, exist_ok=True)
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(sources) or 1))
+    start = time.perf_counter()
+    failed = 0
+    total_bytes = 0
+    # Spawned like the export workers of the application, see ExportPipeline.run
+    with ProcessPoolExecutor(jobs, mp_context=multiprocessing.get_context('spawn')) as pool:
+        futures = {pool.submit(render_file, source, directory, format_, scale): source for source in sources}
+        for future in as_completed(futures):
+            source = futures[future]
+            try:
+                path, size, seconds = future.result()
+            except Exception as error:
+                failed += 1
+                print(f'FAILED {source}: {error}', file=file, flush=True)
+                continue
+            total_bytes += size
+            print(f'{source} -> {path}  {seconds:.3f} s  {size / 2 ** 20:.2f} MiB', file=file, flush=True)
+    elapsed = time.perf_counter() - start
+    rendered = len(sources) - failed
+    print(f'{rendered} of {len(sources)} drawings rendered in {elapsed:.2f} s with {jobs} processes: '
+          f'{rendered / max(elapsed, 1e-9):.1f} drawings/s, {total_bytes / 2 ** 20 / max(elapsed, 1e-9):.1f} MiB/s',
+          file=file, flush=True)
+    return failed + len(missing)
@@ -0,0 +1,963 @@
+"""
++----------------------------------------------------------------------------------------+
+|                                 This file is part of:                                  |
+|                                      DESENHANDO                                        |
+|                                 www.github.com/...                                     |
++----------------------------------------------------------------------------------------+
+|     Copyright (c) 2021 João Vitor, ...                                                 |
+|                                                                                        |
+|     Permission is hereby granted, free of charge, to any person obtaining a copy       |
+|     of this software and associated documentation files (the "Software"), to deal      |
+|     in the Software without restriction, including without limitation the rights       |
+|     to use, copy, modify, merge, publish, distribute, sublicense, and/or sell          |
+|     copies of the Software, and to permit persons to whom the Software is              |
+|     furnished to do so, subject to the following conditions:                           |
+|                                                                                        |
+|     The above copyright notice and this permission notice shall be included in         |
+|     all copies or substantial portions of the Software.                                |
+|                                                                                        |
+|     THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR         |
+|     IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,           |
+|     FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE        |
+|     AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER             |
+|     LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,      |
+|     OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN          |
+|     THE SOFTWARE.                                                                      |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+|                                         ABSTRACT                                       |
++----------------------------------------------------------------------------------------+
+| Benchmarks of the drawing hot paths: tool dispatch of the drawing area, geometry,      |
+| spatial index and export, with ops/sec, latency percentiles and peak memory.           |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+
+Every workload is a function(timer, size) that builds its data and then
+runs its operations through timer.call(), so only the operations are timed.
+The drawing area workloads drive the real DrawingArea handlers on a
+FakeCanvas, an in-memory stand-in for tkinter.Canvas, so no display is
+needed. The peak memory comes from one more run under tracemalloc, kept
+apart because tracing would slow the timed runs down.
+
+Results are saved as JSON and can be compared against a baseline file:
+
+    python desenhando.py --runtests --bench-out new.json --bench-baseline old.json
+
+--bench-quick runs smaller sizes in a few seconds and --bench-only NAME
+selects benchmarks by name, eg. --bench-only pencil.
+"""
+
+import datetime
+import gc
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from array import array
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+from lib.clipping import oval_ring
+from lib.document import Document
+from lib.geometry import simplify
+from lib.session import ReplayEvent
+from lib.spatial_index import QuadTree
+
+FORMAT_VERSION = 1
+
+# Input events per display frame: a 1 kHz tablet on a 60 Hz screen
+EVENTS_PER_FRAME = 16
+# Longest pencil stroke of the workloads, five seconds of tablet input
+STROKE_EVENTS = 5000
+
+
+class Timer:
+    """
+    Collects the duration of every operation of a workload.
+    """
+
+    def __init__(self, repeat=True):
+        """
+        :param repeat: False runs the repeated operations only once (see times)
+        """
+        self.repeat = repeat
+        self.samples = array('d')
+        # Extra values reported with the results, eg. {'canvas_calls': 1200}
+        self.counters = {}
+
+    def call(self, function, *args):
+        """
+        Run function(*args) as one timed operation.
+
+        :return: what function returned
+        """
+        start = time.perf_counter()
+        result = function(*args)
+        self.samples.append(time.perf_counter() - start)
+        return result
+
+    def times(self, count):
+        """
+        How many times a workload repeats an operation that does not depend
+        on the previous ones: count, or once while the memory is measured,
+        as the repetitions would not raise the peak.
+        """
+        return max(1, count) if self.repeat else 1
+
+
+class FakeWidget:
+    """
+    Widget that accepts any option and method call and does nothing.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.options = dict(kwargs)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: None
+
+    def __setitem__(self, key, value):
+        self.options[key] = value
+
+    def __getitem__(self, key):
+        return self.options[key]
+
+
+class FakeTk:
+    """
+    The Tcl interpreter of a FakeCanvas. Its calls are counted with the ones
+    of the canvas; the batches of core.CanvasBatch run on the canvas, other
+    commands do nothing.
+    """
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+
+    def call(self, *args):
+        from core.CanvasBatch import BATCH_COMMAND
+
+        self.canvas.calls += 1
+        if args and args[0] == BATCH_COMMAND:
+            return self.canvas.run_batch(args[2])
+        return ''
+
+    def eval(self, script):
+        self.canvas.calls += 1
+        return ''
+
+    def splitlist(self, value):
+        return value
+
+    def getint(self, value):
+        return int(value)
+
+
+class FakePhotoImage(FakeWidget):
+
+    def configure(self, width=None, height=None, **kwargs):
+        if width is not None:
+            self.options['width'] = width
+        if height is not None:
+            self.options['height'] = height
+
+    def width(self):
+        return self.options.get('width', 0)
+
+    def height(self):
+        return self.options.get('height', 0)
+
+
+class FakeCanvas(FakeWidget):
+    """
+    In-memory stand-in for tkinter.Canvas.
+
+    Items keep their kind, coordinates and options, the view scrolls over the
+    scroll region and the callbacks given to after() and after_idle() wait
+    until run_pending(), which plays the role of the event loop at the end of
+    a frame. The stacking order is not kept. calls counts the round trips to
+    Tcl.
+    """
+
+    _w = '.canvas'
+
+    def __init__(self, master=None, width=1280, height=800, **options):
+        super().__init__(**options)
+        self.width = width
+        self.height = height
+        self.items = {}
+        self.tagged = {}
+        self.calls = 0
+        self.view = [0.0, 0.0]
+        self.tk = FakeTk(self)
+        self._next_id = 1
+        self._pending = {}
+        self._next_job = 1
+
+    def _create(self, kind, coords, options):
+        self.calls += 1
+        if len(coords) == 1 and isinstance(coords[0], (list, tuple)):
+            coords = coords[0]
+        item_id = self._next_id
+        self._next_id += 1
+        tags = options.get('tags', ())
+        tags = (tags,) if isinstance(tags, str) else tuple(tags)
+        self.items[item_id] = [kind, [float(c) for c in coords], options, tags]
+        for tag in tags:
+            self.tagged.setdefault(tag, set()).add(item_id)
+        return item_id
+
+    def create_line(self, *coords, **options):
+        return self._create('line', coords, options)
+
+    def create_rectangle(self, *coords, **options):
+        return self._create('rectangle', coords, options)
+
+    def create_oval(self, *coords, **options):
+        return self._create('oval', coords, options)
+
+    def create_polygon(self, *coords, **options):
+        return self._create('polygon', coords, options)
+
+    def create_text(self, *coords, **options):
+        return self._create('text', coords, options)
+
+    def create_image(self, *coords, **options):
+        return self._create('image', coords, options)
+
+    def _ids(self, tag_or_id):
+        if isinstance(tag_or_id, int):
+            return (tag_or_id,) if tag_or_id in self.items else ()
+        if tag_or_id == 'all':
+            return tuple(self.items)
+        return tuple(self.tagged.get(tag_or_id, ()))
+
+    def coords(self, tag_or_id, *coords):
+        self.calls += 1
+        ids = self._ids(tag_or_id)
+        if not coords:
+            return list(self.items[ids[0]][1]) if ids else []
+        if len(coords) == 1 and isinstance(coords[0], (list, tuple)):
+            coords = coords[0]
+        for item_id in ids:
+            self.items[item_id][1] = [float(c) for c in coords]
+
+    def itemconfigure(self, tag_or_id, **options):
+        self.calls += 1
+        for item_id in self._ids(tag_or_id):
+            self.items[item_id][2].update(options)
+
+    itemconfig = itemconfigure
+
+    def move(self, tag_or_id, dx, dy):
+        self.calls += 1
+        for item_id in self._ids(tag_or_id):
+            coords = self.items[item_id][1]
+            coords[0::2] = [x + dx for x in coords[0::2]]
+            coords[1::2] = [y + dy for y in coords[1::2]]
+
+    def delete(self, *tags_or_ids):
+        self.calls += 1
+        for tag_or_id in tags_or_ids:
+            for item_id in self._ids(tag_or_id):
+                for tag in self.items.pop(item_id)[3]:
+                    self.tagged[tag].discard(item_id)
+
+    def bbox(self, tag_or_id):
+        self.calls += 1
+        boxes = []
+        for item_id in self._ids(tag_or_id):
+            kind, coords, options, tags = self.items[item_id]
+            pad = float(options.get('width', 1)) / 2
+            if kind == 'text':
+                # Rough extent of the text with 7x14 pixel characters; like Tk, an empty text has no bbox
+                if not str(options.get('text', '')):
+                    continue
+                lines = str(options.get('text', '')).split('\n')
+                half = max(len(line) for line in lines) * 7 / 2
+                boxes.append((coords[0] - half, coords[1] - 7 * len(lines), coords[0] + half, coords[1] + 7 * len(lines)))
+            else:
+                boxes.append((min(coords[0::2]) - pad, min(coords[1::2]) - pad,
+                              max(coords[0::2]) + pad, max(coords[1::2]) + pad))
+        if not boxes:
+            return None
+        return (int(min(box[0] for box in boxes)), int(min(box[1] for box in boxes)),
+                math.ceil(max(box[2] for box in boxes)), math.ceil(max(box[3] for box in boxes)))
+
+    def tag_lower(self, tag_or_id, below=None):
+        self.calls += 1
+
+    def tag_raise(self, tag_or_id, above=None):
+        self.calls += 1
+
+    def canvasx(self, x):
+        self.calls += 1
+        return x + self.view[0]
+
+    def canvasy(self, y):
+        self.calls += 1
+        return y + self.view[1]
+
+    def winfo_width(self):
+        return self.width
+
+    def winfo_height(self):
+        return self.height
+
+    def configure(self, **options):
+        self.calls += 1
+        self.options.update(options)
+
+    config = configure
+
+    def _scroll_size(self, axis):
+        region = self.options.get('scrollregion')
+        if not region:
+            return (self.width, self.height)[axis]
+        return float(region[axis + 2]) - float(region[axis])
+
+    def _moveto(self, axis, fraction, command):
+        self.calls += 1
+        size = self._scroll_size(axis)
+        window = (self.width, self.height)[axis]
+        self.view[axis] = max(0.0, min(size - window, fraction * size))
+        callback = self.options.get(command)
+        if callback is not None:
+            callback(str(self.view[axis] / size), str(min(1.0, (self.view[axis] + window) / size)))
+
+    def xview_moveto(self, fraction):
+        self._moveto(0, fraction, 'xscrollcommand')
+
+    def yview_moveto(self, fraction):
+        self._moveto(1, fraction, 'yscrollcommand')
+
+    def after(self, ms, function=None, *args):
+        if function is None:
+            return None
+        job = self._next_job
+        self._next_job += 1
+        self._pending[job] = function, args
+        return job
+
+    def after_idle(self, function, *args):
+        return self.after(0, function, *args)
+
+    def after_cancel(self, job):
+        self._pending.pop(job, None)
+
+    def run_batch(self, commands):
+        """
+        Run a batch of core.CanvasBatch commands, as its Tcl procedure does.
+
+        :return: [list of the results, flat list of failed command index and message]
+        """
+        calls = self.calls
+        results = []
+        errors = []
+        for references, command in zip(commands[0::2], commands[1::2]):
+            command = list(command)
+            for position in references:
+                command[position] = results[command[position]]
+            name, item, *arguments = command
+            try:
+                if name == 'create':
+                    coords, arguments = arguments[0], arguments[1:]
+                    options = dict(zip((key[1:] for key in arguments[0::2]), arguments[1::2]))
+                    result = self._create(item, coords, options)
+                elif name == 'coords':
+                    result = self.coords(item, *arguments[0])
+                elif name == 'itemconfigure':
+                    result = self.itemconfigure(item, **dict(zip((key[1:] for key in arguments[0::2]),
+                                                                 arguments[1::2])))
+                elif name == 'move':
+                    result = self.move(item, *arguments)
+                elif name == 'delete':
+                    result = self.delete(item, *arguments)
+                elif name == 'lower':
+                    result = self.tag_lower(item, *arguments)
+                elif name == 'raise':
+                    result = self.tag_raise(item, *arguments)
+                else:
+                    raise ValueError(f'unknown canvas command {name}')
+            except Exception as error:
+                errors += [len(results), str(error)]
+                result = ''
+            results.append('' if result is None else result)
+        self.calls = calls
+        return [results, errors]
+
+    def run_pending(self):
+        """
+        Run the callbacks scheduled so far, like the event loop between two frames.
+
+        :return: number of callbacks run
+        """
+        jobs, self._pending = self._pending, {}
+        for function, args in jobs.values():
+            function(*args)
+        return len(jobs)
+
+
+@contextmanager
+def headless_tk():
+    """
+    Replace the Tk widgets used by core.DrawingArea and core.Layers with
+    in-memory fakes while the block runs.
+    """
+    import core.DrawingArea as drawing_area_module
+    import core.Layers as layers_module
+
+    fakes = ((drawing_area_module, 'Canvas', FakeCanvas),
+             (drawing_area_module, 'ttk', SimpleNamespace(Frame=FakeWidget, Separator=FakeWidget)),
+             (drawing_area_module, 'AutoHideScrollbar', FakeWidget),
+             (drawing_area_module, 'StatusBar', FakeWidget),
+             (layers_module, 'PhotoImage', FakePhotoImage))
+    saved = [(module, name, getattr(module, name)) for module, name, fake in fakes]
+    for module, name, fake in fakes:
+        setattr(module, name, fake)
+    try:
+        yield
+    finally:
+        for module, name, value in saved:
+            setattr(module, name, value)
+
+
+def headless_drawing_area(width=1024, height=720, tool=None):
+    """
+    A DrawingArea on a FakeCanvas; must be called inside headless_tk().
+
+    :param width: page width
+    :param height: page height
+    :param tool: tool class to select, eg. core.Tools.PencilTool
+    :return: (DrawingArea, FakeCanvas)
+    """
+    from core.DrawingArea import DrawingArea
+
+    area = DrawingArea(None)
+    area.update_workspace_size(width, height)
+    if tool is not None:
+        area.tool = tool(area)
+    area.drawing_area.run_pending()
+    return area, area.drawing_area
+
+
+def stroke_points(count, width, height, seed=1):
+    """
+    Points of a freehand-like stroke about one pixel apart: loops like
+    handwriting along rows 60 pixels apart, wrapping to fit the page.
+
+    :return: generator of (x, y)
+    """
+    generator = random.Random(seed)
+    columns = width - 40
+    rows = max(1, int((height - 40) // 60))
+    for index in range(count):
+        t = index / 12
+        advance = index * 0.35
+        row = int(advance // columns) % rows
+        jitter = generator.uniform(-0.3, 0.3)
+        yield 20 + advance % columns + 12 * math.cos(t) + jitter, 40 + row * 60 + 18 * math.sin(t) + jitter
+
+
+def random_strokes(document, count, points, width, height, seed=2):
+    """
+    Add count short random strokes of points points each to document.
+
+    :return: None
+    """
+    generator = random.Random(seed)
+    for _ in range(count):
+        x, y = generator.uniform(0, width), generator.uniform(0, height)
+        coords = []
+        for _ in range(points):
+            x += generator.uniform(-6, 6)
+            y += generator.uniform(-6, 6)
+            coords += (x, y)
+        document.add('line', coords, fill='#000000', width=2, capstyle='round')
+
+
+def pencil_points(timer, size):
+    """
+    size input events drawn with the pencil, in strokes of STROKE_EVENTS
+    events; every EVENTS_PER_FRAME events the pending updates run, as at the
+    end of a frame. One operation per event.
+    """
+    from core.Tools import PencilTool
+
+    area, canvas = headless_drawing_area(4096, 4096, PencilTool)
+    points = stroke_points(size, 4096, 4096)
+
+    def move(event, frame_end):
+        area.update_drawing(event)
+        if frame_end:
+            canvas.run_pending()
+
+    for start in range(0, size, STROKE_EVENTS):
+        count = min(STROKE_EVENTS, size - start)
+        x, y = next(points)
+        timer.call(area.start_drawing, ReplayEvent(x, y))
+        for index in range(1, count - 1):
+            x, y = next(points)
+            timer.call(move, ReplayEvent(x, y), index % EVENTS_PER_FRAME == 0)
+        if count > 1:
+            x, y = next(points)
+        timer.call(area.finish_drawing, ReplayEvent(x, y))
+        canvas.run_pending()
+    timer.counters['canvas_calls'] = canvas.calls
+    timer.counters['items'] = len(area.document)
+
+
+def pencil_strokes(timer, size):
+    """
+    size short pencil strokes of eight events each, one operation per stroke.
+    """
+    from core.Tools import PencilTool
+
+    area, canvas = headless_drawing_area(4096, 4096, PencilTool)
+    generator = random.Random(3)
+
+    def stroke(events):
+        area.start_drawing(events[0])
+        for event in events[1:-1]:
+            area.update_drawing(event)
+        area.finish_drawing(events[-1])
+        canvas.run_pending()
+
+    for _ in range(size):
+        x, y = generator.uniform(0, 1200), generator.uniform(0, 700)
+        events = [ReplayEvent(x + i * 3, y + generator.uniform(-2, 2)) for i in range(8)]
+        timer.call(stroke, events)
+    timer.counters['canvas_calls'] = canvas.calls
+    timer.counters['items'] = len(area.document)
+
+
+def _huge_page(size):
+    area, canvas = headless_drawing_area()
+    document = Document(100000, 100000)
+    random_strokes(document, size, 6, 100000, 100000)
+    area.load_document(document)
+    canvas.run_pending()
+    return area, canvas
+
+
+def huge_page_pan(timer, size):
+    """
+    Scroll to 1000 random places of a 100000 x 100000 page holding size strokes.
+    """
+    area, canvas = _huge_page(size)
+    generator = random.Random(4)
+
+    def pan(x, y):
+        canvas.xview_moveto(x)
+        canvas.yview_moveto(y)
+        canvas.run_pending()
+
+    for _ in range(1000):
+        timer.call(pan, generator.random(), generator.random())
+    timer.counters['canvas_calls'] = canvas.calls
+
+
+def huge_page_zoom(timer, size):
+    """
+    Zoom in and out 120 times on a 100000 x 100000 page holding size strokes.
+    """
+    area, canvas = _huge_page(size)
+    canvas.xview_moveto(0.5)
+    canvas.yview_moveto(0.5)
+    canvas.run_pending()
+
+    def zoom(value):
+        area.set_zoom(value)
+        canvas.run_pending()
+
+    for index in range(120):
+        timer.call(zoom, (0.25, 1.0, 4.0)[index % 3])
+    timer.counters['canvas_calls'] = canvas.calls
+
+
+def layers_zoom(timer, size):
+    """
+    Zoom in and out 60 times on a 20000 x 20000 page whose size strokes lie
+    on an inactive layer, shown through the flattened tiles of core.Layers.
+    """
+    area, canvas = headless_drawing_area()
+    document = Document(20000, 20000)
+    random_strokes(document, size, 6, 20000, 20000)
+    document.set_active_layer(document.add_layer().id)
+    area.load_document(document)
+    canvas.xview_moveto(0.5)
+    canvas.yview_moveto(0.5)
+    canvas.run_pending()
+
+    def zoom(value):
+        area.set_zoom(value)
+        canvas.run_pending()
+
+    for index in range(60):
+        timer.call(zoom, (0.25, 1.0, 4.0)[index % 3])
+    timer.counters['canvas_calls'] = canvas.calls
+
+
+def open_document(timer, size):
+    """
+    Show a document of size strokes that all fit in the window, ten times.
+    """
+    area, canvas = headless_drawing_area()
+    document = Document(1280, 800)
+    random_strokes(document, size, 6, 1280, 800)
+
+    def load():
+        area.load_document(document)
+        canvas.run_pending()
+
+    for _ in range(timer.times(10)):
+        timer.call(load)
+    timer.counters['canvas_calls'] = canvas.calls
+    timer.counters['canvas_items'] = len(canvas.items)
+
+
+def move_selection(timer, size):
+    """
+    Move size strokes shown in the window together, ten times.
+    """
+    area, canvas = headless_drawing_area()
+    document = Document(1280, 800)
+    random_strokes(document, size, 6, 1280, 800)
+    area.load_document(document)
+    canvas.run_pending()
+    item_ids = document.ids()
+    calls = canvas.calls
+    for _ in range(timer.times(10)):
+        timer.call(area.move_items, item_ids, 1, 1)
+    timer.counters['canvas_calls'] = canvas.calls - calls
+
+
+def cut_out(timer, size):
+    """
+    Cut a lasso out of a page of size strokes shown in the window, ten
+    times; each cut is undone outside the measure.
+    """
+    from core.Tools import CutOutTool
+
+    area, canvas = headless_drawing_area(1280, 800, CutOutTool)
+    document = Document(1280, 800)
+    random_strokes(document, size, 6, 1280, 800)
+    area.load_document(document)
+    canvas.run_pending()
+    lasso = oval_ring(240, 160, 1040, 640)
+    calls = canvas.calls
+    for _ in range(timer.times(10)):
+        timer.call(area.tool.apply, lasso)
+        area.undo()
+    timer.counters['canvas_calls'] = canvas.calls - calls
+
+
+def eraser_sweep(timer, size):
+    """
+    Erase along a wavy path of 1000 input events across a page of size
+    strokes shown in the window; every EVENTS_PER_FRAME events the pending
+    updates run, as at the end of a frame. One operation per event.
+    """
+    from core.Tools import EraserTool
+
+    area, canvas = headless_drawing_area(1280, 800, EraserTool)
+    document = Document(1280, 800)
+    random_strokes(document, size, 6, 1280, 800)
+    area.load_document(document)
+    canvas.run_pending()
+    points = stroke_points(1000, 1280, 800)
+
+    def move(event, frame_end):
+        area.update_drawing(event)
+        if frame_end:
+            canvas.run_pending()
+
+    calls = canvas.calls
+    x, y = next(points)
+    timer.call(area.start_drawing, ReplayEvent(x, y))
+    for index in range(1, 999):
+        x, y = next(points)
+        timer.call(move, ReplayEvent(x, y), index % EVENTS_PER_FRAME == 0)
+    x, y = next(points)
+    timer.call(area.finish_drawing, ReplayEvent(x, y))
+    canvas.run_pending()
+    timer.counters['canvas_calls'] = canvas.calls - calls
+    timer.counters['items'] = len(document)
+
+
+def simplify_points(timer, size):
+    """
+    Ramer-Douglas-Peucker simplification of a stroke of size points, as done
+    for the level of detail of a long stroke on the first zoom-out.
+    """
+    coords = [c for point in stroke_points(size, 4096, 4096) for c in point]
+    for _ in range(timer.times(max(1, 100000 // size))):
+        timer.call(simplify, coords, 0.75)
+
+
+def index_insert(timer, size):
+    """
+    Insert size small boxes in a QuadTree, one operation per box.
+    """
+    generator = random.Random(5)
+    index = QuadTree()
+    for key in range(size):
+        x, y = generator.uniform(0, 100000), generator.uniform(0, 100000)
+        timer.call(index.insert, key, (x, y, x + 20, y + 20))
+
+
+def index_query(timer, size):
+    """
+    1000 window queries (the size of a screen) on a QuadTree of size boxes.
+    """
+    generator = random.Random(6)
+    index = QuadTree()
+    for key in range(size):
+        x, y = generator.uniform(0, 100000), generator.uniform(0, 100000)
+        index.insert(key, (x, y, x + 20, y + 20))
+    for _ in range(1000):
+        x, y = generator.uniform(0, 98000), generator.uniform(0, 99000)
+        timer.call(index.query, (x, y, x + 2000, y + 1000))
+
+
+def _export_document(size):
+    document = Document(2048, 2048)
+    random_strokes(document, max(1, size // 100), 100, 2048, 2048)
+    return document
+
+
+def export_svg(timer, size):
+    """
+    Export a page holding strokes of size points in total as SVG.
+    """
+    from lib.svg import export_svg as export
+
+    document = _export_document(size)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'page.svg')
+        for _ in range(timer.times(min(20, 100000 // size))):
+            timer.call(export, document, path)
+        timer.counters['bytes'] = os.path.getsize(path)
+
+
+def export_png(timer, size):
+    """
+    Export a page holding strokes of size points in total as PNG.
+    """
+    from lib.SaveImage import ExportTarget, export_png as export
+
+    document = _export_document(size)
+    with tempfile.TemporaryDirectory() as directory:
+        target = ExportTarget(os.path.join(directory, 'page.png'))
+        for _ in range(timer.times(3000 // size)):
+            timer.call(export, document, None, target)
+        timer.counters['bytes'] = os.path.getsize(target.path)
+
+
+# name, function(timer, size), sizes of the full run, sizes of the quick run
+WORKLOADS = (
+    ('pencil.points', pencil_points, (1000, 100000, 1000000), (1000, 10000)),
+    ('pencil.strokes', pencil_strokes, (1000, 10000), (1000,)),
+    ('page.huge.pan', huge_page_pan, (1000, 100000), (1000,)),
+    ('page.huge.zoom', huge_page_zoom, (1000, 100000), (1000,)),
+    ('page.layers.zoom', layers_zoom, (1000, 100000), (1000,)),
+    ('canvas.open', open_document, (1000, 50000), (1000,)),
+    ('selection.move', move_selection, (1000, 50000), (1000,)),
+    ('cut_out.lasso', cut_out, (1000, 20000), (1000,)),
+    ('eraser.sweep', eraser_sweep, (1000, 20000), (1000,)),
+    ('geometry.simplify', simplify_points, (1000, 40000, 1000000), (1000, 40000)),
+    ('index.insert', index_insert, (1000, 100000, 1000000), (1000, 10000)),
+    ('index.query', index_query, (1000, 100000, 1000000), (1000, 10000)),
+    ('export.svg', export_svg, (1000, 100000, 1000000), (1000, 10000)),
+    ('export.png', export_png, (1000, 100000), (1000,)),
+)
+
+
+def size_label(size):
+    for factor, suffix in ((1000000, 'M'), (1000, 'k')):
+        if size >= factor and size % factor == 0:
+            return f'{size // factor}{suffix}'
+    return str(size)
+
+
+def percentile(samples, fraction):
+    """
+    Nearest-rank percentile of sorted samples.
+    """
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, max(0, math.ceil(fraction * len(samples)) - 1))]
+
+
+def run_benchmark(function, size, memory=True, min_time=0.2, max_rounds=10):
+    """
+    Run a workload and summarize its operations. Short workloads run again
+    until their operations took min_time seconds in total, so that their
+    numbers are not just noise.
+
+    :param function: function(timer, size)
+    :param size: size of the workload
+    :param memory: run it once more under tracemalloc to measure the peak memory
+    :param min_time: seconds of operations to collect
+    :param max_rounds: maximum number of runs for the timings
+    :return: dict of results
+    """
+    samples = array('d')
+    for rounds in range(1, max_rounds + 1):
+        gc.collect()
+        timer = Timer()
+        function(timer, size)
+        samples.extend(timer.samples)
+        if sum(samples) >= min_time:
+            break
+    samples = sorted(samples)
+    seconds = sum(samples)
+    result = {
+        'size': size,
+        'rounds': rounds,
+        'ops': len(samples),
+        'seconds': round(seconds, 6),
+        'ops_per_sec': round(len(samples) / seconds, 1) if seconds > 0 else None,
+        'p50_ms': round(percentile(samples, 0.5) * 1000, 4),
+        'p99_ms': round(percentile(samples, 0.99) * 1000, 4),
+        'max_ms': round(samples[-1] * 1000, 4) if samples else 0.0,
+        'peak_memory': None,
+    }
+    result.update(timer.counters)
+    del timer, samples
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            function(Timer(repeat=False), size)
+            result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def run_suite(quick=False, only=None, memory=True, file=sys.stdout):
+    """
+    Run the workloads, printing one line per benchmark as it ends.
+
+    :param quick: use the smaller sizes
+    :param only: run only the benchmarks whose name contains this text
+    :param memory: measure the peak memory too
+    :param file: where the progress is printed
+    :return: results dict, see save_results
+    """
+    results = {
+        'format': FORMAT_VERSION,
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'quick': quick,
+        'benchmarks': {},
+    }
+    with headless_tk():
+        for name, function, sizes, quick_sizes in WORKLOADS:
+            for size in quick_sizes if quick else sizes:
+                full_name = f'{name}.{size_label(size)}'
+                if only and only not in full_name:
+                    continue
+                result = results['benchmarks'][full_name] = run_benchmark(function, size, memory)
+                print(format_result(full_name, result), file=file, flush=True)
+    return results
+
+
+def format_result(name, result, baseline=None):
+    line = (f'{name:<26} {result["ops"]:>9} ops {result["ops_per_sec"] or 0:>13,.1f} ops/s'
+            f'  p50 {result["p50_ms"]:>9.3f} ms  p99 {result["p99_ms"]:>9.3f} ms')
+    if result.get('peak_memory') is not None:
+        line += f'  peak {result["peak_memory"] / 2 ** 20:8.1f} MiB'
+    if baseline is not None and baseline.get('ops_per_sec') and result.get('ops_per_sec'):
+        line += f'  {result["ops_per_sec"] / baseline["ops_per_sec"] - 1:+7.1%}'
+    return line
+
+
+def save_results(results, path):
+    """
+    Write results as JSON.
+
+    :return: None
+    """
+    with open(path, 'w') as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+        file.write('\n')
+
+
+def load_results(path):
+    with open(path) as file:
+        results = json.load(file)
+    if results.get('format') != FORMAT_VERSION:
+        raise ValueError(f'{path}: unknown benchmark format {results.get("format")}')
+    return results
+
+
+def compare(results, baseline, tolerance=0.15):
+    """
+    Compare the benchmarks present in both results.
+
+    A benchmark regresses when its ops/sec dropped, or its peak memory grew,
+    by more than tolerance. The p99 latency is shown but not judged, it is
+    too noisy on a busy machine.
+
+    :param results: dict returned by run_suite
+    :param baseline: dict loaded by load_results
+    :param tolerance: allowed relative change
+    :return: (report lines, names of the regressed benchmarks)
+    """
+    lines = []
+    regressed = []
+    previous = baseline['benchmarks']
+    for name, result in results['benchmarks'].items():
+        old = previous.get(name)
+        if old is None:
+            lines.append(f'{name:<26} new')
+            continue
+        problems = []
+        if old.get('ops_per_sec') and result.get('ops_per_sec') and \
+                result['ops_per_sec'] < old['ops_per_sec'] * (1 - tolerance):
+            problems.append('slower')
+        if old.get('peak_memory') and result.get('peak_memory') and \
+                result['peak_memory'] > old['peak_memory'] * (1 + tolerance):
+            problems.append('more memory')
+        if old.get('p99_ms') and result.get('p99_ms'):
+            p99 = f'  p99 {result["p99_ms"] / old["p99_ms"] - 1:+7.1%}'
+        else:
+            p99 = ''
+        line = format_result(name, result, old) + p99
+        if problems:
+            regressed.append(name)
+            line += '  REGRESSION: ' + ', '.join(problems)
+        lines.append(line)
+    return lines, regressed
+
+
+def main(out=None, baseline=None, quick=False, only=None, memory=True, tolerance=0.15):
+    """
+    Run the suite, save and compare the results.
+
+    :param out: JSON file receiving the results
+    :param baseline: JSON file of a previous run to compare with
+    :return: exit status, 1 when a benchmark regressed
+    """
+    previous = load_results(baseline) if baseline else None
+    results = run_suite(quick, only, memory)
+    if out:
+        save_results(results, out)
+    if previous is None:
+        return 0
+    lines, regressed = compare(results, previous, tolerance)
+    print(f'\nCompared with {baseline} ({previous["created"]}, python {previous["python"]}):')
+    print('\n'.join(lines))
+    if regressed:
+        print(f'{len(regressed)} benchmark(s) regressed by more than {tolerance:.0%}')
+        return 1
+    return 0
@@ -0,0 +1,603 @@
+"""
++----------------------------------------------------------------------------------------+
+|                                 This file is part of:                                  |
+|                                      DESENHANDO                                        |
+|                                 www.github.com/...                                     |
++----------------------------------------------------------------------------------------+
+|     Copyright (c) 2021 João Vitor, ...                                                 |
+|                                                                                        |
+|     Permission is hereby granted, free of charge, to any person obtaining a copy       |
+|     of this software and associated documentation files (the "Software"), to deal      |
+|     in the Software without restriction, including without limitation the rights       |
+|     to use, copy, modify, merge, publish, distribute, sublicense, and/or sell          |
+|     copies of the Software, and to permit persons to whom the Software is              |
+|     furnished to do so, subject to the following conditions:                           |
+|                                                                                        |
+|     The above copyright notice and this permission notice shall be included in         |
+|     all copies or substantial portions of the Software.                                |
+|                                                                                        |
+|     THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR         |
+|     IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,           |
+|     FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE        |
+|     AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER             |
+|     LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,      |
+|     OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN          |
+|     THE SOFTWARE.                                                                      |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+|                                         ABSTRACT                                       |
++----------------------------------------------------------------------------------------+
+| Boolean operations on polygons and clipping of polylines, used by the cut-out tool.    |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+
+A polygon is a list of rings, each one a flat coordinate list
+[x0, y0, x1, y1, ...] closed implicitly and filled with the even-odd rule,
+like Tk polygons. The edges of a polygon are kept in NumPy arrays and
+bucketed in a grid over its bounding box (Region), so a segment is only
+tested against the edges near it, many segments at a time.
+
+Boolean operations split the edges of both polygons where they cross, keep
+the pieces that the operation selects according to whether their middle
+lies inside the other polygon, and join the pieces back into rings at the
+crossings. Edges lying exactly on top of each other are not handled.
+"""
+
+import math
+from collections import defaultdict
+
+import numpy as np
+
+OPERATIONS = ('union', 'intersection', 'difference', 'xor')
+
+
+def _signed_area(points):
+    x, y = points[:, 0], points[:, 1]
+    return float(np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y)) / 2
+
+
+def _ring_array(ring):
+    points = np.asarray(ring, dtype=np.float64).reshape(-1, 2)
+    if len(points) > 1 and (points[0] == points[-1]).all():
+        points = points[:-1]
+    return points
+
+
+class Region:
+    """
+    A polygon prepared for many queries: crossings of segments with its
+    border and point containment. Its inside follows the even-odd rule, or
+    with nonzero the union of its rings, which may then overlap.
+    """
+
+    # Cells per side of the grid of edges
+    grid_size = 32
+    # Segment and edge pairs tested in one NumPy operation
+    chunk = 1 << 20
+
+    def __init__(self, rings, nonzero=False):
+        """
+        :param rings: list of flat coordinate lists
+        :param nonzero: a point is inside when it is inside any ring
+        """
+        starts = []
+        ends = []
+        self.rings = []
+        self.nonzero = nonzero
+        for ring in rings:
+            points = _ring_array(ring)
+            if len(points) < 3:
+                continue
+            if nonzero and _signed_area(points) < 0:
+                # All rings turn the same way, so their windings never cancel out
+                points = points[::-1]
+            self.rings.append(points)
+            starts.append(points)
+            ends.append(np.roll(points, -1, axis=0))
+        if not starts:
+            self.x1 = self.y1 = self.x2 = self.y2 = np.zeros(0)
+            self.bbox = None
+            self._cells = {}
+            return
+        start = np.concatenate(starts)
+        end = np.concatenate(ends)
+        self.x1, self.y1 = start[:, 0], start[:, 1]
+        self.x2, self.y2 = end[:, 0], end[:, 1]
+        self.bbox = (float(start[:, 0].min()), float(start[:, 1].min()),
+                     float(start[:, 0].max()), float(start[:, 1].max()))
+        self._cell = max(self.bbox[2] - self.bbox[0], self.bbox[3] - self.bbox[1], 1e-9) / self.grid_size
+        cells = defaultdict(list)
+        cx1, cy1 = self._cells_of(np.minimum(self.x1, self.x2), np.minimum(self.y1, self.y2))
+        cx2, cy2 = self._cells_of(np.maximum(self.x1, self.x2), np.maximum(self.y1, self.y2))
+        for edge, (a, b, c, d) in enumerate(zip(cx1.tolist(), cx2.tolist(), cy1.tolist(), cy2.tolist())):
+            for cy in range(c, d + 1):
+                for cx in range(a, b + 1):
+                    cells[cy * self.grid_size + cx].append(edge)
+        self._cells = {cell: np.array(edges) for cell, edges in cells.items()}
+
+    def __len__(self):
+        return len(self.x1)
+
+    def _cells_of(self, xs, ys):
+        last = self.grid_size - 1
+        return (np.clip(((xs - self.bbox[0]) / self._cell).astype(np.int64), 0, last),
+                np.clip(((ys - self.bbox[1]) / self._cell).astype(np.int64), 0, last))
+
+    def contains(self, xs, ys):
+        """
+        Containment test of many points.
+
+        :param xs: x coordinates
+        :param ys: y coordinates
+        :return: bool array
+        """
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        result = np.zeros(len(xs), dtype=bool)
+        if self.bbox is None or not len(xs):
+            return result
+        x1, y1, x2, y2 = self.bbox
+        candidates = np.flatnonzero((xs >= x1) & (xs <= x2) & (ys >= y1) & (ys <= y2))
+        ex1, ey1, ex2, ey2 = self.x1, self.y1, self.x2, self.y2
+        step = max(1, self.chunk // len(ex1))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for first in range(0, len(candidates), step):
+                index = candidates[first:first + step]
+                px = xs[index, None]
+                py = ys[index, None]
+                straddles = (ey1 > py) != (ey2 > py)
+                cross_x = ex1 + (py - ey1) * (ex2 - ex1) / (ey2 - ey1)
+                crossed = straddles & (px < cross_x)
+                if self.nonzero:
+                    result[index] = (crossed * np.where(ey2 > ey1, 1, -1)).sum(axis=1) != 0
+                else:
+                    result[index] = np.count_nonzero(crossed, axis=1) % 2 == 1
+        return result
+
+    def crossings(self, px1, py1, px2, py2):
+        """
+        Crossings of segments with the border. A crossing at the end of a
+        segment (or of an edge) is only reported for the next one, so
+        consecutive segments never report the same point twice.
+
+        :param px1: x of the first point of every segment (array)
+        :param py1: y of the first point of every segment
+        :param px2: x of the second point of every segment
+        :param py2: y of the second point of every segment
+        :return: (segment index, edge index, t along the segment, u along the edge) arrays
+        """
+        empty = np.zeros(0, dtype=np.int64)
+        if self.bbox is None or not len(px1):
+            return empty, empty, np.zeros(0), np.zeros(0)
+        x1, y1, x2, y2 = self.bbox
+        bx1, bx2 = np.minimum(px1, px2), np.maximum(px1, px2)
+        by1, by2 = np.minimum(py1, py2), np.maximum(py1, py2)
+        near = np.flatnonzero((bx2 >= x1) & (bx1 <= x2) & (by2 >= y1) & (by1 <= y2))
+        cx1, cy1 = self._cells_of(bx1[near], by1[near])
+        cx2, cy2 = self._cells_of(bx2[near], by2[near])
+        # Segments over at most 4 x 4 cells are tested in each cell they cover,
+        # the longer ones against every edge
+        short = (cx2 - cx1 < 4) & (cy2 - cy1 < 4)
+        segments = []
+        cells = []
+        for ox in range(4):
+            for oy in range(4):
+                covered = short & (cx1 + ox <= cx2) & (cy1 + oy <= cy2)
+                segments.append(near[covered])
+                cells.append((cy1[covered] + oy) * self.grid_size + cx1[covered] + ox)
+        segments = np.concatenate(segments)
+        cells = np.concatenate(cells)
+        order = np.argsort(cells, kind='stable')
+        segments, cells = segments[order], cells[order]
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(cells)) + 1, [len(cells)]))
+
+        found = []
+        segment = (px1, py1, px2, py2)
+        for first, last in zip(bounds[:-1], bounds[1:]):
+            if first == last:
+                continue
+            edges = self._cells.get(int(cells[first]))
+            if edges is not None:
+                found.append(self._intersect(segment, segments[first:last], edges))
+        long_segments = near[~short]
+        if len(long_segments):
+            found.append(self._intersect(segment, long_segments, np.arange(len(self.x1))))
+        if not found:
+            return empty, empty, np.zeros(0), np.zeros(0)
+        segment_index, edge_index, t, u = (np.concatenate(values) for values in zip(*found))
+        # A pair tested in several cells is reported once
+        unique = np.unique(segment_index * len(self.x1) + edge_index, return_index=True)[1]
+        return segment_index[unique], edge_index[unique], t[unique], u[unique]
+
+    def _intersect(self, segment, segments, edges):
+        px1, py1, px2, py2 = segment
+        ex1, ey1 = self.x1[edges], self.y1[edges]
+        sx, sy = self.x2[edges] - ex1, self.y2[edges] - ey1
+        results = []
+        step = max(1, self.chunk // len(edges))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for first in range(0, len(segments), step):
+                index = segments[first:first + step]
+                ax, ay = px1[index, None], py1[index, None]
+                rx, ry = px2[index, None] - ax, py2[index, None] - ay
+                denominator = rx * sy - ry * sx
+                qx, qy = ex1 - ax, ey1 - ay
+                t = (qx * sy - qy * sx) / denominator
+                u = (qx * ry - qy * rx) / denominator
+                i, j = np.nonzero((denominator != 0) & (t >= 0) & (t < 1) & (u >= 0) & (u < 1))
+                results.append((index[i], edges[j], t[i, j], u[i, j]))
+        return tuple(np.concatenate(values) for values in zip(*results))
+
+
+def _split_points(start, end, segment_index, t):
+    """
+    Crossing points grouped by segment and sorted along it.
+
+    :param start: (n, 2) array with the first point of every segment
+    :param end: (n, 2) array with the second point of every segment
+    :param segment_index: segment of every crossing
+    :param t: position of every crossing along its segment
+    :return: dict segment -> list of (t, (x, y))
+    """
+    splits = defaultdict(list)
+    points = start[segment_index] + (end[segment_index] - start[segment_index]) * t[:, None]
+    for segment, position, point in zip(segment_index.tolist(), t.tolist(), points.tolist()):
+        splits[segment].append((position, tuple(point)))
+    for values in splits.values():
+        values.sort()
+    return splits
+
+
+def _pieces(points, splits, offset=0):
+    """
+    Cut a polyline at its crossing points.
+
+    :param points: list of (x, y)
+    :param splits: dict global segment index -> sorted list of (t, (x, y))
+    :param offset: global index of the first segment of points
+    :return: list of point lists
+    """
+    pieces = []
+    current = [points[0]]
+    for index in range(len(points) - 1):
+        for position, point in splits.get(offset + index, ()):
+            if point != current[-1]:
+                current.append(point)
+            pieces.append(current)
+            current = [point]
+        if points[index + 1] != current[-1]:
+            current.append(points[index + 1])
+    pieces.append(current)
+    return [piece for piece in pieces if len(piece) > 1]
+
+
+def _middle(piece):
+    (x1, y1), (x2, y2) = piece[0], piece[1]
+    return (x1 + x2) / 2, (y1 + y2) / 2
+
+
+def clip_polylines(polylines, region, keep='outside'):
+    """
+    Cut polylines by a region.
+
+    :param polylines: list of flat coordinate lists
+    :param region: Region
+    :param keep: 'outside' removes the parts inside the region, 'inside' keeps only them
+    :return: list with, for every polyline, None when it stays whole, otherwise
+             the flat coordinate lists of its remaining pieces (maybe none)
+    """
+    inside = keep == 'inside'
+    arrays = [np.asarray(coords, dtype=np.float64).reshape(-1, 2) for coords in polylines]
+    results = [None] * len(polylines)
+    if not arrays:
+        return results
+    # Every polyline contributes at least one segment, a dot a zero length one
+    starts = [points if len(points) < 2 else points[:-1] for points in arrays]
+    ends = [points if len(points) < 2 else points[1:] for points in arrays]
+    counts = np.array([len(points) for points in starts])
+    offsets = np.concatenate(([0], np.cumsum(counts)))
+    start = np.concatenate(starts)
+    end = np.concatenate(ends)
+    segment_index, edge_index, t, u = region.crossings(start[:, 0], start[:, 1], end[:, 0], end[:, 1])
+
+    owners = np.searchsorted(offsets, segment_index, side='right') - 1
+    crossed = set(owners.tolist())
+    whole = [index for index in range(len(arrays)) if index not in crossed]
+    first = np.array([arrays[index][0] for index in whole]).reshape(-1, 2)
+    for index, contained in zip(whole, region.contains(first[:, 0], first[:, 1]).tolist()):
+        results[index] = None if contained == inside else []
+
+    if not crossed:
+        return results
+    splits = _split_points(start, end, segment_index, t)
+    candidates = []
+    for index in sorted(crossed):
+        points = [tuple(point) for point in arrays[index].tolist()]
+        for piece in _pieces(points, splits, offsets[index]):
+            candidates.append((index, piece))
+        results[index] = []
+    middles = np.array([_middle(piece) for index, piece in candidates]).reshape(-1, 2)
+    for (index, piece), contained in zip(candidates, region.contains(middles[:, 0], middles[:, 1]).tolist()):
+        if contained == inside:
+            results[index].append([c for point in piece for c in point])
+    return results
+
+
+def _ring_pieces(region, splits):
+    """
+    Cut every ring of a region at its crossing points. The piece that ends
+    at the first point of a ring and the one that starts there are joined.
+
+    :return: (list of open pieces, list of rings without crossings)
+    """
+    pieces = []
+    closed = []
+    offset = 0
+    for ring in region.rings:
+        points = [tuple(point) for point in ring.tolist()]
+        if any(offset + index in splits for index in range(len(points))):
+            ring_pieces = _pieces(points + points[:1], splits, offset)
+            starts_at_crossing = offset in splits and splits[offset][0][0] == 0
+            if len(ring_pieces) > 1 and not starts_at_crossing:
+                ring_pieces[0] = ring_pieces.pop()[:-1] + ring_pieces[0]
+            pieces.extend(ring_pieces)
+        else:
+            closed.append(points)
+        offset += len(points)
+    return pieces, closed
+
+
+def _select(pieces, closed, other, inside):
+    candidates = pieces + closed
+    if not candidates:
+        return [], []
+    middles = np.array([_middle(piece) for piece in candidates])
+    contained = other.contains(middles[:, 0], middles[:, 1]).tolist()
+    return ([piece for piece, flag in zip(pieces, contained) if flag == inside],
+            [ring for ring, flag in zip(closed, contained[len(pieces):]) if flag == inside])
+
+
+def _link(pieces):
+    """
+    Join open pieces into rings through their shared end points.
+
+    :return: list of point lists
+    """
+    ends = defaultdict(list)
+    for index, piece in enumerate(pieces):
+        ends[piece[0]].append(index)
+        ends[piece[-1]].append(index)
+    used = [False] * len(pieces)
+    rings = []
+    for first in range(len(pieces)):
+        if used[first]:
+            continue
+        used[first] = True
+        ring = list(pieces[first])
+        while ring[-1] != ring[0]:
+            following = next((index for index in ends[ring[-1]] if not used[index]), None)
+            if following is None:
+                break
+            used[following] = True
+            piece = pieces[following]
+            ring.extend(piece[1:] if piece[0] == ring[-1] else piece[-2::-1])
+        if ring[-1] == ring[0]:
+            ring.pop()
+        if len(ring) > 2:
+            rings.append(ring)
+    return rings
+
+
+def boolean(subject, clip, operation):
+    """
+    Boolean operation between two polygons.
+
+    :param subject: list of rings (flat coordinate lists)
+    :param clip: list of rings
+    :param operation: one of OPERATIONS
+    :return: list of rings of the result, to be filled with the even-odd rule
+    """
+    if operation not in OPERATIONS:
+        raise ValueError('unknown operation: {}'.format(operation))
+    a = subject if isinstance(subject, Region) else Region(subject)
+    b = clip if isinstance(clip, Region) else Region(clip)
+    if operation == 'xor':
+        # Under the even-odd rule the rings of both polygons together are their xor
+        return [ring.ravel().tolist() for ring in a.rings + b.rings]
+
+    a_index, b_index, t, u = b.crossings(a.x1, a.y1, a.x2, a.y2)
+    # The same point object splits both borders, so that the pieces meet exactly
+    a_splits = defaultdict(list)
+    b_splits = defaultdict(list)
+    x = a.x1[a_index] + (a.x2[a_index] - a.x1[a_index]) * t
+    y = a.y1[a_index] + (a.y2[a_index] - a.y1[a_index]) * t
+    for i, j, position_a, position_b, point in zip(a_index.tolist(), b_index.tolist(), t.tolist(), u.tolist(),
+                                                   zip(x.tolist(), y.tolist())):
+        a_splits[i].append((position_a, point))
+        b_splits[j].append((position_b, point))
+    for splits in (a_splits, b_splits):
+        for values in splits.values():
+            values.sort()
+
+    keep_a, keep_b = {'union': (False, False), 'intersection': (True, True),
+                      'difference': (False, True)}[operation]
+    a_pieces, a_closed = _select(*_ring_pieces(a, a_splits), b, keep_a)
+    b_pieces, b_closed = _select(*_ring_pieces(b, b_splits), a, keep_b)
+    rings = a_closed + b_closed + _link(a_pieces + b_pieces)
+    return [[c for point in ring for c in point] for ring in rings]
+
+
+def oval_ring(x1, y1, x2, y2, tolerance=0.25):
+    """
+    Polygon approximating the oval inscribed in a box, within tolerance pixels.
+
+    :return: flat coordinate list
+    """
+    rx, ry = abs(x2 - x1) / 2, abs(y2 - y1) / 2
+    radius = max(rx, ry, tolerance)
+    steps = max(8, min(1024, math.ceil(math.pi / math.acos(max(-1.0, 1 - tolerance / radius)))))
+    angles = np.linspace(0, 2 * math.pi, steps, endpoint=False)
+    points = np.empty((steps, 2))
+    points[:, 0] = (x1 + x2) / 2 + rx * np.cos(angles)
+    points[:, 1] = (y1 + y2) / 2 + ry * np.sin(angles)
+    return points.ravel().tolist()
+
+
+def capsule_ring(x1, y1, x2, y2, radius, tolerance=0.25):
+    """
+    Polygon of the points within radius of the segment (x1, y1) - (x2, y2),
+    as swept by a round eraser, within tolerance pixels.
+
+    :return: flat coordinate list
+    """
+    if x1 == x2 and y1 == y2:
+        return oval_ring(x1 - radius, y1 - radius, x1 + radius, y1 + radius, tolerance)
+    steps = max(4, min(512, math.ceil(math.pi / 2 / math.acos(max(-1.0, 1 - tolerance / max(radius, tolerance))))))
+    direction = math.atan2(y2 - y1, x2 - x1)
+    angles = direction - math.pi / 2 + np.linspace(0, math.pi, steps + 1)
+    points = np.empty((2 * (steps + 1), 2))
+    points[:steps + 1, 0] = x2 + radius * np.cos(angles)
+    points[:steps + 1, 1] = y2 + radius * np.sin(angles)
+    points[steps + 1:, 0] = x1 - radius * np.cos(angles)
+    points[steps + 1:, 1] = y1 - radius * np.sin(angles)
+    return points.ravel().tolist()
+
+
+def capsule_chain(points, radius, tolerance=0.25):
+    """
+    Rings of the area swept by a round eraser along a path: one capsule per
+    segment, or a disc for a single point. They overlap, use them as a
+    nonzero Region.
+
+    :param points: list of (x, y)
+    :return: list of flat coordinate lists
+    """
+    if len(points) == 1:
+        (x, y), = points
+        return [capsule_ring(x, y, x, y, radius, tolerance)]
+    return [capsule_ring(x1, y1, x2, y2, radius, tolerance) for (x1, y1), (x2, y2) in zip(points, points[1:])]
+
+
+def item_rings(kind, coords):
+    """
+    Area of a filled item as a polygon.
+
+    :param kind: 'rectangle', 'oval' or 'polygon'
+    :param coords: coordinates of the item
+    :return: list of rings
+    """
+    if kind == 'rectangle':
+        x1, y1, x2, y2 = coords[:4]
+        return [[x1, y1, x2, y1, x2, y2, x1, y2]]
+    if kind == 'oval':
+        return [oval_ring(*coords[:4])]
+    if kind == 'polygon':
+        return [list(coords)]
+    raise ValueError('{} items have no area'.format(kind))
+
+
+def join_rings(rings):
+    """
+    Several rings as a single polygon with the same even-odd area: every ring
+    is reached from the first point through a bridge walked there and back,
+    so the bridges cancel out.
+
+    :return: flat coordinate list
+    """
+    if not rings:
+        return []
+    anchor = list(rings[0][:2])
+    joined = list(rings[0]) + anchor
+    for ring in rings[1:]:
+        joined += list(ring) + list(ring[:2]) + anchor
+    return joined
+
+
+def _as_polygon(kind, options):
+    """
+    Options of a rectangle or oval turned into a polygon, which has other
+    defaults in Tk: a black fill and no outline.
+    """
+    options = dict(options)
+    if kind != 'polygon':
+        options.setdefault('fill', '')
+        options.setdefault('outline', '#000000')
+    return options
+
+
+def _area_pieces(rings, options):
+    """
+    New items for the rings left of a filled item. A single polygon can not
+    have holes and draw them with its outline, so several rings become a
+    polygon without outline plus a closed line for every ring.
+
+    :return: list of (kind, coords, options)
+    """
+    if len(rings) == 1:
+        return [('polygon', rings[0], options)]
+    outline = options.get('outline', '')
+    if not outline:
+        return [('polygon', join_rings(rings), options)]
+    fill = dict(options, outline='')
+    fill.pop('width', None)
+    pieces = [('polygon', join_rings(rings), fill)] if fill.get('fill', '#000000') else []
+    line = {'fill': outline, 'width': options.get('width', 1.0), 'joinstyle': 'miter'}
+    return pieces + [('line', ring + ring[:2], dict(line)) for ring in rings]
+
+
+def _inside(region, bbox):
+    """
+    Whether a bounding box lies entirely inside the region.
+    """
+    x1, y1, x2, y2 = bbox
+    xs = np.array([x1, x2, x2, x1], dtype=np.float64)
+    ys = np.array([y1, y1, y2, y2], dtype=np.float64)
+    if not region.contains(xs, ys).all():
+        return False
+    return not len(region.crossings(xs, ys, np.roll(xs, -1), np.roll(ys, -1))[0])
+
+
+def cut(items, rings, operation='difference', nonzero=False):
+    """
+    Apply a boolean operation between document items and a polygon.
+
+    Filled items (rectangles, ovals and polygons) are combined with the
+    polygon and come back as polygons. Lines are cut along their center
+    line: 'difference' removes their parts inside the polygon,
+    'intersection' keeps only those, the other operations leave them alone.
+    Texts are removed when they leave the kept area.
+
+    :param items: document items
+    :param rings: the polygon, a list of flat coordinate lists
+    :param operation: one of OPERATIONS
+    :param nonzero: the polygon is the union of overlapping rings (eg. a
+                    capsule_chain); only lines can be cut by such a polygon
+    :return: dict item id -> list of (kind, coords, options) replacing the
+             item (empty to delete it), only for the items that change
+    """
+    if operation not in OPERATIONS:
+        raise ValueError('unknown operation: {}'.format(operation))
+    if nonzero and any(item.kind != 'line' for item in items):
+        raise ValueError('only lines can be cut by a nonzero polygon')
+    region = Region(rings, nonzero)
+    changes = {}
+    lines = [item for item in items if item.kind == 'line']
+    if lines and operation in ('difference', 'intersection'):
+        keep = 'outside' if operation == 'difference' else 'inside'
+        for item, pieces in zip(lines, clip_polylines([item.coords for item in lines], region, keep)):
+            if pieces is not None:
+                changes[item.id] = [('line', piece, item.options) for piece in pieces]
+    for item in items:
+        if item.kind in ('rectangle', 'oval', 'polygon'):
+            subject = item_rings(item.kind, item.coords)
+            if operation in ('union', 'xor') and not boolean(subject, region, 'intersection'):
+                # Only the items the polygon touches are combined with it
+                continue
+            result = boolean(subject, region, operation)
+            if len(result) == 1 and result[0] == [float(c) for c in subject[0]]:
+                continue
+            changes[item.id] = _area_pieces(result, _as_polygon(item.kind, item.options)) if result else []
+        elif item.kind == 'text' and operation in ('difference', 'intersection'):
+            if _inside(region, item.bbox) == (operation == 'difference'):
+                changes[item.id] = []
+    return changes
@@ -0,0 +1,493 @@
+"""
++----------------------------------------------------------------------------------------+
+|                                 This file is part of:                                  |
+|                                      DESENHANDO                                        |
+|                                 www.github.com/...                                     |
++----------------------------------------------------------------------------------------+
+|     Copyright (c) 2021 João Vitor, ...                                                 |
+|                                                                                        |
+|     Permission is hereby granted, free of charge, to any person obtaining a copy       |
+|     of this software and associated documentation files (the "Software"), to deal      |
+|     in the Software without restriction, including without limitation the rights       |
+|     to use, copy, modify, merge, publish, distribute, sublicense, and/or sell          |
+|     copies of the Software, and to permit persons to whom the Software is              |
+|     furnished to do so, subject to the following conditions:                           |
+|                                                                                        |
+|     The above copyright notice and this permission notice shall be included in         |
+|     all copies or substantial portions of the Software.                                |
+|                                                                                        |
+|     THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR         |
+|     IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,           |
+|     FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE        |
+|     AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER             |
+|     LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,      |
+|     OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN          |
+|     THE SOFTWARE.                                                                      |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+|                                         ABSTRACT                                       |
++----------------------------------------------------------------------------------------+
+| Retained document model of the drawing, mirrored by the canvas.                        |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+"""
+
+import math
+
+from lib.geometry import coords_bbox, simplify
+from lib.spatial_index import QuadTree
+
+
+class Item:
+    """
+    A shape of the drawing: its kind ('line', 'rectangle', 'oval', 'polygon'
+    or 'text'), a flat coordinate list in page pixels, the canvas options and
+    the id of the layer it belongs to.
+    """
+
+    __slots__ = ('id', 'kind', 'coords', 'options', 'bbox', 'layer')
+
+    def __init__(self, id_, kind, coords, options, bbox, layer=None):
+        self.id = id_
+        self.kind = kind
+        self.coords = coords
+        self.options = options
+        self.bbox = bbox
+        self.layer = layer
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.id}, {self.kind!r}, {len(self.coords) // 2} points)'
+
+
+def item_bbox(kind, coords, options):
+    """
+    Estimate the area covered by an item, including half the line width.
+
+    Text has no real extent until Tk lays it out, so it gets a rough box
+    from the font size and the number of characters.
+    """
+    if kind == 'text':
+        x, y = coords[0], coords[1]
+        size = _font_size(options.get('font'))
+        lines = str(options.get('text', '')).split('\n')
+        half_w = max(len(line) for line in lines) * size * 0.35
+        half_h = len(lines) * size * 0.75
+        return x - half_w, y - half_h, x + half_w, y + half_h
+    return coords_bbox(coords, pad=float(options.get('width', 1)) / 2 + 1)
+
+
+def _font_size(font):
+    if isinstance(font, (tuple, list)) and len(font) > 1:
+        return abs(int(font[1]))
+    return 12
+
+
+class Layer:
+    """
+    A layer of the drawing. Its revision grows every time one of its items
+    changes, which lets caches of the layer know when they are stale.
+    """
+
+    __slots__ = ('id', 'name', 'visible', 'locked', 'opacity', 'revision', 'index')
+
+    def __init__(self, id_, name):
+        self.id = id_
+        self.name = name
+        self.visible = True
+        self.locked = False
+        self.opacity = 1.0
+        self.revision = 0
+        self.index = QuadTree()
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.id}, {self.name!r})'
+
+
+class Document:
+    """
+    Retained model of the drawing.
+
+    The canvas only mirrors what is stored here. Items belong to layers and
+    every layer keeps its items in a spatial index, so that hit-testing does
+    not depend on the number of items in the drawing.
+    """
+
+    def __init__(self, width=1024, height=720):
+        self.width = width
+        self.height = height
+        self._items = {}
+        self._next_id = 1
+        self._lod_cache = {}
+
+        # Layers from the bottom to the top
+        self.layers = []
+        self._layers = {}
+        self._positions = {}
+        self._next_layer_id = 1
+        self.active_layer = self.add_layer()
+
+        # Items of an opened file that were not decoded yet (see attach_source)
+        self._source = None
+        # Items added, changed or removed since mark_saved; None after clear()
+        self._changed = set()
+
+    def __len__(self):
+        pending = self._source.pending_items if self._source is not None else 0
+        return len(self._items) + pending
+
+    def __iter__(self):
+        """
+        Items from the bottom to the top of the stacking order.
+        """
+        items = self._items
+        return iter([items[item_id] for item_id in self.ids()])
+
+    def __contains__(self, item_id):
+        return item_id in self._items or self._load_item(item_id)
+
+    def get(self, item_id):
+        if item_id not in self._items:
+            self._load_item(item_id)
+        return self._items[item_id]
+
+    def ids(self):
+        """
+        Snapshot of the item ids from the bottom to the top of the stacking order.
+        """
+        self.load()
+        if len(self.layers) == 1:
+            return sorted(self._items)
+        return sorted(self._items, key=self.stacking_key)
+
+    def layer_ids(self, layer_id):
+        """
+        Ids of the items of a layer, from the bottom to the top.
+        """
+        self.load()
+        return sorted(item.id for item in self._items.values() if item.layer == layer_id)
+
+    def stacking_key(self, item_id):
+        """
+        Sort key placing items by layer, then by creation order.
+        """
+        return self._positions[self._items[item_id].layer], item_id
+
+    def resize(self, width, height):
+        self.width = width
+        self.height = height
+
+    @property
+    def next_id(self):
+        return self._next_id
+
+    def changed_items(self):
+        """
+        Ids of the items added, changed or removed since the last mark_saved,
+        or None when everything must be considered changed.
+
+        :return: set or None
+        """
+        return None if self._changed is None else set(self._changed)
+
+    def mark_saved(self):
+        self._changed = set()
+
+    def _touch(self, item_id):
+        if self._changed is not None:
+            self._changed.add(item_id)
+
+    def attach_source(self, source):
+        """
+        Let items be decoded only when a query first reaches them.
+
+        :param source: object with pending_items, next_id, load(bbox), which
+                       returns the not yet decoded Items whose chunks intersect
+                       bbox (all of them when bbox is None), and load_item(id),
+                       which returns the ones decoded along with an item
+        :return: None
+        """
+        self._source = source
+        self._next_id = max(self._next_id, source.next_id)
+
+    def load(self, bbox=None):
+        """
+        Decode the pending items of the attached source inside bbox (default: all of them).
+
+        :return: None
+        """
+        if self._source is not None:
+            self._add_loaded(self._source.load(bbox))
+
+    def _load_item(self, item_id):
+        """
+        Decode the pending items stored with an item.
+
+        :return: True when the item exists
+        """
+        if self._source is None:
+            return False
+        self._add_loaded(self._source.load_item(item_id))
+        return item_id in self._items
+
+    def _add_loaded(self, items):
+        for item in items:
+            self._items[item.id] = item
+            if item.bbox is not None:
+                self._layers[item.layer].index.insert(item.id, item.bbox)
+        if not self._source.pending_items:
+            self._source = None
+
+    def restore_layers(self, layers, active_id):
+        """
+        Replace the layers of an empty document, eg. by the ones of a saved drawing.
+
+        :param layers: Layer objects from the bottom to the top
+        :param active_id: id of the active layer
+        :return: None
+        """
+        if self._items:
+            raise ValueError('layers can only be restored on an empty document')
+        self.layers = list(layers)
+        self._layers = {layer.id: layer for layer in self.layers}
+        self._next_layer_id = max(self._layers) + 1
+        self._update_positions()
+        self.active_layer = self._layers[active_id]
+
+    def get_layer(self, layer_id):
+        return self._layers[layer_id]
+
+    def add_layer(self, name=None, position=None, layer_id=None):
+        """
+        Create an empty layer.
+
+        :param name: layer name (default: 'Layer N')
+        :param position: index in the stack, counted from the bottom (default: top)
+        :param layer_id: id of a layer being restored (default: a new id)
+        :return: Layer
+        """
+        if layer_id is None:
+            layer_id = self._next_layer_id
+        elif layer_id in self._layers:
+            raise ValueError(f'layer {layer_id} already exists')
+        self._next_layer_id = max(self._next_layer_id, layer_id + 1)
+        layer = Layer(layer_id, name or f'Layer {layer_id}')
+        self._layers[layer.id] = layer
+        self.layers.insert(len(self.layers) if position is None else position, layer)
+        self._update_positions()
+        return layer
+
+    def remove_layer(self, layer_id):
+        """
+        Delete a layer and all of its items. The last layer can not be removed.
+        The drawing area removes the items first (see LayerStack.remove), so
+        that the history records them.
+
+        :return: None
+        """
+        if len(self.layers) == 1:
+            raise ValueError('a document needs at least one layer')
+        self.load()
+        layer = self._layers.pop(layer_id)
+        for item_id in [item.id for item in self._items.values() if item.layer == layer_id]:
+            del self._items[item_id]
+            self._lod_cache.pop(item_id, None)
+            self._touch(item_id)
+        position = self._positions[layer_id]
+        self.layers.remove(layer)
+        self._update_positions()
+        if self.active_layer is layer:
+            self.active_layer = self.layers[min(position, len(self.layers) - 1)]
+
+    def move_layer(self, layer_id, position):
+        """
+        Move a layer to another index of the stack, counted from the bottom.
+
+        :return: None
+        """
+        layer = self._layers[layer_id]
+        self.layers.remove(layer)
+        self.layers.insert(max(0, min(position, len(self.layers))), layer)
+        self._update_positions()
+
+    def layer_position(self, layer_id):
+        return self._positions[layer_id]
+
+    def configure_layer(self, layer_id, **options):
+        """
+        Change name, visible, locked or opacity of a layer.
+
+        :return: None
+        """
+        layer = self._layers[layer_id]
+        for key, value in options.items():
+            if key not in ('name', 'visible', 'locked', 'opacity'):
+                raise AttributeError(f'layers have no option {key!r}')
+            setattr(layer, key, value)
+
+    def set_active_layer(self, layer_id):
+        self.active_layer = self._layers[layer_id]
+
+    def add(self, kind, coords, layer=None, item_id=None, **options):
+        """
+        Add a new item on top of a layer.
+
+        :param kind: canvas item type
+        :param coords: flat coordinate list
+        :param layer: id of the layer (default: the active layer)
+        :param item_id: id of an item being restored (eg. by undo); it keeps its old stacking position
+        :param options: canvas options (fill, width, ...)
+        :return: id of the new item
+        """
+        layer = self.active_layer if layer is None else self._layers[layer]
+        if item_id is None:
+            item_id = self._next_id
+            self._next_id += 1
+        elif item_id in self._items:
+            raise ValueError(f'item {item_id} already exists')
+        else:
+            self._next_id = max(self._next_id, item_id + 1)
+        coords = list(coords)
+        item = Item(item_id, kind, coords, options, item_bbox(kind, coords, options), layer.id)
+        self._items[item_id] = item
+        if item.bbox is not None:
+            layer.index.insert(item_id, item.bbox)
+        layer.revision += 1
+        self._touch(item_id)
+        return item_id
+
+    def set_coords(self, item_id, coords):
+        item = self.get(item_id)
+        item.coords = list(coords)
+        self._lod_cache.pop(item_id, None)
+        self._touch(item_id)
+        self._reindex(item)
+
+    def lod_coords(self, item_id, scale):
+        """
+        Coordinates of a line or polygon simplified for display at scale.
+
+        Zoom levels are grouped in powers of two and each simplified version
+        is cached until the item changes, so zooming out never pushes the
+        full resolution geometry to Tk.
+
+        :param item_id: document id
+        :param scale: display scale (1.0 = 100%)
+        :return: flat coordinate list in page pixels
+        """
+        item = self.get(item_id)
+        if scale >= 1 or item.kind not in ('line', 'polygon') or len(item.coords) <= 8:
+            return item.coords
+        level = math.ceil(-math.log2(scale))
+        levels = self._lod_cache.setdefault(item_id, {})
+        coords = levels.get(level)
+        if coords is None:
+            # Half a screen pixel at the most zoomed in scale of the level
+            coords = levels[level] = simplify(item.coords, 0.5 * 2 ** level)
+        return coords
+
+    def configure(self, item_id, **options):
+        item = self.get(item_id)
+        item.options.update(options)
+        self._touch(item_id)
+        if 'width' in options or 'text' in options or 'font' in options:
+            self._reindex(item)
+        else:
+            self._layers[item.layer].revision += 1
+
+    def set_bbox(self, item_id, bbox):
+        """
+        Replace the estimated bounding box by the real one (eg. measured by Tk).
+        """
+        item = self.get(item_id)
+        item.bbox = tuple(bbox)
+        self._touch(item_id)
+        self._layers[item.layer].index.update(item_id, item.bbox)
+
+    def remove(self, item_id):
+        if item_id not in self._items:
+            self._load_item(item_id)
+        item = self._items.pop(item_id, None)
+        if item is not None:
+            layer = self._layers[item.layer]
+            layer.index.remove(item_id)
+            layer.revision += 1
+            self._lod_cache.pop(item_id, None)
+            self._touch(item_id)
+        return item
+
+    def clear(self):
+        self._source = None
+        self._changed = None
+        self._items.clear()
+        self._lod_cache.clear()
+        for layer in self.layers:
+            layer.index.clear()
+            layer.revision += 1
+
+    def snapshot(self):
+        """
+        Independent copy of the drawing, safe to read from another thread while
+        this one keeps being edited. Coordinate lists are shared, since they are
+        replaced and never changed in place.
+
+        :return: Document
+        """
+        self.load()
+        copy = Document(self.width, self.height)
+        layers = []
+        for layer in self.layers:
+            new = Layer(layer.id, layer.name)
+            new.visible, new.locked, new.opacity, new.revision = \
+                layer.visible, layer.locked, layer.opacity, layer.revision
+            layers.append(new)
+        copy.restore_layers(layers, self.active_layer.id)
+        copy._next_layer_id = self._next_layer_id
+        copy._next_id = self._next_id
+        for item_id, item in self._items.items():
+            copy._items[item_id] = Item(item_id, item.kind, item.coords, dict(item.options), item.bbox, item.layer)
+            if item.bbox is not None:
+                copy._layers[item.layer].index.insert(item_id, item.bbox)
+        return copy
+
+    def find_overlapping(self, x1, y1, x2, y2, layers=None):
+        """
+        Items whose bounding box intersects the rectangle, bottom first.
+
+        :param layers: ids of the layers to search (default: all)
+        :return: list of item ids
+        """
+        bbox = (min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+        self.load(bbox)
+        return self._query(lambda index: index.query(bbox), layers)
+
+    def find_at(self, x, y, halo=0, layers=None):
+        """
+        Items whose bounding box is within halo of the point, bottom first.
+
+        :param layers: ids of the layers to search (default: all)
+        :return: list of item ids
+        """
+        self.load((x - halo, y - halo, x + halo, y + halo))
+        return self._query(lambda index: index.query_point(x, y, halo), layers)
+
+    def _query(self, query, layers):
+        if layers is None:
+            layers = [layer.id for layer in self.layers]
+        else:
+            layers = sorted(layers, key=self._positions.__getitem__)
+        found = []
+        for layer_id in layers:
+            found.extend(sorted(query(self._layers[layer_id].index)))
+        return found
+
+    def _reindex(self, item):
+        layer = self._layers[item.layer]
+        layer.revision += 1
+        item.bbox = item_bbox(item.kind, item.coords, item.options)
+        if item.bbox is None:
+            layer.index.remove(item.id)
+        else:
+            layer.index.update(item.id, item.bbox)
+
+    def _update_positions(self):
+        self._positions = {layer.id: position for position, layer in enumerate(self.layers)}
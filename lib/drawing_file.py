@@ -0,0 +1,599 @@
+"""
++----------------------------------------------------------------------------------------+
+|                                 This file is part of:                                  |
+|                                      DESENHANDO                                        |
+|                                 www.github.com/...                                     |
++----------------------------------------------------------------------------------------+
+|     Copyright (c) 2021 João Vitor, ...                                                 |
+|                                                                                        |
+|     Permission is hereby granted, free of charge, to any person obtaining a copy       |
+|     of this software and associated documentation files (the "Software"), to deal      |
+|     in the Software without restriction, including without limitation the rights       |
+|     to use, copy, modify, merge, publish, distribute, sublicense, and/or sell          |
+|     copies of the Software, and to permit persons to whom the Software is              |
+|     furnished to do so, subject to the following conditions:                           |
+|                                                                                        |
+|     The above copyright notice and this permission notice shall be included in         |
+|     all copies or substantial portions of the Software.                                |
+|                                                                                        |
+|     THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR         |
+|     IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,           |
+|     FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE        |
+|     AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER             |
+|     LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,      |
+|     OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN          |
+|     THE SOFTWARE.                                                                      |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+|                                         ABSTRACT                                       |
++----------------------------------------------------------------------------------------+
+| Native .desenhando file format: packed coordinates in spatial chunks, lazily decoded.  |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+
+File layout (little endian):
+
+    two header slots of HEADER_SIZE bytes, the valid one with the highest
+    generation wins: magic, version, flags, generation, index offset,
+    index length, CRC32 of the previous fields
+    chunks: item table (ITEM_DTYPE records) followed by float32 coordinates
+    optional pixel layer: zlib compressed RGBA rows
+    index: UTF-8 JSON with the page, layers, styles and chunk list
+
+Each chunk holds the items of one layer around the same tile of the page,
+so a view only needs the chunks whose bounding box it intersects.
+
+Saving again appends only the chunks holding changed items, the pixel layer
+when it changed and a new index, then writes the header into the slot that
+is not current (shadow paging). A crash at any point leaves the previous
+header, and everything it points to, untouched.
+"""
+
+import json
+import mmap
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from lib.document import Document, Item, Layer
+from lib.raster import RasterLayer
+from lib.spatial_index import QuadTree
+
+EXTENSION = '.desenhando'
+MAGIC = b'DESENHO\x00'
+VERSION = 1
+HEADER = struct.Struct('<8sHHQQQ')
+HEADER_SIZE = 64
+DATA_START = 2 * HEADER_SIZE
+
+KINDS = ('line', 'rectangle', 'oval', 'polygon', 'text')
+ITEM_DTYPE = np.dtype([('id', '<u4'), ('kind', 'u1'), ('style', '<u4'), ('start', '<u4'),
+                       ('count', '<u4'), ('bbox', '<f4', (4,))])
+CHUNK_HEADER = struct.Struct('<II')
+
+# Items are grouped by the tile of the page holding their center
+TILE_SIZE = 512
+MAX_CHUNK_ITEMS = 4096
+MAX_CHUNK_POINTS = 1 << 17
+
+
+class FormatError(Exception):
+    pass
+
+
+def pack_header(generation, index_offset, index_length):
+    data = HEADER.pack(MAGIC, VERSION, 0, generation, index_offset, index_length)
+    return (data + struct.pack('<I', zlib.crc32(data))).ljust(HEADER_SIZE, b'\x00')
+
+
+def read_header(data):
+    """
+    Most recent valid header slot.
+
+    :param data: the file contents (bytes or mmap)
+    :return: (generation, index offset, index length, slot number)
+    """
+    best = None
+    for slot in range(2):
+        raw = data[slot * HEADER_SIZE:slot * HEADER_SIZE + HEADER.size + 4]
+        if len(raw) < HEADER.size + 4:
+            continue
+        magic, version, flags, generation, offset, length = HEADER.unpack(raw[:HEADER.size])
+        if magic != MAGIC or struct.unpack('<I', raw[HEADER.size:])[0] != zlib.crc32(raw[:HEADER.size]):
+            continue
+        if version > VERSION:
+            raise FormatError(f'file version {version} is newer than this program')
+        if best is None or generation > best[0]:
+            best = generation, offset, length, slot
+    if best is None:
+        raise FormatError('not a Desenhando drawing')
+    return best
+
+
+def plain(value):
+    """
+    Option value that survives JSON: tuples become lists.
+    """
+    return list(value) if isinstance(value, tuple) else value
+
+
+def encode_chunk(items, styles):
+    """
+    Serialize items of one layer.
+
+    :param items: list of Item
+    :param styles: dict mapping the JSON text of an options dict to its index, extended as needed
+    :return: (bytes, bbox), bbox None when no item has one
+    """
+    table = np.zeros(len(items), dtype=ITEM_DTYPE)
+    coords = np.empty(sum(len(item.coords) for item in items), dtype='<f4')
+    start = 0
+    for record, item in zip(table, items):
+        key = json.dumps({name: plain(value) for name, value in item.options.items()}, sort_keys=True)
+        style = styles.setdefault(key, len(styles))
+        count = len(item.coords)
+        coords[start:start + count] = item.coords
+        record['id'], record['kind'], record['style'] = item.id, KINDS.index(item.kind), style
+        record['start'], record['count'] = start, count
+        record['bbox'] = item.bbox if item.bbox is not None else (np.nan,) * 4
+        start += count
+    boxes = table['bbox']
+    bbox = None
+    if not np.isnan(boxes[:, 0]).all():
+        bbox = (float(np.nanmin(boxes[:, 0])), float(np.nanmin(boxes[:, 1])),
+                float(np.nanmax(boxes[:, 2])), float(np.nanmax(boxes[:, 3])))
+    return CHUNK_HEADER.pack(len(items), len(coords)) + table.tobytes() + coords.tobytes(), bbox
+
+
+def decode_chunk(data, layer_id, styles):
+    """
+    Items of a chunk written by encode_chunk.
+
+    :param data: buffer with the chunk
+    :param layer_id: layer of the chunk
+    :param styles: list of option dicts of the file
+    :return: list of Item
+    """
+    count, points = CHUNK_HEADER.unpack_from(data)
+    table = np.frombuffer(data, dtype=ITEM_DTYPE, count=count, offset=CHUNK_HEADER.size)
+    coords = np.frombuffer(data, dtype='<f4', count=points, offset=CHUNK_HEADER.size + table.nbytes)
+    # One conversion for the whole chunk, then plain list slices
+    values = coords.astype(np.float64).tolist()
+    boxes = table['bbox'].astype(np.float64).tolist()
+    items = []
+    for (item_id, kind, style, start, size), bbox in zip(
+            table[['id', 'kind', 'style', 'start', 'count']].tolist(), boxes):
+        items.append(Item(item_id, KINDS[kind], values[start:start + size], dict(styles[style]),
+                          None if bbox[0] != bbox[0] else tuple(bbox), layer_id))
+    return items
+
+
+def chunk_items(document, layer):
+    """
+    Items of a layer grouped in chunks of neighbour items.
+
+    :return: iterator of lists of Item
+    """
+    return group_items(document.get(item_id) for item_id in document.layer_ids(layer.id))
+
+
+def group_items(items):
+    """
+    Items of the same layer grouped in chunks by the tile holding their center.
+    Items without a bounding box (eg. an empty text) go to chunks of their own,
+    written last.
+
+    :param items: iterable of Item
+    :return: iterator of lists of Item
+    """
+    tiles = {}
+    unplaced = []
+    for item in items:
+        if item.bbox is None:
+            unplaced.append(item)
+            continue
+        x1, y1, x2, y2 = item.bbox
+        key = int((y1 + y2) / 2 // TILE_SIZE), int((x1 + x2) / 2 // TILE_SIZE)
+        tiles.setdefault(key, []).append(item)
+    groups = [tiles[key] for key in sorted(tiles)]
+    if unplaced:
+        groups.append(unplaced)
+    for group in groups:
+        chunk, points = [], 0
+        for item in group:
+            if chunk and (len(chunk) >= MAX_CHUNK_ITEMS or points + len(item.coords) > MAX_CHUNK_POINTS):
+                yield chunk
+                chunk, points = [], 0
+            chunk.append(item)
+            points += len(item.coords)
+        if chunk:
+            yield chunk
+
+
+class FileLayout:
+    """
+    Where the parts of a saved document live inside its file, kept after a
+    save or an open so that save_changes can append only what changed.
+    """
+
+    def __init__(self, path, generation, slot, size):
+        self.path = path
+        self.generation = generation
+        self.slot = slot
+        self.size = size
+        # Chunk number -> index entry [layer, offset, length, crc, count, x1, y1, x2, y2]
+        self.chunks = {}
+        # Item ids of the chunks written or decoded in this session, and the reverse mapping
+        self.members = {}
+        self.owner = {}
+        # JSON text of an options dict -> its index in the style list of the file
+        self.styles = {}
+        self.raster = None
+        self.raster_key = None
+        self.index_length = 0
+        self._next_chunk = 0
+
+    @property
+    def garbage(self):
+        """
+        Bytes of the file no longer referenced by the current index.
+        """
+        live = sum(entry[2] for entry in self.chunks.values()) + self.index_length
+        if self.raster is not None:
+            live += self.raster[1]
+        return self.size - DATA_START - live
+
+    def add_chunk(self, entry, item_ids=None):
+        number = self._next_chunk
+        self._next_chunk += 1
+        self.chunks[number] = entry
+        if item_ids is not None:
+            self.add_members(number, item_ids)
+        return number
+
+    def add_members(self, number, item_ids):
+        self.members[number] = item_ids
+        for item_id in item_ids:
+            self.owner[item_id] = number
+
+    def drop_chunk(self, number):
+        del self.chunks[number]
+        for item_id in self.members.pop(number, ()):
+            if self.owner.get(item_id) == number:
+                del self.owner[item_id]
+
+    def track_raster(self, raster):
+        """
+        Remember the state of the pixel layer matching the saved one.
+
+        :param raster: RasterLayer or None
+        :return: None
+        """
+        self.raster_key = None if raster is None else (id(raster.pixels), raster.revision)
+
+    def raster_changed(self, raster):
+        if raster is None:
+            return self.raster is not None
+        return (id(raster.pixels), raster.revision) != self.raster_key
+
+
+def _write_chunks(file, offset, layer_id, items, layout):
+    """
+    Append the chunks of items of one layer and register them in layout.
+
+    :return: offset after the last chunk
+    """
+    for chunk in group_items(items):
+        data, bbox = encode_chunk(chunk, layout.styles)
+        file.write(data)
+        layout.add_chunk([layer_id, offset, len(data), zlib.crc32(data), len(chunk)] + list(bbox or (None,) * 4),
+                         [item.id for item in chunk])
+        offset += len(data)
+    return offset
+
+
+def _write_raster(file, offset, raster, layout):
+    """
+    Append the pixel layer, unless it is fully transparent.
+
+    :return: offset after the pixels
+    """
+    layout.raster = None
+    if raster is not None and raster.pixels[..., 3].any():
+        data = zlib.compress(raster.pixels.tobytes(), 6)
+        file.write(data)
+        layout.raster = [offset, len(data), raster.width, raster.height]
+        offset += len(data)
+    layout.track_raster(raster)
+    return offset
+
+
+def _encode_index(document, layout):
+    return json.dumps({
+        'width': document.width,
+        'height': document.height,
+        'layers': [{'id': layer.id, 'name': layer.name, 'visible': layer.visible,
+                    'locked': layer.locked, 'opacity': layer.opacity} for layer in document.layers],
+        'active': document.active_layer.id,
+        'next_id': document.next_id,
+        'styles': [json.loads(key) for key in sorted(layout.styles, key=layout.styles.get)],
+        'chunks': [layout.chunks[number] for number in sorted(layout.chunks)],
+        'raster': layout.raster,
+    }, separators=(',', ':')).encode('utf-8')
+
+
+def save_drawing(document, path, raster=None):
+    """
+    Write a document (and its pixel layer) as a .desenhando file. The file
+    is written next to path and renamed over it once complete.
+
+    :param document: lib.document.Document
+    :param path: output file
+    :param raster: optional RasterLayer
+    :return: FileLayout of the new file
+    """
+    document.load()
+    layout = FileLayout(path, 1, 0, 0)
+    partial = path + '.part'
+    try:
+        with open(partial, 'wb') as file:
+            file.write(b'\x00' * DATA_START)
+            offset = DATA_START
+            for layer in document.layers:
+                offset = _write_chunks(file, offset, layer.id, (item for chunk in chunk_items(document, layer)
+                                                                for item in chunk), layout)
+            offset = _write_raster(file, offset, raster, layout)
+            index = _encode_index(document, layout)
+            file.write(index)
+            file.seek(0)
+            file.write(pack_header(layout.generation, offset, len(index)))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(partial, path)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    layout.index_length = len(index)
+    layout.size = offset + len(index)
+    document.mark_saved()
+    return layout
+
+
+def save_changes(document, path, raster=None, layout=None):
+    """
+    Save a document over the file it was opened from or last saved to,
+    appending only the chunks of the items changed since then. A full
+    save_drawing is done instead when there is no usable layout, when
+    everything changed or when more than half of the file became garbage.
+
+    :param document: lib.document.Document
+    :param path: output file
+    :param raster: optional RasterLayer
+    :param layout: FileLayout of the file at path, or None
+    :return: FileLayout of the file
+    """
+    changed = document.changed_items()
+    try:
+        usable = layout is not None and layout.path == path and changed is not None and \
+            os.path.getsize(path) == layout.size and layout.garbage * 2 <= layout.size
+    except OSError:
+        usable = False
+    if not usable:
+        return save_drawing(document, path, raster)
+    if not changed and not layout.raster_changed(raster) and not _index_changed(document, path, layout):
+        return layout
+
+    # Rewrite the chunks holding changed items, together with the new items
+    affected = {layout.owner[item_id] for item_id in changed if item_id in layout.owner}
+    items = {item_id: document.get(item_id) for item_id in changed
+             if item_id in document and item_id not in layout.owner}
+    for number in affected:
+        for item_id in layout.members.get(number, ()):
+            if item_id in document:
+                items[item_id] = document.get(item_id)
+        layout.drop_chunk(number)
+    by_layer = {}
+    for item in items.values():
+        by_layer.setdefault(item.layer, []).append(item)
+
+    with open(path, 'r+b') as file:
+        offset = file.seek(0, 2)
+        for layer in document.layers:
+            if layer.id in by_layer:
+                offset = _write_chunks(file, offset, layer.id, by_layer[layer.id], layout)
+        if layout.raster_changed(raster):
+            offset = _write_raster(file, offset, raster, layout)
+        index = _encode_index(document, layout)
+        file.write(index)
+        file.flush()
+        os.fsync(file.fileno())
+        # Only now the new data is reachable: point the other header slot at it
+        layout.generation += 1
+        layout.slot = 1 - layout.slot
+        file.seek(layout.slot * HEADER_SIZE)
+        file.write(pack_header(layout.generation, offset, len(index)))
+        file.flush()
+        os.fsync(file.fileno())
+    layout.index_length = len(index)
+    layout.size = offset + len(index)
+    document.mark_saved()
+    return layout
+
+
+def _index_changed(document, path, layout):
+    """
+    The page, layers or active layer differ from the saved index.
+    """
+    with open(path, 'rb') as file:
+        file.seek(layout.size - layout.index_length)
+        index = json.loads(file.read(layout.index_length))
+    saved = dict(index, chunks=None, styles=None, raster=None, next_id=None)
+    current = json.loads(_encode_index(document, FileLayout(path, 0, 0, 0)))
+    return dict(current, chunks=None, styles=None, raster=None, next_id=None) != saved
+
+
+class ChunkSource:
+    """
+    Chunks of an opened file that were not decoded yet, looked up by their
+    bounding box, or by the id of one of their items. Chunks of items
+    without a bounding box are decoded by the first load. The file stays
+    memory-mapped until the last one is read.
+    """
+
+    def __init__(self, file, data, chunks, styles, next_id, layout=None):
+        """
+        :param chunks: dict mapping a chunk number to its index entry
+        :param layout: FileLayout told which items every decoded chunk holds
+        """
+        self.file = file
+        self.data = data
+        self.styles = styles
+        self.next_id = next_id
+        self.layout = layout
+        self.chunks = {}
+        self.index = QuadTree()
+        self.unplaced = set()
+        self.pending_items = 0
+        # Sorted ids of the pending items and their chunks, built by the first find
+        self._owners = None
+        for number, (layer_id, offset, length, crc, count, *bbox) in chunks.items():
+            self.chunks[number] = layer_id, offset, length, crc, count
+            if bbox[0] is None:
+                self.unplaced.add(number)
+            else:
+                self.index.insert(number, tuple(bbox))
+            self.pending_items += count
+        if not self.chunks:
+            self.close()
+
+    def load(self, bbox=None):
+        """
+        Decode the pending chunks intersecting bbox (all of them when None).
+
+        :return: list of Item
+        """
+        if not self.chunks:
+            return []
+        numbers = sorted(self.chunks) if bbox is None else sorted(set(self.index.query(bbox)) | self.unplaced)
+        return self._decode(numbers)
+
+    def load_item(self, item_id):
+        """
+        Decode the pending chunk holding an item, if any.
+
+        :return: list of Item
+        """
+        if not self.chunks:
+            return []
+        if self._owners is None:
+            numbers = list(self.chunks)
+            ids = [self._item_ids(number) for number in numbers]
+            owners = np.repeat(numbers, [len(chunk) for chunk in ids])
+            ids = np.concatenate(ids)
+            order = np.argsort(ids, kind='stable')
+            self._owners = ids[order], owners[order]
+        ids, owners = self._owners
+        position = int(np.searchsorted(ids, item_id))
+        if position == len(ids) or ids[position] != item_id or int(owners[position]) not in self.chunks:
+            return []
+        return self._decode([int(owners[position])])
+
+    def _item_ids(self, number):
+        """
+        Ids of the items of a chunk, read from its table without decoding it.
+        """
+        layer_id, offset, length, crc, count = self.chunks[number]
+        return np.frombuffer(self.data, dtype=ITEM_DTYPE, count=count,
+                             offset=offset + CHUNK_HEADER.size)['id'].astype(np.int64)
+
+    def _decode(self, numbers):
+        items = []
+        for number in numbers:
+            layer_id, offset, length, crc, count = self.chunks.pop(number)
+            if number in self.unplaced:
+                self.unplaced.discard(number)
+            else:
+                self.index.remove(number)
+            data = memoryview(self.data)[offset:offset + length]
+            if zlib.crc32(data) != crc:
+                raise FormatError(f'chunk {number} is corrupted')
+            decoded = decode_chunk(data, layer_id, self.styles)
+            data.release()
+            if self.layout is not None:
+                self.layout.add_members(number, [item.id for item in decoded])
+            items.extend(decoded)
+            self.pending_items -= count
+        if not self.chunks:
+            self.close()
+        return items
+
+    def close(self):
+        if self.data is not None:
+            self.data.close()
+            self.file.close()
+            self.data = None
+
+
+def open_drawing(path):
+    """
+    Open a .desenhando file. Only the index is read: chunks are decoded when
+    the document is first queried over their area.
+
+    :param path: file to open
+    :return: (Document, RasterLayer or None)
+    """
+    document, raster, layout = open_drawing_file(path)
+    return document, raster
+
+
+def open_drawing_file(path):
+    """
+    Like open_drawing, also returning the FileLayout needed by save_changes.
+
+    :param path: file to open
+    :return: (Document, RasterLayer or None, FileLayout)
+    """
+    file = open(path, 'rb')
+    try:
+        data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        file.close()
+        raise FormatError('not a Desenhando drawing')
+    try:
+        generation, offset, length, slot = read_header(data)
+        index = json.loads(bytes(data[offset:offset + length]))
+        layout = FileLayout(path, generation, slot, len(data))
+        layout.index_length = length
+        document = Document(index['width'], index['height'])
+        layers = []
+        for spec in index['layers']:
+            layer = Layer(spec['id'], spec['name'])
+            layer.visible, layer.locked, layer.opacity = spec['visible'], spec['locked'], spec['opacity']
+            layers.append(layer)
+        document.restore_layers(layers, index['active'])
+        raster = None
+        if index.get('raster'):
+            raster_offset, raster_length, width, height = index['raster']
+            raster = RasterLayer(width, height)
+            raster.pixels[...] = np.frombuffer(zlib.decompress(data[raster_offset:raster_offset + raster_length]),
+                                               dtype=np.uint8).reshape(height, width, 4)
+            layout.raster = index['raster']
+        layout.track_raster(raster)
+        styles = [{name: tuple(value) if isinstance(value, list) else value for name, value in style.items()}
+                  for style in index['styles']]
+        layout.styles = {json.dumps(style, sort_keys=True): number for number, style in enumerate(index['styles'])}
+        for entry in index['chunks']:
+            layout.add_chunk(entry)
+        document.attach_source(ChunkSource(file, data, dict(layout.chunks), styles, index['next_id'], layout))
+    except (KeyError, ValueError, TypeError, struct.error) as error:
+        data.close()
+        file.close()
+        raise FormatError(f'damaged drawing: {error}')
+    except BaseException:
+        data.close()
+        file.close()
+        raise
+    return document, raster, layout
@@ -0,0 +1,211 @@
+"""
++----------------------------------------------------------------------------------------+
+|                                 This file is part of:                                  |
+|                                      DESENHANDO                                        |
+|                                 www.github.com/...                                     |
++----------------------------------------------------------------------------------------+
+|     Copyright (c) 2021 João Vitor, ...                                                 |
+|                                                                                        |
+|     Permission is hereby granted, free of charge, to any person obtaining a copy       |
+|     of this software and associated documentation files (the "Software"), to deal      |
+|     in the Software without restriction, including without limitation the rights       |
+|     to use, copy, modify, merge, publish, distribute, sublicense, and/or sell          |
+|     copies of the Software, and to permit persons to whom the Software is              |
+|     furnished to do so, subject to the following conditions:                           |
+|                                                                                        |
+|     The above copyright notice and this permission notice shall be included in         |
+|     all copies or substantial portions of the Software.                                |
+|                                                                                        |
+|     THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR         |
+|     IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,           |
+|     FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE        |
+|     AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER             |
+|     LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,      |
+|     OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN          |
+|     THE SOFTWARE.                                                                      |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+|                                         ABSTRACT                                       |
++----------------------------------------------------------------------------------------+
+| Bounding box helpers and other geometry routines used by the drawing.                  |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+"""
+
+# Points simplified together by simplify, which bounds its worst case
+SIMPLIFY_WINDOW = 256
+
+
+def bbox_intersects(a, b):
+    """
+    Check whether two bounding boxes (x1, y1, x2, y2) overlap. Touching boxes count as overlapping.
+    """
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def bbox_contains(outer, inner):
+    """
+    Check whether the bounding box inner lies entirely inside outer.
+    """
+    return outer[0] <= inner[0] and outer[1] <= inner[1] and inner[2] <= outer[2] and inner[3] <= outer[3]
+
+
+def bbox_union(a, b):
+    """
+    Smallest bounding box containing both a and b. Either may be None.
+    """
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+
+def coords_bbox(coords, pad=0):
+    """
+    Bounding box of a flat coordinate list [x0, y0, x1, y1, ...].
+
+    :param coords: flat sequence of coordinates
+    :param pad: margin added on every side (eg. half the line width)
+    :return: (x1, y1, x2, y2) or None for an empty list
+    """
+    if len(coords) < 2:
+        return None
+    xs = coords[0::2]
+    ys = coords[1::2]
+    return min(xs) - pad, min(ys) - pad, max(xs) + pad, max(ys) + pad
+
+
+def point_segment_distance(px, py, ax, ay, bx, by):
+    """
+    Distance from the point p to the segment ab.
+    """
+    dx = bx - ax
+    dy = by - ay
+    length = dx * dx + dy * dy
+    if length == 0:
+        return ((px - ax) ** 2 + (py - ay) ** 2) ** 0.5
+    t = max(0.0, min(1.0, ((px - ax) * dx + (py - ay) * dy) / length))
+    return ((px - ax - t * dx) ** 2 + (py - ay - t * dy) ** 2) ** 0.5
+
+
+class StrokeSimplifier:
+    """
+    Thins the points of a freehand stroke while they arrive.
+
+    Points closer than tolerance to the newest point are dropped (radial
+    distance) and so are points that stay within tolerance of the straight
+    line between the last kept point and the newest one. The newest point is
+    always part of coords, so the stroke keeps following the mouse.
+    """
+
+    def __init__(self, tolerance=1.0, max_pending=64):
+        """
+        :param tolerance: maximum deviation in pixels from the original stroke
+        :param max_pending: dropped points remembered to validate the next segment
+        """
+        self.tolerance = tolerance
+        self.max_pending = max_pending
+        self.points = []
+        self._pending = []
+        self._tail = None
+
+    @property
+    def coords(self):
+        """
+        Flat coordinate list of the simplified stroke, newest point included.
+        """
+        if self._tail is None:
+            return list(self.points)
+        return self.points + list(self._tail)
+
+    def add(self, x, y):
+        """
+        Feed a new point of the stroke.
+
+        :return: True when coords changed
+        """
+        if not self.points:
+            self.points = [x, y]
+            return True
+
+        ax, ay = self.points[-2], self.points[-1]
+        # Measured from the newest point: a stroke that turns back towards the
+        # last kept point must not lose the way out
+        nx, ny = self._tail if self._tail is not None else (ax, ay)
+        tolerance = self.tolerance
+        if (x - nx) ** 2 + (y - ny) ** 2 < tolerance * tolerance:
+            return False
+
+        if self._tail is not None:
+            self._pending.append(self._tail)
+            if len(self._pending) > self.max_pending or \
+                    any(point_segment_distance(px, py, ax, ay, x, y) > tolerance for px, py in self._pending):
+                self.points.extend(self._tail)
+                self._pending.clear()
+        self._tail = (x, y)
+        return True
+
+    def finish(self):
+        """
+        Keep the newest point and return the final coordinate list.
+        """
+        if self._tail is not None:
+            self.points.extend(self._tail)
+            self._tail = None
+            self._pending.clear()
+        return self.points
+
+
+def _segment_distances(points, a, b):
+    """
+    Distances from an array of points (n, 2) to the segment ab.
+    """
+    import numpy as np
+
+    direction = b - a
+    length = direction @ direction
+    offsets = points - a
+    if length == 0:
+        return np.hypot(offsets[:, 0], offsets[:, 1])
+    t = np.clip(offsets @ direction / length, 0.0, 1.0)
+    rest = offsets - t[:, None] * direction
+    return np.hypot(rest[:, 0], rest[:, 1])
+
+
+def simplify(coords, tolerance, window=SIMPLIFY_WINDOW):
+    """
+    Ramer-Douglas-Peucker simplification of a flat coordinate list.
+
+    The points are split in runs of window points sharing their ends and
+    every run is simplified on its own, so a long looping stroke costs
+    O(n * window) instead of O(n^2); the deviation stays within tolerance.
+
+    :param coords: flat sequence [x0, y0, x1, y1, ...]
+    :param tolerance: maximum deviation allowed, in the units of coords
+    :param window: points simplified together
+    :return: new flat list keeping the first and last points
+    """
+    count = len(coords) // 2
+    if count < 3:
+        return list(coords)
+    # NumPy is kept off the startup path, it loads on the first simplified stroke
+    import numpy as np
+
+    points = np.asarray(coords, dtype=np.float64)[:count * 2].reshape(-1, 2)
+    keep = np.zeros(count, dtype=bool)
+    stack = [(start, min(start + window, count - 1)) for start in range(0, count - 1, window)]
+    keep[[first for first, last in stack]] = True
+    keep[-1] = True
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        distances = _segment_distances(points[first + 1:last], points[first], points[last])
+        farthest = int(distances.argmax())
+        if distances[farthest] > tolerance:
+            farthest += first + 1
+            keep[farthest] = True
+            stack.append((first, farthest))
+            stack.append((farthest, last))
+    return points[keep].ravel().tolist()
@@ -0,0 +1,570 @@
+"""
++----------------------------------------------------------------------------------------+
+|                                 This file is part of:                                  |
+|                                      DESENHANDO                                        |
+|                                 www.github.com/...                                     |
++----------------------------------------------------------------------------------------+
+|     Copyright (c) 2021 João Vitor, ...                                                 |
+|                                                                                        |
+|     Permission is hereby granted, free of charge, to any person obtaining a copy       |
+|     of this software and associated documentation files (the "Software"), to deal      |
+|     in the Software without restriction, including without limitation the rights       |
+|     to use, copy, modify, merge, publish, distribute, sublicense, and/or sell          |
+|     copies of the Software, and to permit persons to whom the Software is              |
+|     furnished to do so, subject to the following conditions:                           |
+|                                                                                        |
+|     The above copyright notice and this permission notice shall be included in         |
+|     all copies or substantial portions of the Software.                                |
+|                                                                                        |
+|     THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR         |
+|     IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,           |
+|     FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE        |
+|     AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER             |
+|     LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,      |
+|     OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN          |
+|     THE SOFTWARE.                                                                      |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+|                                         ABSTRACT                                       |
++----------------------------------------------------------------------------------------+
+| Undo and redo log of the drawing, kept within a memory budget.                         |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+"""
+
+import pickle
+import tempfile
+from array import array
+
+# Rough size of the Python objects around each recorded operation
+OPERATION_OVERHEAD = 200
+# Dead bytes the spill file may hold before it is rewritten, at least
+SPILL_COMPACT_MINIMUM = 4 * 2 ** 20
+
+
+def pack_coords(coords):
+    return array('f', coords)
+
+
+def _options_size(options):
+    return sum(len(str(key)) + len(str(value)) for key, value in options.items())
+
+
+class ItemSnapshot:
+    """
+    Everything needed to recreate an item: its coordinates are kept in a
+    packed float array instead of a list of Python floats.
+    """
+
+    __slots__ = ('id', 'kind', 'coords', 'options', 'layer')
+
+    def __init__(self, item):
+        self.id = item.id
+        self.kind = item.kind
+        self.coords = pack_coords(item.coords)
+        self.options = dict(item.options)
+        self.layer = item.layer
+
+    @property
+    def nbytes(self):
+        return len(self.coords) * self.coords.itemsize + _options_size(self.options) + OPERATION_OVERHEAD
+
+    def restore(self, target):
+        target.restore_item(self.id, self.kind, self.coords.tolist(), self.options, self.layer)
+
+
+class AddItem:
+
+    __slots__ = ('snapshot',)
+
+    def __init__(self, item):
+        self.snapshot = ItemSnapshot(item)
+
+    @property
+    def nbytes(self):
+        return self.snapshot.nbytes
+
+    def undo(self, target):
+        target.delete_item(self.snapshot.id)
+
+    def redo(self, target):
+        self.snapshot.restore(target)
+
+
+class RemoveItem(AddItem):
+
+    __slots__ = ()
+
+    def undo(self, target):
+        self.snapshot.restore(target)
+
+    def redo(self, target):
+        target.delete_item(self.snapshot.id)
+
+
+class MoveItem:
+    """
+    An edit that only translated the item: stored as the offset, not as coordinates.
+    """
+
+    __slots__ = ('id', 'dx', 'dy')
+
+    nbytes = OPERATION_OVERHEAD
+
+    def __init__(self, item_id, dx, dy):
+        self.id = item_id
+        self.dx = dx
+        self.dy = dy
+
+    def undo(self, target):
+        if self.id in target.document:
+            target.move_item(self.id, -self.dx, -self.dy)
+
+    def redo(self, target):
+        if self.id in target.document:
+            target.move_item(self.id, self.dx, self.dy)
+
+
+class EditItem:
+    """
+    New and old coordinates (when they changed) and the changed options only.
+    """
+
+    __slots__ = ('id', 'old_coords', 'new_coords', 'old_options', 'new_options')
+
+    def __init__(self, item_id, old_coords, new_coords, old_options, new_options):
+        self.id = item_id
+        self.old_coords = old_coords
+        self.new_coords = new_coords
+        self.old_options = old_options
+        self.new_options = new_options
+
+    @property
+    def nbytes(self):
+        size = OPERATION_OVERHEAD + _options_size(self.old_options) + _options_size(self.new_options)
+        if self.old_coords is not None:
+            size += (len(self.old_coords) + len(self.new_coords)) * self.old_coords.itemsize
+        return size
+
+    def undo(self, target):
+        self._apply(target, self.old_coords, self.old_options)
+
+    def redo(self, target):
+        self._apply(target, self.new_coords, self.new_options)
+
+    def _apply(self, target, coords, options):
+        if self.id not in target.document:
+            # Removed without being recorded; the rest of the entry still applies
+            return
+        if coords is not None:
+            target.set_item_coords(self.id, coords.tolist())
+        if options:
+            target.configure_item(self.id, **options)
+
+
+class RemoveLayer:
+    """
+    A removed layer: its id, place in the stack and options. The removal of
+    its items is recorded before it, so undo puts the layer back first.
+    """
+
+    __slots__ = ('id', 'name', 'position', 'visible', 'locked', 'opacity')
+
+    nbytes = OPERATION_OVERHEAD
+
+    def __init__(self, layer, position):
+        self.id = layer.id
+        self.name = layer.name
+        self.position = position
+        self.visible = layer.visible
+        self.locked = layer.locked
+        self.opacity = layer.opacity
+
+    def undo(self, target):
+        target.layers.restore(self.id, self.name, self.position, visible=self.visible, locked=self.locked,
+                              opacity=self.opacity)
+
+    def redo(self, target):
+        target.layers.remove(self.id)
+
+
+def translation(old, new):
+    """
+    Offset (dx, dy) when new is old moved by a constant amount, otherwise None.
+    """
+    if len(old) != len(new) or len(old) < 2:
+        return None
+    dx = new[0] - old[0]
+    dy = new[1] - old[1]
+    for i in range(0, len(old), 2):
+        if abs(new[i] - old[i] - dx) > 1e-3 or abs(new[i + 1] - old[i + 1] - dy) > 1e-3:
+            return None
+    return dx, dy
+
+
+class _Transaction:
+
+    def __init__(self):
+        self.order = []
+        self.added = set()
+        self.removed = {}
+        self.edited = {}
+        self.layers = []
+
+
+class _SpilledEntry:
+    """
+    Placeholder of an undo or redo entry written to the spill file.
+    """
+
+    __slots__ = ('offset', 'length')
+
+    nbytes = 64
+
+    def __init__(self, offset, length):
+        self.offset = offset
+        self.length = length
+
+
+class History:
+    """
+    Undo/redo log of the drawing.
+
+    Every committed action is stored as a compact delta: packed coordinates
+    for created or deleted items, offsets for moved items and only the
+    changed options for edits. When the undo and redo stacks together grow
+    past memory_budget bytes, the entries furthest from the current state are
+    spilled to a temporary file (or dropped, when spilling is disabled or the
+    file passes disk_budget).
+    """
+
+    def __init__(self, target, memory_budget=64 * 2 ** 20, disk_budget=512 * 2 ** 20, spill=True):
+        """
+        :param target: object with document, layers, restore_item, delete_item,
+                       set_item_coords, configure_item and move_item (the DrawingArea)
+        :param memory_budget: maximum bytes of entries kept in memory
+        :param disk_budget: maximum bytes of entries kept in the spill file
+        :param spill: write old entries to a temporary file instead of dropping them
+        """
+        self.target = target
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.spill = spill
+        self._undo = []
+        self._redo = []
+        self._memory = 0
+        self._current = None
+        self._depth = 0
+        self._applying = False
+        self._spill_file = None
+        self._spill_end = 0
+        self._spilled_bytes = 0
+        # Called with the ids of the items changed by every commit, undo and redo
+        self.observer = None
+
+    @property
+    def memory(self):
+        """
+        Estimated bytes of the entries kept in memory.
+        """
+        return self._memory
+
+    def can_undo(self):
+        return bool(self._undo)
+
+    def can_redo(self):
+        return bool(self._redo)
+
+    def clear(self):
+        self._undo.clear()
+        self._redo.clear()
+        self._memory = 0
+        self._current = None
+        self._depth = 0
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+        self._spill_end = 0
+        self._spilled_bytes = 0
+
+    def begin(self):
+        """
+        Open an action; the changes recorded until the matching commit are undone together.
+
+        :return: None
+        """
+        if self._current is None:
+            self._current = _Transaction()
+        self._depth += 1
+
+    def commit(self):
+        """
+        Close the current action and store its delta.
+
+        :return: None
+        """
+        if self._current is None:
+            return
+        self._depth -= 1
+        if self._depth > 0:
+            return
+        transaction, self._current = self._current, None
+        operations = self._operations(transaction)
+        if not operations:
+            return
+        size = sum(operation.nbytes for operation in operations)
+        self._undo.append((size, operations))
+        self._memory += size
+        self._drop_redo()
+        self._enforce_budget()
+        self._notify(operations)
+
+    def item_added(self, item_id):
+        """
+        Record the creation of an item. Like the other record methods, it
+        only has effect between begin and commit.
+
+        :return: None
+        """
+        if self._applying or self._current is None:
+            return
+        self._current.order.append(item_id)
+        self._current.added.add(item_id)
+
+    def before_change(self, item_id, option_names=(), coords=True):
+        """
+        Remember the state of an item before the first change in the current action.
+
+        :param item_id: document id
+        :param option_names: options about to be changed
+        :param coords: the coordinates are about to be changed
+        :return: None
+        """
+        if self._applying or self._current is None:
+            return
+        transaction = self._current
+        if item_id not in transaction.added:
+            item = self.target.document.get(item_id)
+            old = transaction.edited.get(item_id)
+            if old is None:
+                transaction.order.append(item_id)
+                old = transaction.edited[item_id] = [None, {}]
+            if coords and old[0] is None:
+                old[0] = pack_coords(item.coords)
+            for name in option_names:
+                if name not in old[1]:
+                    old[1][name] = item.options.get(name, '')
+
+    def item_removed(self, item_id):
+        """
+        Must be called while the item is still in the document.
+
+        :return: None
+        """
+        if self._applying or self._current is None:
+            return
+        transaction = self._current
+        if item_id in transaction.added:
+            transaction.added.discard(item_id)
+        else:
+            snapshot = RemoveItem(self.target.document.get(item_id))
+            edited = transaction.edited.pop(item_id, None)
+            if edited is not None:
+                # Restore the state from before the action, not the edited one
+                if edited[0] is not None:
+                    snapshot.snapshot.coords = edited[0]
+                snapshot.snapshot.options.update(edited[1])
+            else:
+                transaction.order.append(item_id)
+            transaction.removed[item_id] = snapshot
+
+    def layer_removed(self, layer, position):
+        """
+        Record the removal of a layer, after the removal of its items.
+
+        :param layer: lib.document.Layer, still in the document
+        :param position: its index in the stack
+        :return: None
+        """
+        if self._applying or self._current is None:
+            return
+        self._current.layers.append(RemoveLayer(layer, position))
+
+    def undo(self):
+        """
+        Revert the last action.
+
+        :return: True when something was undone
+        """
+        if not self._undo:
+            return False
+        size, operations = self._undo.pop()
+        if isinstance(operations, _SpilledEntry):
+            self._memory -= _SpilledEntry.nbytes
+            operations = self._load(operations)
+        else:
+            self._memory -= size
+        self._apply(reversed(operations), 'undo')
+        self._redo.append((size, operations))
+        self._memory += size
+        self._enforce_budget()
+        self._notify(operations)
+        return True
+
+    def redo(self):
+        """
+        Apply again the last undone action.
+
+        :return: True when something was redone
+        """
+        if not self._redo:
+            return False
+        size, operations = self._redo.pop()
+        if isinstance(operations, _SpilledEntry):
+            self._memory += size - _SpilledEntry.nbytes
+            operations = self._load(operations)
+        self._apply(operations, 'redo')
+        self._undo.append((size, operations))
+        self._enforce_budget()
+        self._notify(operations)
+        return True
+
+    def _apply(self, operations, method):
+        self._applying = True
+        try:
+            for operation in operations:
+                getattr(operation, method)(self.target)
+        finally:
+            self._applying = False
+
+    def _notify(self, operations):
+        if self.observer is not None:
+            self.observer([operation.snapshot.id if isinstance(operation, AddItem) else operation.id
+                           for operation in operations if not isinstance(operation, RemoveLayer)])
+
+    def _operations(self, transaction):
+        document = self.target.document
+        operations = []
+        for item_id in transaction.order:
+            if item_id in transaction.removed:
+                operations.append(transaction.removed[item_id])
+            elif item_id in transaction.added:
+                if item_id in document:
+                    operations.append(AddItem(document.get(item_id)))
+            elif item_id in transaction.edited and item_id in document:
+                item = document.get(item_id)
+                old_coords, old_options = transaction.edited[item_id]
+                new_options = {name: item.options.get(name, '') for name in old_options}
+                changed = {name for name in old_options if old_options[name] != new_options[name]}
+                old_options = {name: old_options[name] for name in changed}
+                new_options = {name: new_options[name] for name in changed}
+                new_coords = None
+                if old_coords is not None:
+                    new_coords = pack_coords(item.coords)
+                    if new_coords == old_coords:
+                        old_coords = new_coords = None
+                    elif not changed:
+                        offset = translation(old_coords, new_coords)
+                        if offset is not None:
+                            operations.append(MoveItem(item_id, *offset))
+                            continue
+                if old_coords is not None or changed:
+                    operations.append(EditItem(item_id, old_coords, new_coords, old_options, new_options))
+        return operations + transaction.layers
+
+    def _drop_redo(self):
+        for size, operations in self._redo:
+            if isinstance(operations, _SpilledEntry):
+                self._memory -= _SpilledEntry.nbytes
+                self._spilled_bytes -= operations.length
+            else:
+                self._memory -= size
+        self._redo.clear()
+
+    def _enforce_budget(self):
+        """
+        Spill (or drop) the entries in memory furthest from the current
+        state, on both stacks, until memory_budget is met. The next entry
+        to undo and the next one to redo always stay in memory.
+        """
+        undo, redo = self._undo, self._redo
+        i = j = 0
+        while self._memory > self.memory_budget:
+            while i < len(undo) - 1 and isinstance(undo[i][1], _SpilledEntry):
+                i += 1
+            while j < len(redo) - 1 and isinstance(redo[j][1], _SpilledEntry):
+                j += 1
+            undo_left, redo_left = i < len(undo) - 1, j < len(redo) - 1
+            if not undo_left and not redo_left:
+                break
+            if undo_left and (not redo_left or len(undo) - i >= len(redo) - j):
+                stack, index = undo, i
+            else:
+                stack, index = redo, j
+            size, operations = stack[index]
+            self._memory -= size
+            if self.spill:
+                stack[index] = (size, self._write(operations))
+                self._memory += _SpilledEntry.nbytes
+            else:
+                del stack[index]
+        self._trim_spill_file()
+
+    def _write(self, operations):
+        if self._spill_file is None:
+            self._spill_file = tempfile.TemporaryFile(prefix='desenhando-history-')
+            self._spill_end = 0
+        data = pickle.dumps(operations, protocol=pickle.HIGHEST_PROTOCOL)
+        self._spill_file.seek(self._spill_end)
+        self._spill_file.write(data)
+        entry = _SpilledEntry(self._spill_end, len(data))
+        self._spill_end += len(data)
+        self._spilled_bytes += len(data)
+        return entry
+
+    def _load(self, entry):
+        self._spill_file.seek(entry.offset)
+        data = self._spill_file.read(entry.length)
+        self._spilled_bytes -= entry.length
+        return pickle.loads(data)
+
+    def _spilled(self):
+        return [entry for stack in (self._undo, self._redo) for _, entry in stack
+                if isinstance(entry, _SpilledEntry)]
+
+    def _trim_spill_file(self):
+        """
+        Forget the spilled entries furthest from the current state past
+        disk_budget, and rewrite the file without the records of loaded or
+        forgotten entries once they take more room than the live ones.
+        """
+        undo, redo = self._undo, self._redo
+        while self._spilled_bytes > self.disk_budget:
+            undo_spilled = bool(undo) and isinstance(undo[0][1], _SpilledEntry)
+            redo_spilled = bool(redo) and isinstance(redo[0][1], _SpilledEntry)
+            if not undo_spilled and not redo_spilled:
+                break
+            stack = undo if undo_spilled and (not redo_spilled or len(undo) >= len(redo)) else redo
+            size, entry = stack.pop(0)
+            self._spilled_bytes -= entry.length
+            self._memory -= _SpilledEntry.nbytes
+        if self._spill_file is None:
+            return
+        entries = self._spilled()
+        if not entries:
+            self._spill_file.close()
+            self._spill_file = None
+            self._spilled_bytes = 0
+        elif self._spill_end - self._spilled_bytes > max(self._spilled_bytes, SPILL_COMPACT_MINIMUM):
+            self._compact(entries)
+
+    def _compact(self, entries):
+        old = self._spill_file
+        self._spill_file = tempfile.TemporaryFile(prefix='desenhando-history-')
+        self._spill_end = 0
+        for entry in sorted(entries, key=lambda entry: entry.offset):
+            old.seek(entry.offset)
+            self._spill_file.write(old.read(entry.length))
+            entry.offset = self._spill_end
+            self._spill_end += entry.length
+        old.close()
@@ -0,0 +1,543 @@
+"""
++----------------------------------------------------------------------------------------+
+|                                 This file is part of:                                  |
+|                                      DESENHANDO                                        |
+|                                 www.github.com/...                                     |
++----------------------------------------------------------------------------------------+
+|     Copyright (c) 2021 João Vitor, ...                                                 |
+|                                                                                        |
+|     Permission is hereby granted, free of charge, to any person obtaining a copy       |
+|     of this software and associated documentation files (the "Software"), to deal      |
+|     in the Software without restriction, including without limitation the rights       |
+|     to use, copy, modify, merge, publish, distribute, sublicense, and/or sell          |
+|     copies of the Software, and to permit persons to whom the Software is              |
+|     furnished to do so, subject to the following conditions:                           |
+|                                                                                        |
+|     The above copyright notice and this permission notice shall be included in         |
+|     all copies or substantial portions of the Software.                                |
+|                                                                                        |
+|     THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR         |
+|     IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,           |
+|     FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE        |
+|     AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER             |
+|     LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,      |
+|     OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN          |
+|     THE SOFTWARE.                                                                      |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+|                                         ABSTRACT                                       |
++----------------------------------------------------------------------------------------+
+| Crash-safe autosave: append-only journal of the drawing with background compaction.    |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+
+Directory layout:
+
+    session.lock             exists and is locked (flock) while a session
+                             runs; found unlocked with segments at startup
+                             it means the session did not end cleanly
+    journal-N.log            segments of framed records, appended in order
+    checkpoint-N.desenhando  the drawing with every segment up to N folded in
+
+The first instance of the program journals to ~/.desenhando/journal, the
+next ones, while it runs, to journal-2, journal-3...
+
+Every record is a pickled tuple framed by its length and CRC32, so a torn
+write at the end of a segment is detected and ignored on replay:
+
+    ('base', path or None, width, height)   starting drawing (file or empty page)
+    ('size', width, height)
+    ('items', [(id, kind, coords, options, layer), ...], [deleted ids])
+    ('layers', [layer dicts], active layer id)
+    ('pixels', x1, y1, x2, y2, zlib compressed RGBA)
+"""
+
+import glob
+import logging
+import os
+import pickle
+import re
+import struct
+import threading
+import zlib
+from array import array
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+from lib.document import Document
+from lib.drawing_file import FormatError, open_drawing, save_drawing
+from lib.raster import RasterLayer
+
+FRAME = struct.Struct('<II')
+LOCK_NAME = 'session.lock'
+
+
+def default_directory():
+    return os.path.join(os.path.expanduser('~'), '.desenhando', 'journal')
+
+
+def lock_file(path):
+    """
+    Open and lock the lock file of a session directory, without waiting.
+    The lock lasts until the file is closed, or the process ends.
+
+    :return: the open file, or None when another process holds the lock
+    """
+    file = open(path, 'a+')
+    try:
+        if fcntl is not None:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            file.seek(0)
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        file.close()
+        return None
+    return file
+
+
+def session_directories(root=None):
+    """
+    The session directories that exist, the first one always included.
+
+    :param root: directory of the first session (default: ~/.desenhando/journal)
+    :return: list of paths
+    """
+    root = root or default_directory()
+    numbered = []
+    for path in glob.glob(glob.escape(root) + '-*'):
+        match = re.fullmatch(r'-(\d+)', path[len(root):])
+        if match and os.path.isdir(path):
+            numbered.append((int(match.group(1)), path))
+    return [root] + [path for number, path in sorted(numbered)]
+
+
+def encode_record(record):
+    data = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+    return FRAME.pack(len(data), zlib.crc32(data)) + data
+
+
+def read_records(path):
+    """
+    Records of a segment, stopping at the first incomplete or damaged frame.
+
+    :return: list of records
+    """
+    records = []
+    with open(path, 'rb') as file:
+        data = file.read()
+    position = 0
+    while position + FRAME.size <= len(data):
+        length, crc = FRAME.unpack_from(data, position)
+        payload = data[position + FRAME.size:position + FRAME.size + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            logging.warning(f'{path}: journal ends with a damaged record at byte {position}')
+            break
+        records.append(pickle.loads(payload))
+        position += FRAME.size + length
+    return records
+
+
+def _numbered(directory, pattern):
+    """
+    {number: path} of the files named like pattern (with one {} for the number).
+    """
+    regex = re.compile(re.escape(pattern).replace(r'\{\}', r'(\d+)') + '$')
+    found = {}
+    for path in glob.glob(os.path.join(directory, pattern.format('*'))):
+        match = regex.match(os.path.basename(path))
+        if match:
+            found[int(match.group(1))] = path
+    return found
+
+
+def segments(directory):
+    return _numbered(directory, 'journal-{}.log')
+
+
+def checkpoints(directory):
+    return _numbered(directory, 'checkpoint-{}.desenhando')
+
+
+class Replay:
+    """
+    Rebuilds a drawing by applying journal records in order.
+    """
+
+    def __init__(self, document=None, raster=None):
+        self.document = document or Document()
+        self.raster = raster
+
+    def open(self, path):
+        """
+        Start from a saved drawing, fully decoded so that records can replace its items.
+        """
+        self.document, self.raster = open_drawing(path)
+        self.document.load()
+
+    def apply(self, record):
+        kind = record[0]
+        document = self.document
+        if kind == 'base':
+            path, width, height = record[1:]
+            if path is not None:
+                self.open(path)
+            else:
+                self.document, self.raster = Document(width, height), None
+        elif kind == 'size':
+            document.resize(*record[1:])
+            if self.raster is not None:
+                self.raster.resize(*record[1:])
+        elif kind == 'items':
+            changed, deleted = record[1:]
+            for item_id in deleted:
+                document.remove(item_id)
+            for item_id, item_kind, coords, options, layer in changed:
+                document.remove(item_id)
+                document.add(item_kind, coords.tolist(), layer=layer, item_id=item_id, **options)
+        elif kind == 'layers':
+            self._apply_layers(*record[1:])
+        elif kind == 'pixels':
+            x1, y1, x2, y2, data = record[1:]
+            if self.raster is None:
+                self.raster = RasterLayer(document.width, document.height)
+            self.raster.pixels[y1:y2, x1:x2] = np.frombuffer(zlib.decompress(data), dtype=np.uint8).reshape(
+                y2 - y1, x2 - x1, 4)
+
+    def _apply_layers(self, specs, active_id):
+        document = self.document
+        for position, spec in enumerate(specs):
+            try:
+                document.get_layer(spec['id'])
+            except KeyError:
+                document.add_layer(spec['name'], position, layer_id=spec['id'])
+            document.move_layer(spec['id'], position)
+            document.configure_layer(spec['id'], name=spec['name'], visible=spec['visible'],
+                                     locked=spec['locked'], opacity=spec['opacity'])
+        kept = {spec['id'] for spec in specs}
+        for layer in list(document.layers):
+            if layer.id not in kept:
+                document.remove_layer(layer.id)
+        document.set_active_layer(active_id)
+
+
+def layer_specs(document):
+    return [{'id': layer.id, 'name': layer.name, 'visible': layer.visible, 'locked': layer.locked,
+             'opacity': layer.opacity} for layer in document.layers]
+
+
+class Journal:
+    """
+    Write-ahead log of the drawing.
+
+    Records are queued by the Tk thread and written by a background thread,
+    which groups them and calls fsync at most every sync_interval seconds,
+    so drawing never waits on the disk. When the current segment passes
+    compact_size bytes a new one is started and a second thread folds the
+    finished segments into a checkpoint.
+    """
+
+    def __init__(self, directory=None, sync_interval=1.0, compact_size=32 * 2 ** 20):
+        """
+        :param directory: where the journal lives (default: ~/.desenhando/journal)
+        :param sync_interval: maximum seconds between a record and its fsync
+        :param compact_size: segment size that starts a compaction
+        """
+        self.directory = directory or default_directory()
+        self.sync_interval = sync_interval
+        self.compact_size = compact_size
+        self._pending = []
+        self._condition = threading.Condition()
+        self._closing = False
+        self._file = None
+        self._segment = 0
+        self._writer = None
+        self._compactor = None
+        self._last_layers = None
+        self._lock = None
+
+    @classmethod
+    def claim(cls, root=None, **options):
+        """
+        Journal of a session directory no running instance uses: one left by
+        a session that did not end cleanly when there is one, otherwise the
+        first free one. Its lock is held from now on.
+
+        :param root: directory of the first session (default: ~/.desenhando/journal)
+        :param options: other arguments of Journal
+        :return: Journal; see unclean
+        """
+        root = root or default_directory()
+        free = []
+        for directory in session_directories(root):
+            journal = cls(directory, **options)
+            if journal._acquire():
+                if segments(directory):
+                    for other in free:
+                        other._release()
+                    return journal
+                free.append(journal)
+        if not free:
+            number = 2
+            while True:
+                journal = cls(f'{root}-{number}', **options)
+                if journal._acquire():
+                    return journal
+                number += 1
+        for other in free[1:]:
+            other._release()
+        return free[0]
+
+    def unclean(self):
+        """
+        True when the session directory holds the journal of a session that
+        did not end cleanly. Only meaningful once the lock is held (see claim):
+        a running instance also has segments.
+        """
+        return self._lock is not None and bool(segments(self.directory))
+
+    @classmethod
+    def recover(cls, directory=None):
+        """
+        Rebuild the drawing of the last session from its checkpoint and segments.
+
+        :return: (Document, RasterLayer or None)
+        """
+        directory = directory or default_directory()
+        replay = Replay()
+        done = 0
+        for number, path in sorted(checkpoints(directory).items(), reverse=True):
+            try:
+                replay.open(path)
+            except (OSError, FormatError) as error:
+                logging.warning(f'Ignoring checkpoint {path}: {error}')
+                continue
+            done = number
+            break
+        for number, path in sorted(segments(directory).items()):
+            if number > done:
+                for record in read_records(path):
+                    replay.apply(record)
+        return replay.document, replay.raster
+
+    def start(self, document, path=None, raster=None):
+        """
+        Start journaling a drawing, forgetting the previous journal.
+
+        :param document: the drawing being edited
+        :param path: file the drawing was opened from or saved to, if it has one
+        :param raster: its pixel layer, if any
+        :return: None
+        """
+        self.stop()
+        self._hold_lock()
+        self._remove_files()
+        self._closing = False
+        self._segment = 1
+        self._file = open(self._segment_path(1), 'ab')
+        self._last_layers = None
+        self.append(('base', path, document.width, document.height))
+        if path is None:
+            # An unsaved drawing is not on disk: journal its current contents
+            self.layers(document)
+            self.items(document, document.ids())
+            if raster is not None:
+                self.pixels(raster, (0, 0, raster.width, raster.height))
+        else:
+            self._last_layers = (layer_specs(document), document.active_layer.id)
+        self._writer = threading.Thread(target=self._write_loop, name='journal-writer', daemon=True)
+        self._writer.start()
+
+    def resume(self, document):
+        """
+        Continue the journal of a recovered session with a new segment.
+
+        :return: None
+        """
+        self.stop()
+        self._hold_lock()
+        self._closing = False
+        self._segment = max(segments(self.directory), default=0) + 1
+        self._file = open(self._segment_path(self._segment), 'ab')
+        self._last_layers = (layer_specs(document), document.active_layer.id)
+        self._writer = threading.Thread(target=self._write_loop, name='journal-writer', daemon=True)
+        self._writer.start()
+
+    def append(self, record):
+        """
+        Queue a record; it is written and synced by the writer thread.
+
+        :return: None
+        """
+        data = encode_record(record)
+        with self._condition:
+            self._pending.append(data)
+            self._condition.notify()
+
+    def items(self, document, item_ids):
+        """
+        Record the current state of the given items; the ones no longer in
+        the document are recorded as deleted.
+
+        :return: None
+        """
+        changed, deleted = [], []
+        for item_id in dict.fromkeys(item_ids):
+            if item_id in document:
+                item = document.get(item_id)
+                changed.append((item_id, item.kind, array('f', item.coords), dict(item.options), item.layer))
+            else:
+                deleted.append(item_id)
+        if changed or deleted:
+            self.append(('items', changed, deleted))
+
+    def page_size(self, width, height):
+        self.append(('size', width, height))
+
+    def layers(self, document):
+        """
+        Record the layer stack when it differs from the last recorded one.
+
+        :return: None
+        """
+        state = (layer_specs(document), document.active_layer.id)
+        if state != self._last_layers:
+            self._last_layers = state
+            self.append(('layers',) + state)
+
+    def pixels(self, raster, rect):
+        x1, y1, x2, y2 = rect
+        data = zlib.compress(raster.pixels[y1:y2, x1:x2].tobytes(), 1)
+        self.append(('pixels', x1, y1, x2, y2, data))
+
+    def stop(self):
+        """
+        Write what is queued and stop the threads, keeping the files.
+
+        :return: None
+        """
+        if self._writer is not None:
+            with self._condition:
+                self._closing = True
+                self._condition.notify()
+            self._writer.join()
+            self._writer = None
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        """
+        End the session cleanly: nothing will need to be recovered.
+
+        :return: None
+        """
+        self.stop()
+        if self._lock is None:
+            # Another instance may own the files
+            return
+        self._remove_files()
+        if fcntl is None:
+            # Windows can not remove an open file
+            self._release()
+        os.remove(os.path.join(self.directory, LOCK_NAME))
+        self._release()
+
+    def _acquire(self):
+        """
+        Take the lock of the session directory, unless another process holds it.
+
+        :return: True when the lock is held
+        """
+        if self._lock is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._lock = lock_file(os.path.join(self.directory, LOCK_NAME))
+        return self._lock is not None
+
+    def _hold_lock(self):
+        if not self._acquire():
+            raise RuntimeError(f'the journal in {self.directory} is used by another instance')
+        self._lock.seek(0)
+        self._lock.truncate()
+        self._lock.write(str(os.getpid()))
+        self._lock.flush()
+
+    def _release(self):
+        if self._lock is not None:
+            self._lock.close()
+            self._lock = None
+
+    def _segment_path(self, number):
+        return os.path.join(self.directory, f'journal-{number}.log')
+
+    def _remove_files(self):
+        for path in list(segments(self.directory).values()) + list(checkpoints(self.directory).values()):
+            os.remove(path)
+
+    def _write_loop(self):
+        while True:
+            with self._condition:
+                if not self._pending and not self._closing:
+                    self._condition.wait()
+                closing = self._closing
+                batch, self._pending = self._pending, []
+            if batch:
+                try:
+                    self._file.write(b''.join(batch))
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                except OSError:
+                    logging.exception('Error writing the autosave journal')
+                if self._file.tell() >= self.compact_size and self._compactor is None:
+                    self._rotate()
+            if closing:
+                return
+            # Let the next records gather before the next fsync
+            with self._condition:
+                self._condition.wait_for(lambda: self._closing, timeout=self.sync_interval)
+
+    def _rotate(self):
+        self._file.close()
+        finished = self._segment
+        self._segment += 1
+        self._file = open(self._segment_path(self._segment), 'ab')
+        self._compactor = threading.Thread(target=self._compact, args=(finished,), name='journal-compactor',
+                                           daemon=True)
+        self._compactor.start()
+
+    def _compact(self, last):
+        """
+        Fold the segments up to last into checkpoint-last and delete them.
+        """
+        try:
+            replay = Replay()
+            done = 0
+            existing = checkpoints(self.directory)
+            if existing:
+                done = max(existing)
+                replay.open(existing[done])
+            for number, path in sorted(segments(self.directory).items()):
+                if done < number <= last:
+                    for record in read_records(path):
+                        replay.apply(record)
+            save_drawing(replay.document, os.path.join(self.directory, f'checkpoint-{last}.desenhando'),
+                         replay.raster)
+            for number, path in checkpoints(self.directory).items():
+                if number < last:
+                    os.remove(path)
+            for number, path in segments(self.directory).items():
+                if number <= last:
+                    os.remove(path)
+        except Exception:
+            logging.exception('Error compacting the autosave journal')
+        finally:
+            self._compactor = None
@@ -0,0 +1,381 @@
+"""
++----------------------------------------------------------------------------------------+
+|                                 This file is part of:                                  |
+|                                      DESENHANDO                                        |
+|                                 www.github.com/...                                     |
++----------------------------------------------------------------------------------------+
+|     Copyright (c) 2021 João Vitor, ...                                                 |
+|                                                                                        |
+|     Permission is hereby granted, free of charge, to any person obtaining a copy       |
+|     of this software and associated documentation files (the "Software"), to deal      |
+|     in the Software without restriction, including without limitation the rights       |
+|     to use, copy, modify, merge, publish, distribute, sublicense, and/or sell          |
+|     copies of the Software, and to permit persons to whom the Software is              |
+|     furnished to do so, subject to the following conditions:                           |
+|                                                                                        |
+|     The above copyright notice and this permission notice shall be included in         |
+|     all copies or substantial portions of the Software.                                |
+|                                                                                        |
+|     THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR         |
+|     IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,           |
+|     FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE        |
+|     AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER             |
+|     LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,      |
+|     OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN          |
+|     THE SOFTWARE.                                                                      |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+|                                         ABSTRACT                                       |
++----------------------------------------------------------------------------------------+
+| Minimal PNG encoder used to move pixel data to Tk and to files.                        |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+"""
+
+import struct
+import zlib
+
+import numpy as np
+
+SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# Colour types of the IHDR chunk
+GRAYSCALE = 0
+RGB = 2
+RGBA = 6
+
+
+def chunk(kind, data=b''):
+    """
+    Serialize a PNG chunk: length, type, data and CRC.
+
+    :param kind: four letter chunk type, eg. b'IDAT'
+    :param data: chunk payload
+    :return: bytes
+    """
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+
+def header(width, height, colour_type=RGBA):
+    """
+    Signature plus IHDR chunk of an 8 bit per channel, non interlaced image.
+    """
+    return SIGNATURE + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, colour_type, 0, 0, 0))
+
+
+def scanlines(pixels):
+    """
+    Raw PNG scanlines of an image: every row prefixed by filter type 0 (None).
+
+    :param pixels: uint8 array with shape (height, width, channels)
+    :return: bytes
+    """
+    height = pixels.shape[0]
+    rows = np.ascontiguousarray(pixels, dtype=np.uint8).reshape(height, -1)
+    return np.hstack((np.zeros((height, 1), dtype=np.uint8), rows)).tobytes()
+
+
+def encode_png(pixels, level=1):
+    """
+    Encode a whole RGBA (or RGB) array as a PNG file in memory.
+    Fast compression is the default, it is meant for small regions pushed to Tk.
+
+    :param pixels: uint8 array with shape (height, width, 4) or (height, width, 3)
+    :param level: zlib compression level
+    :return: bytes
+    """
+    height, width, channels = pixels.shape
+    colour_type = RGBA if channels == 4 else RGB
+    return (header(width, height, colour_type) +
+            chunk(b'IDAT', zlib.compress(scanlines(pixels), level)) +
+            chunk(b'IEND'))
+
+
+# Channels of the 8 bit colour types
+CHANNELS = {GRAYSCALE: 1, 4: 2, RGB: 3, RGBA: 4}
+
+
+def _unfilter(data, height, stride, bpp, previous=None):
+    """
+    Undo the per row filters of the scanlines of an image.
+
+    None, Sub and Up rows are decoded a whole row at a time. Average and
+    Paeth predict every byte from its left neighbour, so consecutive rows
+    of those filters are decoded together along their anti-diagonals,
+    whose pixels do not depend on each other (see _unfilter_diagonals).
+
+    :param previous: last row decoded before data, for images read in bands
+    :return: uint8 array (height, stride)
+    """
+    rows = np.frombuffer(data, dtype=np.uint8)[:height * (stride + 1)].reshape(height, stride + 1)
+    kinds = rows[:, 0]
+    if kinds.max(initial=0) > 4:
+        raise ValueError(f'unknown PNG filter {kinds.max()}')
+    result = np.zeros((height, stride), dtype=np.uint8)
+    if previous is None:
+        previous = np.zeros(stride, dtype=np.uint8)
+    y = 0
+    while y < height:
+        kind, row = kinds[y], rows[y, 1:]
+        if kind >= 3:
+            end = y + 1
+            while end < height and kinds[end] >= 3:
+                end += 1
+            result[y:end] = _unfilter_diagonals(rows[y:end, 1:], kinds[y:end], previous, bpp)
+            previous = result[end - 1]
+            y = end
+            continue
+        if kind == 0:
+            line = row
+        elif kind == 1:
+            # Sub: a running sum of every channel along the row
+            line = np.cumsum(row.reshape(-1, bpp), axis=0, dtype=np.uint64).astype(np.uint8).ravel()
+        else:
+            line = row + previous
+        result[y] = previous = line
+        y += 1
+    return result
+
+
+def _unfilter_diagonals(rows, kinds, previous, bpp):
+    """
+    Decode rows filtered with Average (3) or Paeth (4). A pixel depends on
+    the pixels to its left, above and above left, so all the pixels of an
+    anti-diagonal (y + x constant) can be decoded at once. In a padded
+    array of (rows + 1) x (width + 1) pixels the anti-diagonals are strided
+    slices, so every step is a handful of vectorized operations.
+
+    :param rows: uint8 array (rows, stride) without the filter bytes
+    :param kinds: filter of every row
+    :param previous: decoded row above the first one
+    :return: uint8 array (rows, stride)
+    """
+    height, stride = rows.shape
+    width = stride // bpp
+    # Padding: one row above (previous), one zero pixel left of every row
+    pixels = np.zeros(((height + 1) * (width + 1), bpp), dtype=np.int16)
+    grid = pixels.reshape(height + 1, width + 1, bpp)
+    grid[0, 1:] = previous.reshape(width, bpp)
+    raw = np.zeros_like(pixels)
+    raw.reshape(height + 1, width + 1, bpp)[1:, 1:] = rows.reshape(height, width, bpp)
+    paeth = kinds == 4
+    mixed = paeth.any() and not paeth.all()
+    for diagonal in range(height + width - 1):
+        first, last = max(0, diagonal - width + 1), min(height - 1, diagonal)
+        # Pixel (y, x) is at (y + 1) * (width + 1) + x + 1 = y * width + diagonal + width + 2
+        start = first * width + diagonal + width + 2
+        here = slice(start, start + (last - first) * width + 1, width)
+        left = pixels[start - 1:here.stop - 1:width]
+        above = pixels[start - width - 1:here.stop - width - 1:width]
+        if paeth[first] or mixed:
+            corner = pixels[start - width - 2:here.stop - width - 2:width]
+            estimate_left, estimate_above = np.abs(above - corner), np.abs(left - corner)
+            estimate_corner = np.abs(left + above - 2 * corner)
+            predictor = np.where((estimate_left <= estimate_above) & (estimate_left <= estimate_corner), left,
+                                 np.where(estimate_above <= estimate_corner, above, corner))
+            if mixed:
+                average = (left + above) >> 1
+                predictor = np.where(paeth[first:last + 1, None], predictor, average)
+        else:
+            predictor = (left + above) >> 1
+        pixels[here] = (raw[here] + predictor) & 0xff
+    return grid[1:, 1:].reshape(height, stride).astype(np.uint8)
+
+
+def _parse_header(payload):
+    width, height, depth, colour_type, _, _, interlace = struct.unpack('>IIBBBBB', payload)
+    if depth != 8 or interlace or colour_type not in CHANNELS:
+        raise ValueError('unsupported PNG format')
+    return width, height, colour_type
+
+
+def _to_rgba(pixels, channels):
+    if channels == 4:
+        return pixels
+    height, width = pixels.shape[:2]
+    result = np.empty((height, width, 4), dtype=np.uint8)
+    result[..., :3] = pixels[..., :1] if channels < 3 else pixels
+    result[..., 3] = pixels[..., 1] if channels == 2 else 255
+    return result
+
+
+def decode_png(data):
+    """
+    Decode an 8 bit per channel, non interlaced PNG file (as written by Tk
+    and by this module) held in memory.
+
+    :param data: bytes of the file
+    :return: uint8 array with shape (height, width, 4)
+    """
+    if not data.startswith(SIGNATURE):
+        raise ValueError('not a PNG file')
+    position = len(SIGNATURE)
+    compressed = []
+    width = height = colour_type = None
+    while position + 8 <= len(data):
+        length, kind = struct.unpack('>I4s', data[position:position + 8])
+        payload = data[position + 8:position + 8 + length]
+        position += 12 + length
+        if kind == b'IHDR':
+            width, height, colour_type = _parse_header(payload)
+        elif kind == b'IDAT':
+            compressed.append(payload)
+        elif kind == b'IEND':
+            break
+    if width is None:
+        raise ValueError('PNG file without header')
+    channels = CHANNELS[colour_type]
+    rows = _unfilter(zlib.decompress(b''.join(compressed)), height, width * channels, channels)
+    return _to_rgba(rows.reshape(height, width, channels), channels)
+
+
+class PNGReader:
+    """
+    Reads a PNG file band by band, the counterpart of PNGWriter: the IDAT
+    chunks are decompressed only as far as the rows asked for, so only the
+    current band and the decompressor state are held in memory.
+    """
+
+    def __init__(self, file):
+        """
+        :param file: binary file object opened for reading, at the start of the file
+        """
+        self.file = file
+        if file.read(len(SIGNATURE)) != SIGNATURE:
+            raise ValueError('not a PNG file')
+        self.width = self.height = None
+        self.rows_read = 0
+        self._decompressor = zlib.decompressobj()
+        self._buffer = b''
+        self._idat_left = 0
+        self._ended = False
+        while self.width is None:
+            length, kind = self._chunk_header()
+            if kind == b'IHDR':
+                self.width, self.height, colour_type = _parse_header(file.read(length))
+                file.read(4)
+            else:
+                file.seek(length + 4, 1)
+        self.channels = CHANNELS[colour_type]
+        self._stride = self.width * self.channels
+        self._previous = None
+
+    def _chunk_header(self):
+        header_ = self.file.read(8)
+        if len(header_) < 8:
+            raise ValueError('truncated PNG file')
+        return struct.unpack('>I4s', header_)
+
+    def _next_data(self):
+        """
+        Next piece of the compressed image data, b'' after the last IDAT chunk.
+        """
+        while not self._idat_left:
+            if self._ended:
+                return b''
+            length, kind = self._chunk_header()
+            if kind == b'IDAT':
+                self._idat_left = length
+            else:
+                self.file.seek(length + 4, 1)
+                self._ended = kind == b'IEND'
+        data = self.file.read(min(self._idat_left, 256 * 1024))
+        if not data:
+            raise ValueError('truncated PNG file')
+        self._idat_left -= len(data)
+        if not self._idat_left:
+            self.file.read(4)
+        return data
+
+    def read_rows(self, count):
+        """
+        Decode the next rows of the image.
+
+        :param count: rows wanted; fewer are returned at the end of the image
+        :return: uint8 array with shape (rows, width, 4)
+        """
+        count = min(count, self.height - self.rows_read)
+        needed = count * (self._stride + 1)
+        while len(self._buffer) < needed:
+            data = self._next_data()
+            if not data:
+                raise ValueError('truncated PNG file')
+            self._buffer += self._decompressor.decompress(data)
+        data, self._buffer = self._buffer[:needed], self._buffer[needed:]
+        rows = _unfilter(data, count, self._stride, self.channels, self._previous)
+        if count:
+            self._previous = rows[-1]
+        self.rows_read += count
+        return _to_rgba(rows.reshape(count, self.width, self.channels), self.channels)
+
+
+class PNGWriter:
+    """
+    Writes a PNG file band by band. Scanlines go through an incremental zlib
+    compressor and leave as IDAT chunks of at most chunk_size bytes, so only
+    the current band and the compressor state are held in memory.
+    """
+
+    def __init__(self, file, width, height, colour_type=RGBA, level=6, chunk_size=256 * 1024):
+        """
+        :param file: binary file object opened for writing
+        :param width: image width in pixels
+        :param height: image height in pixels
+        :param colour_type: RGBA or RGB
+        :param level: zlib compression level
+        :param chunk_size: maximum size of an IDAT chunk
+        """
+        self.file = file
+        self.width = width
+        self.height = height
+        self.chunk_size = chunk_size
+        self.rows_written = 0
+        self.bytes_written = 0
+        self._compressor = zlib.compressobj(level)
+        self._pending = []
+        self._pending_size = 0
+        self._write(header(width, height, colour_type))
+
+    def write_rows(self, pixels):
+        """
+        Append the next rows of the image.
+
+        :param pixels: uint8 array with shape (rows, width, channels)
+        :return: None
+        """
+        if pixels.shape[1] != self.width or self.rows_written + pixels.shape[0] > self.height:
+            raise ValueError('rows do not fit the image')
+        self._queue(self._compressor.compress(scanlines(pixels)))
+        self.rows_written += pixels.shape[0]
+
+    def close(self):
+        """
+        Flush the compressor and write the IEND chunk. The file itself is not closed.
+
+        :return: None
+        """
+        if self.rows_written != self.height:
+            raise ValueError(f'{self.rows_written} of {self.height} rows written')
+        self._queue(self._compressor.flush())
+        self._flush_chunks(final=True)
+        self._write(chunk(b'IEND'))
+
+    def _queue(self, data):
+        if data:
+            self._pending.append(data)
+            self._pending_size += len(data)
+            self._flush_chunks()
+
+    def _flush_chunks(self, final=False):
+        if self._pending_size < self.chunk_size and not (final and self._pending_size):
+            return
+        data = b''.join(self._pending)
+        end = len(data) if final else len(data) - len(data) % self.chunk_size
+        for start in range(0, end, self.chunk_size):
+            self._write(chunk(b'IDAT', data[start:min(start + self.chunk_size, end)]))
+        self._pending = [data[end:]] if end < len(data) else []
+        self._pending_size = len(data) - end
+
+    def _write(self, data):
+        self.file.write(data)
+        self.bytes_written += len(data)
@@ -0,0 +1,290 @@
+"""
++----------------------------------------------------------------------------------------+
+|                                 This file is part of:                                  |
+|                                      DESENHANDO                                        |
+|                                 www.github.com/...                                     |
++----------------------------------------------------------------------------------------+
+|     Copyright (c) 2021 João Vitor, ...                                                 |
+|                                                                                        |
+|     Permission is hereby granted, free of charge, to any person obtaining a copy       |
+|     of this software and associated documentation files (the "Software"), to deal      |
+|     in the Software without restriction, including without limitation the rights       |
+|     to use, copy, modify, merge, publish, distribute, sublicense, and/or sell          |
+|     copies of the Software, and to permit persons to whom the Software is              |
+|     furnished to do so, subject to the following conditions:                           |
+|                                                                                        |
+|     The above copyright notice and this permission notice shall be included in         |
+|     all copies or substantial portions of the Software.                                |
+|                                                                                        |
+|     THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR         |
+|     IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,           |
+|     FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE        |
+|     AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER             |
+|     LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,      |
+|     OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN          |
+|     THE SOFTWARE.                                                                      |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+|                                         ABSTRACT                                       |
++----------------------------------------------------------------------------------------+
+| Timing helpers: phases of the startup and latency of the event handlers.               |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+"""
+
+import collections
+import json
+import os
+import time
+
+
+class PhaseTimer:
+    """
+    Wall clock time of the consecutive phases of a task. Each mark() ends
+    the phase that started at the previous mark (or at start).
+    """
+
+    def __init__(self, start=None):
+        """
+        :param start: time.perf_counter() value at which the first phase began (default: now)
+        """
+        self.start = time.perf_counter() if start is None else start
+        self.phases = []
+        self._last = self.start
+
+    def mark(self, name):
+        """
+        End the current phase.
+
+        :param name: name of the phase that just ended
+        :return: its duration in seconds
+        """
+        now = time.perf_counter()
+        seconds = now - self._last
+        self.phases.append((name, seconds))
+        self._last = now
+        return seconds
+
+    @property
+    def total(self):
+        """
+        Seconds from start to the last mark.
+        """
+        return self._last - self.start
+
+    def report(self, title='Phases', target=None):
+        """
+        Table with the duration and share of every phase.
+
+        :param title: first line of the table
+        :param target: expected total in milliseconds, compared with the real one
+        :return: str
+        """
+        total = self.total
+        width = max([len(name) for name, seconds in self.phases] + [5])
+        lines = [title]
+        for name, seconds in self.phases:
+            lines.append(f'  {name:<{width}} {seconds * 1000:9.1f} ms {seconds / max(total, 1e-9):7.1%}')
+        lines.append(f'  {"total":<{width}} {total * 1000:9.1f} ms')
+        if target:
+            verdict = 'ok' if self.within(target) else 'OVER'
+            lines.append(f'  {"target":<{width}} {target:9.1f} ms  {verdict}')
+        return '\n'.join(lines)
+
+    def within(self, target):
+        """
+        The total is at most target milliseconds.
+        """
+        return self.total * 1000 <= target
+
+
+class LatencyHistogram:
+    """
+    Durations in log-linear buckets: every power of two from 1 µs is cut
+    in 2 ** sub_bits equal buckets, so any number of calls takes the same
+    memory and a bucket is never wider than a sixteenth of its values.
+    Percentiles are interpolated within the bucket they fall in.
+    """
+
+    # Powers of two of microseconds covered (about 70 minutes)
+    octaves = 32
+    sub_bits = 4
+
+    def __init__(self):
+        sub_buckets = 1 << self.sub_bits
+        self.counts = [0] * (sub_buckets + (self.octaves - self.sub_bits) * sub_buckets)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def _bucket(self, microseconds):
+        if microseconds < 1 << self.sub_bits:
+            return microseconds
+        shift = microseconds.bit_length() - 1 - self.sub_bits
+        return ((shift + 1) << self.sub_bits) + (microseconds >> shift) - (1 << self.sub_bits)
+
+    def _bounds(self, bucket):
+        """
+        :return: (lowest value, width) of a bucket, in microseconds
+        """
+        if bucket < 1 << self.sub_bits:
+            return bucket, 1
+        shift = (bucket >> self.sub_bits) - 1
+        return ((bucket & ((1 << self.sub_bits) - 1)) + (1 << self.sub_bits)) << shift, 1 << shift
+
+    def add(self, seconds):
+        microseconds = int(seconds * 1e6)
+        self.counts[min(len(self.counts) - 1, self._bucket(microseconds))] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction):
+        """
+        Duration in seconds below which fraction of the calls fall.
+        """
+        if not self.count:
+            return 0.0
+        wanted = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            if count and seen + count >= wanted:
+                low, width = self._bounds(bucket)
+                return min(self.max, (low + width * (wanted - seen) / count) / 1e6)
+            seen += count
+        return self.max
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class EventProfiler:
+    """
+    Latency of the event handlers of the interface: a histogram and the rate
+    of calls per handler, plus a trace of the recent calls in the Chrome
+    Trace Event format, readable by chrome://tracing or Perfetto.
+    """
+
+    # Calls kept for the trace; older ones are dropped
+    max_trace_events = 200000
+    # Seconds over which the events per second are counted
+    rate_window = 1.0
+    # Minimum seconds between two samples of the counters in the trace
+    counter_interval = 0.1
+
+    def __init__(self, counters=None):
+        """
+        :param counters: function returning a dict of values sampled along
+                         the calls, eg. {'canvas items': 1200}
+        """
+        self.counters = counters
+        self.histograms = {}
+        self.origin = time.perf_counter()
+        self._recent = {}
+        self._trace = collections.deque(maxlen=self.max_trace_events)
+        self._last_counters = 0.0
+
+    def record(self, name, start, end):
+        """
+        Account a call of handler name that ran from start to end (perf_counter values).
+
+        :return: None
+        """
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = LatencyHistogram()
+            self._recent[name] = collections.deque()
+        histogram.add(end - start)
+        self._count(name, end)
+        self._trace.append(('X', name, start, end - start, None))
+        if self.counters is not None and end - self._last_counters >= self.counter_interval:
+            self._last_counters = end
+            self._trace.append(('C', 'counters', end, 0, self.counters()))
+
+    def count(self, name):
+        """
+        Account an event that is not timed, eg. an input event whichever
+        handlers it reaches, for rate(name).
+
+        :return: None
+        """
+        self._recent.setdefault(name, collections.deque())
+        self._count(name, time.perf_counter())
+
+    def _count(self, name, when):
+        recent = self._recent[name]
+        recent.append(when)
+        while recent[0] < when - self.rate_window:
+            recent.popleft()
+
+    def wrap(self, name, function):
+        """
+        Function that calls function and records its latency under name.
+        """
+        clock = time.perf_counter
+
+        def profiled(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(name, start, clock())
+
+        profiled.__wrapped__ = function
+        return profiled
+
+    def rate(self, name):
+        """
+        Calls of handler name (or events counted under name) per second, over
+        the last rate_window seconds.
+        """
+        recent = self._recent.get(name)
+        if not recent:
+            return 0.0
+        now = time.perf_counter()
+        while recent and recent[0] < now - self.rate_window:
+            recent.popleft()
+        return len(recent) / self.rate_window
+
+    def summary(self):
+        """
+        One line per handler: calls, events per second and latency percentiles.
+
+        :return: str
+        """
+        lines = []
+        for name, histogram in sorted(self.histograms.items()):
+            lines.append(f'{name}: {histogram.count} calls, {self.rate(name):.0f}/s, '
+                         f'p50 {histogram.percentile(0.5) * 1000:.2f} ms, '
+                         f'p99 {histogram.percentile(0.99) * 1000:.2f} ms, '
+                         f'max {histogram.max * 1000:.2f} ms')
+        return '\n'.join(lines)
+
+    def trace_events(self):
+        """
+        The recorded calls as Chrome Trace Event dicts, times in microseconds.
+
+        :return: list of dict
+        """
+        pid = os.getpid()
+        events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0, 'args': {'name': 'Desenhando'}}]
+        for phase, name, start, duration, values in self._trace:
+            event = {'name': name, 'ph': phase, 'pid': pid, 'tid': 0,
+                     'ts': round((start - self.origin) * 1e6, 1)}
+            if phase == 'X':
+                event['dur'] = round(duration * 1e6, 1)
+            else:
+                event['args'] = values
+            events.append(event)
+        return events
+
+    def dump_trace(self, path):
+        """
+        Write the trace as a Chrome Trace Event JSON file.
+
+        :return: None
+        """
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': self.trace_events(), 'displayTimeUnit': 'ms'}, file)
@@ -0,0 +1,227 @@
+"""
++----------------------------------------------------------------------------------------+
+|                                 This file is part of:                                  |
+|                                      DESENHANDO                                        |
+|                                 www.github.com/...                                     |
++----------------------------------------------------------------------------------------+
+|     Copyright (c) 2021 João Vitor, ...                                                 |
+|                                                                                        |
+|     Permission is hereby granted, free of charge, to any person obtaining a copy       |
+|     of this software and associated documentation files (the "Software"), to deal      |
+|     in the Software without restriction, including without limitation the rights       |
+|     to use, copy, modify, merge, publish, distribute, sublicense, and/or sell          |
+|     copies of the Software, and to permit persons to whom the Software is              |
+|     furnished to do so, subject to the following conditions:                           |
+|                                                                                        |
+|     The above copyright notice and this permission notice shall be included in         |
+|     all copies or substantial portions of the Software.                                |
+|                                                                                        |
+|     THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR         |
+|     IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,           |
+|     FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE        |
+|     AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER             |
+|     LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,      |
+|     OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN          |
+|     THE SOFTWARE.                                                                      |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+|                                         ABSTRACT                                       |
++----------------------------------------------------------------------------------------+
+| Tiled multi-resolution pyramid of a large image, cached on disk, and an LRU cache.     |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+
+Cache layout, one directory per source image (see cache_directory):
+
+    info.json    width, height and tile size; written last, so its
+                 presence means the pyramid is complete
+    L-R-C.png    tile of row R, column C at level L
+
+Level 0 is the image itself, every next level halves its width and height,
+until the whole image fits in a single tile.
+"""
+
+import collections
+import hashlib
+import json
+import math
+import os
+
+TILE_SIZE = 256
+INFO_NAME = 'info.json'
+
+
+def default_directory():
+    return os.path.join(os.path.expanduser('~'), '.desenhando', 'tiles')
+
+
+def cache_directory(path, root=None):
+    """
+    Cache directory of an image file. The name depends on the path, size and
+    modification time of the file, so an edited image gets a new pyramid.
+
+    :param path: image file
+    :param root: directory holding the caches (default: ~/.desenhando/tiles)
+    :return: path of the directory
+    """
+    stat = os.stat(path)
+    key = f'{os.path.abspath(path)}\x00{stat.st_size}\x00{stat.st_mtime_ns}'
+    return os.path.join(root or default_directory(), hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+
+class Pyramid:
+    """
+    Geometry of the pyramid of an image: which tiles exist at every level,
+    which level suits a zoom and which tiles cover a region of the page.
+    The image covers the page from (0, 0), one image pixel per page pixel.
+    """
+
+    def __init__(self, directory, width, height, tile_size=TILE_SIZE):
+        self.directory = directory
+        self.width = width
+        self.height = height
+        self.tile_size = tile_size
+        self.levels = 1
+        while max(width, height) > tile_size << (self.levels - 1):
+            self.levels += 1
+
+    @classmethod
+    def load(cls, directory):
+        """
+        Pyramid of a complete cache directory, or None when there is none.
+
+        :return: Pyramid or None
+        """
+        try:
+            with open(os.path.join(directory, INFO_NAME)) as file:
+                info = json.load(file)
+            return cls(directory, info['width'], info['height'], info['tile_size'])
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def save_info(self):
+        """
+        Mark the pyramid as complete; called once every tile is written.
+
+        :return: None
+        """
+        partial = os.path.join(self.directory, INFO_NAME + '.part')
+        with open(partial, 'w') as file:
+            json.dump({'width': self.width, 'height': self.height, 'tile_size': self.tile_size}, file)
+        os.replace(partial, os.path.join(self.directory, INFO_NAME))
+
+    def level_size(self, level):
+        """
+        Size of the image at a level, in pixels.
+
+        :return: (width, height)
+        """
+        return max(1, math.ceil(self.width / 2 ** level)), max(1, math.ceil(self.height / 2 ** level))
+
+    def grid(self, level):
+        """
+        Number of tiles of a level.
+
+        :return: (columns, rows)
+        """
+        width, height = self.level_size(level)
+        return math.ceil(width / self.tile_size), math.ceil(height / self.tile_size)
+
+    def tiles(self):
+        """
+        Every tile of the pyramid, level by level.
+
+        :return: iterator of (level, row, column)
+        """
+        for level in range(self.levels):
+            columns, rows = self.grid(level)
+            for row in range(rows):
+                for column in range(columns):
+                    yield level, row, column
+
+    def tile_count(self):
+        return sum(columns * rows for columns, rows in map(self.grid, range(self.levels)))
+
+    def tile_path(self, level, row, column):
+        return os.path.join(self.directory, f'{level}-{row}-{column}.png')
+
+    def source_rect(self, level, row, column):
+        """
+        Rectangle of the full resolution image covered by a tile, which is
+        also its place on the page.
+
+        :return: (x1, y1, x2, y2), x2/y2 exclusive
+        """
+        span = self.tile_size << level
+        return (column * span, row * span,
+                min(self.width, (column + 1) * span), min(self.height, (row + 1) * span))
+
+    def level_for(self, zoom):
+        """
+        Coarsest level that still has at least one pixel per screen pixel at zoom.
+
+        :return: level number
+        """
+        if zoom >= 1:
+            return 0
+        return max(0, min(self.levels - 1, int(math.floor(math.log2(1 / zoom) + 1e-9))))
+
+    def visible_tiles(self, region, level):
+        """
+        Tiles of a level intersecting a page region.
+
+        :param region: (x1, y1, x2, y2) in page pixels
+        :return: list of (row, column)
+        """
+        span = self.tile_size << level
+        columns, rows = self.grid(level)
+        x1, y1, x2, y2 = region
+        first_column, last_column = max(0, int(x1 // span)), min(columns - 1, math.ceil(x2 / span) - 1)
+        first_row, last_row = max(0, int(y1 // span)), min(rows - 1, math.ceil(y2 / span) - 1)
+        return [(row, column) for row in range(first_row, last_row + 1)
+                for column in range(first_column, last_column + 1)]
+
+
+class LRUCache:
+    """
+    Mapping that keeps the total size of its entries under capacity, dropping
+    the least recently used ones. on_evict(key, value) is called for every
+    dropped entry. Entries count as 1 unless put with another size.
+    """
+
+    def __init__(self, capacity, on_evict=None):
+        self.capacity = capacity
+        self.on_evict = on_evict
+        self.size = 0
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        if key not in self._entries:
+            return default
+        self._entries.move_to_end(key)
+        return self._entries[key][0]
+
+    def put(self, key, value, size=1):
+        if key in self._entries:
+            self.size -= self._entries[key][1]
+        self._entries[key] = value, size
+        self._entries.move_to_end(key)
+        self.size += size
+        while self.size > self.capacity and len(self._entries) > 1:
+            old_key, (old_value, old_size) = self._entries.popitem(last=False)
+            self.size -= old_size
+            if self.on_evict is not None:
+                self.on_evict(old_key, old_value)
+
+    def clear(self):
+        entries, self._entries = self._entries, collections.OrderedDict()
+        self.size = 0
+        if self.on_evict is not None:
+            for key, (value, size) in entries.items():
+                self.on_evict(key, value)
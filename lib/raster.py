@@ -0,0 +1,357 @@
+"""
++----------------------------------------------------------------------------------------+
+|                                 This file is part of:                                  |
+|                                      DESENHANDO                                        |
+|                                 www.github.com/...                                     |
++----------------------------------------------------------------------------------------+
+|     Copyright (c) 2021 João Vitor, ...                                                 |
+|                                                                                        |
+|     Permission is hereby granted, free of charge, to any person obtaining a copy       |
+|     of this software and associated documentation files (the "Software"), to deal      |
+|     in the Software without restriction, including without limitation the rights       |
+|     to use, copy, modify, merge, publish, distribute, sublicense, and/or sell          |
+|     copies of the Software, and to permit persons to whom the Software is              |
+|     furnished to do so, subject to the following conditions:                           |
+|                                                                                        |
+|     The above copyright notice and this permission notice shall be included in         |
+|     all copies or substantial portions of the Software.                                |
+|                                                                                        |
+|     THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR         |
+|     IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,           |
+|     FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE        |
+|     AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER             |
+|     LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,      |
+|     OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN          |
+|     THE SOFTWARE.                                                                      |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+|                                         ABSTRACT                                       |
++----------------------------------------------------------------------------------------+
+| NumPy backed pixel layer with dirty rectangle tracking.                                |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+"""
+
+import numpy as np
+
+from lib.colors import color_value
+
+
+def parse_color(color, alpha=255):
+    """
+    Convert '#rgb', '#rrggbb', '#rrrgggbbb', '#rrrrggggbbbb', '#rrggbbaa',
+    a Tk color name or an (r, g, b[, a]) tuple to an RGBA tuple.
+
+    :param color: color specification
+    :param alpha: opacity used when the color has none
+    :return: (r, g, b, a)
+    """
+    if isinstance(color, str):
+        value = color_value(color) or color.lstrip('#')
+        if len(value) == 3:
+            value = ''.join(c * 2 for c in value)
+        elif len(value) in (9, 12):
+            # 12 and 16 bits per channel: the most significant 8 are enough
+            step = len(value) // 3
+            value = ''.join(value[i:i + 2] for i in range(0, len(value), step))
+        if len(value) not in (6, 8):
+            raise ValueError(f'unknown color {color!r}')
+        channels = [int(value[i:i + 2], 16) for i in range(0, len(value), 2)]
+    else:
+        channels = [int(c) for c in color]
+    if len(channels) == 3:
+        channels.append(alpha)
+    return tuple(channels)
+
+
+def _area_weights(source, target):
+    """
+    Share of every source pixel in every target pixel when source pixels are
+    stretched over target ones.
+
+    :return: float32 array (target, source), rows summing to 1
+    """
+    edges = np.arange(target + 1) * (source / target)
+    starts = np.arange(source)
+    overlap = np.minimum(edges[1:, None], starts[None, :] + 1) - np.maximum(edges[:-1, None], starts[None, :])
+    weights = np.clip(overlap, 0, None)
+    return (weights / weights.sum(axis=1, keepdims=True)).astype(np.float32)
+
+
+def resample(pixels, width, height):
+    """
+    Scale an RGBA image to any size by area averaging, in premultiplied
+    alpha so that transparent pixels do not darken the edges.
+
+    :param pixels: uint8 array (rows, columns, 4)
+    :param width: new width
+    :param height: new height
+    :return: uint8 array (height, width, 4)
+    """
+    rows, columns = pixels.shape[:2]
+    if (columns, rows) == (width, height):
+        return pixels
+    image = pixels.astype(np.float32)
+    image[..., :3] *= image[..., 3:] / 255
+    horizontal = _area_weights(columns, width)
+    vertical = _area_weights(rows, height)
+    image = (vertical @ image.transpose(2, 0, 1) @ horizontal.T).transpose(1, 2, 0)
+    alpha = image[..., 3:]
+    image[..., :3] = np.where(alpha > 0, image[..., :3] * 255 / np.maximum(alpha, 1e-6), 0)
+    return np.clip(np.rint(image), 0, 255).astype(np.uint8)
+
+
+def halve(pixels):
+    """
+    Scale an RGBA image to half its size, every pixel the average of a 2 x 2
+    block in premultiplied alpha. An odd last row or column is averaged with
+    itself.
+
+    :param pixels: uint8 array (rows, columns, 4)
+    :return: uint8 array (ceil(rows / 2), ceil(columns / 2), 4)
+    """
+    rows, columns = pixels.shape[:2]
+    image = pixels.astype(np.float32)
+    image[..., :3] *= image[..., 3:] / 255
+    if rows % 2 or columns % 2:
+        image = np.pad(image, ((0, rows % 2), (0, columns % 2), (0, 0)), mode='edge')
+    image = (image[0::2, 0::2] + image[0::2, 1::2] + image[1::2, 0::2] + image[1::2, 1::2]) / 4
+    alpha = image[..., 3:]
+    image[..., :3] = np.where(alpha > 0, image[..., :3] * 255 / np.maximum(alpha, 1e-6), 0)
+    return np.clip(np.rint(image), 0, 255).astype(np.uint8)
+
+
+class RasterLayer:
+    """
+    Pixel layer of the drawing stored as a (height, width, 4) RGBA array.
+
+    Every operation touches only the pixels inside its own bounding box and
+    records it as dirty, so the display can upload just the changed regions.
+    """
+
+    # Past this many rectangles the dirty list collapses into its bounding box
+    max_dirty_rects = 32
+
+    def __init__(self, width, height):
+        self.pixels = np.zeros((height, width, 4), dtype=np.uint8)
+        self._dirty = []
+        # Bounding box of the changes since take_changes, for the autosave journal
+        self._changed = None
+        # Grows with every change, so a saved file knows whether its copy is current
+        self.revision = 0
+
+    @property
+    def width(self):
+        return self.pixels.shape[1]
+
+    @property
+    def height(self):
+        return self.pixels.shape[0]
+
+    def resize(self, width, height):
+        """
+        Change the page size, keeping the pixels of the common area.
+
+        :return: None
+        """
+        pixels = np.zeros((height, width, 4), dtype=np.uint8)
+        h = min(height, self.height)
+        w = min(width, self.width)
+        pixels[:h, :w] = self.pixels[:h, :w]
+        self.pixels = pixels
+        self._dirty = [(0, 0, width, height)]
+        self._changed = None
+        self.revision += 1
+
+    def copy(self):
+        """
+        Copy of the pixels, without the dirty rectangles.
+        """
+        layer = RasterLayer(0, 0)
+        layer.pixels = self.pixels.copy()
+        return layer
+
+    def clip(self, x1, y1, x2, y2):
+        """
+        Integer rectangle clipped to the layer, or None when it falls outside.
+        """
+        x1 = max(0, int(np.floor(x1)))
+        y1 = max(0, int(np.floor(y1)))
+        x2 = min(self.width, int(np.ceil(x2)))
+        y2 = min(self.height, int(np.ceil(y2)))
+        if x1 >= x2 or y1 >= y2:
+            return None
+        return x1, y1, x2, y2
+
+    def mark_dirty(self, x1, y1, x2, y2):
+        rect = self.clip(x1, y1, x2, y2)
+        if rect is None:
+            return
+        self.revision += 1
+        changed = self._changed
+        self._changed = rect if changed is None else (min(changed[0], rect[0]), min(changed[1], rect[1]),
+                                                      max(changed[2], rect[2]), max(changed[3], rect[3]))
+        dirty = self._dirty
+        # Merge with an overlapping rectangle to keep the list short
+        for i, (a1, b1, a2, b2) in enumerate(dirty):
+            if rect[0] <= a2 and a1 <= rect[2] and rect[1] <= b2 and b1 <= rect[3]:
+                dirty[i] = min(a1, rect[0]), min(b1, rect[1]), max(a2, rect[2]), max(b2, rect[3])
+                break
+        else:
+            dirty.append(rect)
+        if len(dirty) > self.max_dirty_rects:
+            self._dirty = [(min(r[0] for r in dirty), min(r[1] for r in dirty),
+                            max(r[2] for r in dirty), max(r[3] for r in dirty))]
+
+    def invalidate(self):
+        """
+        Mark the whole layer dirty for the display only, eg. after a zoom
+        change: it is not recorded as a change of the pixels.
+
+        :return: None
+        """
+        self._dirty = [(0, 0, self.width, self.height)]
+
+    def take_dirty(self):
+        """
+        Dirty rectangles since the last call, as (x1, y1, x2, y2) with x2/y2 exclusive.
+
+        :return: list of rectangles
+        """
+        dirty, self._dirty = self._dirty, []
+        return dirty
+
+    def take_changes(self):
+        """
+        Bounding box of the pixels changed since the last call, or None.
+        Unlike take_dirty, it is not consumed by the display.
+
+        :return: (x1, y1, x2, y2) or None
+        """
+        changed, self._changed = self._changed, None
+        return changed
+
+    def composite(self, x1, y1, coverage, color):
+        """
+        Paint color over the region starting at (x1, y1) weighted by coverage.
+
+        :param x1: left column of the region
+        :param y1: top row of the region
+        :param coverage: float array (rows, columns) with values in [0, 1]
+        :param color: RGBA tuple
+        :return: None
+        """
+        covered = coverage > 0
+        rows = np.flatnonzero(covered.any(axis=1))
+        if not len(rows):
+            return
+        columns = np.flatnonzero(covered.any(axis=0))
+        # Work only inside the bounding box of the covered pixels, and only on
+        # those pixels when they are a small part of it (eg. an oval outline)
+        top, bottom, left, right = rows[0], rows[-1] + 1, columns[0], columns[-1] + 1
+        coverage = coverage[top:bottom, left:right]
+        covered = covered[top:bottom, left:right]
+        x1 += left
+        y1 += top
+        region = self.pixels[y1:y1 + coverage.shape[0], x1:x1 + coverage.shape[1]]
+        if covered.mean() < 0.5:
+            index = np.nonzero(covered)
+            region[index] = self._over(region[index], coverage[index], color)
+        else:
+            region[...] = self._over(region, coverage, color)
+        self.mark_dirty(x1, y1, x1 + coverage.shape[1], y1 + coverage.shape[0])
+
+    @staticmethod
+    def _over(pixels, coverage, color):
+        """
+        Pixels with color painted over them, weighted by coverage.
+        """
+        src_alpha = coverage.astype(np.float32) * np.float32(color[3] / 255.0)
+        dst_alpha = pixels[..., 3] * np.float32(1 / 255.0)
+        out_alpha = src_alpha + dst_alpha * (1 - src_alpha)
+        safe = np.where(out_alpha > 0, out_alpha, 1)
+        result = np.empty_like(pixels)
+        for c in range(3):
+            value = (color[c] * src_alpha + pixels[..., c] * dst_alpha * (1 - src_alpha)) / safe
+            result[..., c] = np.clip(value + 0.5, 0, 255).astype(np.uint8)
+        result[..., 3] = np.clip(out_alpha * 255 + 0.5, 0, 255).astype(np.uint8)
+        return result
+
+    def blend(self, other, opacity=1.0):
+        """
+        Composite another layer of the same size over this one.
+
+        :param other: RasterLayer
+        :param opacity: extra opacity applied to other
+        :return: None
+        """
+        src = other.pixels.astype(np.float32) / 255.0
+        dst = self.pixels.astype(np.float32) / 255.0
+        src_alpha = src[..., 3:] * opacity
+        dst_alpha = dst[..., 3:]
+        out_alpha = src_alpha + dst_alpha * (1 - src_alpha)
+        safe = np.where(out_alpha > 0, out_alpha, 1)
+        rgb = (src[..., :3] * src_alpha + dst[..., :3] * dst_alpha * (1 - src_alpha)) / safe
+        self.pixels[..., :3] = np.clip(rgb * 255 + 0.5, 0, 255).astype(np.uint8)
+        self.pixels[..., 3] = np.clip(out_alpha[..., 0] * 255 + 0.5, 0, 255).astype(np.uint8)
+        self.mark_dirty(0, 0, self.width, self.height)
+
+    def dab(self, x, y, radius, color, hardness=0.8, erase=False):
+        """
+        Stamp a round brush centered at (x, y). Only the brush bounding box is touched.
+
+        :param x: center x in page pixels
+        :param y: center y in page pixels
+        :param radius: brush radius in pixels
+        :param color: brush color (see parse_color)
+        :param hardness: fraction of the radius painted at full opacity
+        :param erase: remove opacity instead of painting
+        :return: None
+        """
+        rect = self.clip(x - radius - 1, y - radius - 1, x + radius + 1, y + radius + 1)
+        if rect is None:
+            return
+        x1, y1, x2, y2 = rect
+        yy, xx = np.mgrid[y1:y2, x1:x2]
+        distance = np.hypot(xx + 0.5 - x, yy + 0.5 - y)
+        inner = radius * hardness
+        coverage = np.clip((radius - distance) / max(radius - inner, 0.5), 0, 1)
+        if erase:
+            region = self.pixels[y1:y2, x1:x2, 3]
+            region[...] = (region * (1 - coverage)).astype(np.uint8)
+            self.mark_dirty(x1, y1, x2, y2)
+        else:
+            self.composite(x1, y1, coverage, parse_color(color))
+
+    def fill_rect(self, x1, y1, x2, y2, color):
+        rect = self.clip(x1, y1, x2, y2)
+        if rect is None:
+            return
+        x1, y1, x2, y2 = rect
+        self.pixels[y1:y2, x1:x2] = parse_color(color)
+        self.mark_dirty(x1, y1, x2, y2)
+
+    def clear_rect(self, x1, y1, x2, y2):
+        rect = self.clip(x1, y1, x2, y2)
+        if rect is None:
+            return
+        x1, y1, x2, y2 = rect
+        self.pixels[y1:y2, x1:x2] = 0
+        self.mark_dirty(x1, y1, x2, y2)
+
+    def region(self, x1, y1, x2, y2, scale=1.0):
+        """
+        Pixels of a page rectangle resampled (nearest neighbour) for display at scale.
+
+        :param x1: left of the rectangle in view pixels
+        :param y1: top of the rectangle in view pixels
+        :param x2: right of the rectangle in view pixels (exclusive)
+        :param y2: bottom of the rectangle in view pixels (exclusive)
+        :param scale: view scale (1.0 = 100%)
+        :return: uint8 array (y2 - y1, x2 - x1, 4)
+        """
+        if scale == 1:
+            return self.pixels[y1:y2, x1:x2]
+        columns = np.minimum(((np.arange(x1, x2) + 0.5) / scale).astype(np.intp), self.width - 1)
+        rows = np.minimum(((np.arange(y1, y2) + 0.5) / scale).astype(np.intp), self.height - 1)
+        return self.pixels[rows[:, None], columns[None, :]]
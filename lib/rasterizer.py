@@ -0,0 +1,482 @@
+"""
++----------------------------------------------------------------------------------------+
+|                                 This file is part of:                                  |
+|                                      DESENHANDO                                        |
+|                                 www.github.com/...                                     |
++----------------------------------------------------------------------------------------+
+|     Copyright (c) 2021 João Vitor, ...                                                 |
+|                                                                                        |
+|     Permission is hereby granted, free of charge, to any person obtaining a copy       |
+|     of this software and associated documentation files (the "Software"), to deal      |
+|     in the Software without restriction, including without limitation the rights       |
+|     to use, copy, modify, merge, publish, distribute, sublicense, and/or sell          |
+|     copies of the Software, and to permit persons to whom the Software is              |
+|     furnished to do so, subject to the following conditions:                           |
+|                                                                                        |
+|     The above copyright notice and this permission notice shall be included in         |
+|     all copies or substantial portions of the Software.                                |
+|                                                                                        |
+|     THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR         |
+|     IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,           |
+|     FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE        |
+|     AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER             |
+|     LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,      |
+|     OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN          |
+|     THE SOFTWARE.                                                                      |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+|                                         ABSTRACT                                       |
++----------------------------------------------------------------------------------------+
+| Anti-aliased rendering of document items into RGBA pixel layers.                       |
+| Pure Python and NumPy: it does not import tkinter, so drawings can be rendered on      |
+| machines without a display.                                                            |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+"""
+
+import logging
+from functools import lru_cache
+
+import numpy as np
+
+from lib.raster import RasterLayer, parse_color
+
+# Drawn instead of the colors that can not be parsed, the default fill of Tk items
+FALLBACK_COLOR = (0, 0, 0, 255)
+
+
+@lru_cache(maxsize=256)
+def paint(color):
+    """
+    RGBA of an item color. A color that can not be parsed is logged and
+    drawn as FALLBACK_COLOR, so one bad item does not fail the whole render.
+    """
+    try:
+        return parse_color(color)
+    except (ValueError, TypeError):
+        logging.warning(f'Unknown color {color!r}, drawn as {FALLBACK_COLOR}')
+        return FALLBACK_COLOR
+
+
+# Classic 5x7 font for the printable ASCII characters. Each glyph is five
+# columns, the least significant bit of a column is its top row.
+FONT_5X7 = bytes.fromhex(
+    '0000000000 00005f0000 0007000700 147f147f14 242a7f2a12 2313086462 3649552250 0005030000'
+    '001c224100 0041221c00 082a1c2a08 08083e0808 0050300000 0808080808 0060600000 2010080402'
+    '3e5149453e 00427f4000 4261514946 2141454b31 1814127f10 2745454539 3c4a494930 0171090503'
+    '3649494936 064949291e 0036360000 0056360000 0814224100 1414141414 0041221408 0201510906'
+    '324979413e 7e1111117e 7f49494936 3e41414122 7f4141221c 7f49494941 7f09090101 3e41415132'
+    '7f0808087f 00417f4100 2040413f01 7f08142241 7f40404040 7f020c027f 7f0408107f 3e4141413e'
+    '7f09090906 3e4151215e 7f09192946 4649494931 01017f0101 3f4040403f 1f2040201f 7f2018207f'
+    '6314081463 0304780403 6151494543 007f414100 0204081020 0041417f00 0402010204 4040404040'
+    '0001020400 2054545478 7f48444438 3844444420 384444487f 3854545418 087e090102 081454543c'
+    '7f08040478 00447d4000 2040443d00 007f102844 00417f4000 7c04180478 7c08040478 3844444438'
+    '7c14141408 081414187c 7c08040408 4854545420 043f444020 3c4040207c 1c2040201c 3c4030403c'
+    '4428102844 0c5050503c 4464544c44 0008364100 00007f0000 0041360800 1008081008'
+)
+FONT_FIRST = 32
+FONT_COLUMNS = 5
+FONT_ROWS = 7
+# Size of a character cell and of a line, in font units
+CELL_WIDTH = 6
+LINE_HEIGHT = 9
+
+# Horizontal and vertical position of the anchor point inside a text block
+ANCHORS = {
+    'nw': (0, 0), 'n': (0.5, 0), 'ne': (1, 0),
+    'w': (0, 0.5), 'center': (0.5, 0.5), 'e': (1, 0.5),
+    'sw': (0, 1), 's': (0.5, 1), 'se': (1, 1),
+}
+
+
+def font_pixel_size(font, scale=1.0):
+    """
+    Height in pixels of a Tk font description; positive sizes are points,
+    negative ones pixels, as in Tk.
+    """
+    size = 12
+    if isinstance(font, (tuple, list)) and len(font) > 1:
+        size = int(font[1])
+    elif isinstance(font, str) and len(font.split()) > 1:
+        try:
+            size = int(font.split()[1])
+        except ValueError:
+            pass
+    pixels = -size if size < 0 else size * 4 / 3
+    return max(pixels, 1) * scale
+
+
+def glyph_mask(lines, justify='left'):
+    """
+    Boolean mask of a block of text, one cell per font unit.
+
+    :param lines: list of strings
+    :param justify: 'left', 'center' or 'right'
+    :return: array (len(lines) * LINE_HEIGHT, longest line * CELL_WIDTH)
+    """
+    columns = max(len(line) for line in lines) * CELL_WIDTH
+    mask = np.zeros((len(lines) * LINE_HEIGHT, max(columns, 1)), dtype=bool)
+    bits = 1 << np.arange(FONT_ROWS)
+    for row, line in enumerate(lines):
+        offset = columns - len(line) * CELL_WIDTH
+        offset = {'center': offset // 2, 'right': offset}.get(justify, 0)
+        for i, char in enumerate(line):
+            code = ord(char) - FONT_FIRST
+            if not 0 <= code < len(FONT_5X7) // FONT_COLUMNS:
+                code = ord('?') - FONT_FIRST
+            glyph = np.frombuffer(FONT_5X7, dtype=np.uint8, count=FONT_COLUMNS, offset=code * FONT_COLUMNS)
+            cell = (glyph[None, :] & bits[:, None]) != 0
+            top = row * LINE_HEIGHT
+            left = offset + i * CELL_WIDTH
+            mask[top:top + FONT_ROWS, left:left + FONT_COLUMNS] = cell
+    return mask
+
+
+def _overlap(start, unit, cells, pixel_start, pixels):
+    """
+    Matrix (pixels, cells) with the length of every pixel covered by every cell.
+    """
+    edges = start + unit * np.arange(cells + 1)
+    pixel = pixel_start + np.arange(pixels)
+    low = np.maximum(pixel[:, None], edges[None, :-1])
+    high = np.minimum(pixel[:, None] + 1, edges[None, 1:])
+    return np.clip(high - low, 0, 1)
+
+
+class Rasterizer:
+    """
+    Draws document items on a RasterLayer with anti-aliased edges.
+
+    Page coordinates are mapped to pixels by (x - origin) * scale, so the same
+    items can be rendered at any zoom or into a band of a larger image.
+    """
+
+    def __init__(self, target, scale=1.0, origin=(0, 0)):
+        """
+        :param target: RasterLayer that receives the pixels
+        :param scale: pixels per page pixel
+        :param origin: page point mapped to the top left pixel of target
+        """
+        self.target = target
+        self.scale = scale
+        self.origin = origin
+
+    def draw_items(self, items):
+        for item in items:
+            self.draw_item(item)
+
+    def draw_item(self, item):
+        """
+        Draw one document item using the Tk defaults for missing options.
+
+        :param item: lib.document.Item
+        :return: None
+        """
+        options = item.options
+        if options.get('state') == 'hidden':
+            return
+        width = float(options.get('width', 1)) * self.scale
+        xs, ys = self._transform(item.coords)
+        kind = item.kind
+        if kind == 'line':
+            color = options.get('fill', '#000000')
+            if color:
+                self.stroke(xs, ys, width, color)
+        elif kind in ('rectangle', 'oval'):
+            fill = options.get('fill', '')
+            outline = options.get('outline', '#000000')
+            x1, x2 = sorted(xs[:2])
+            y1, y2 = sorted(ys[:2])
+            if kind == 'rectangle':
+                if fill:
+                    self.fill_rectangle(x1, y1, x2, y2, fill)
+                if outline:
+                    self.stroke(np.array([x1, x2, x2, x1]), np.array([y1, y1, y2, y2]), width, outline, closed=True)
+            else:
+                if fill:
+                    self.fill_oval(x1, y1, x2, y2, fill)
+                if outline:
+                    self.stroke_oval(x1, y1, x2, y2, width, outline)
+        elif kind == 'polygon':
+            fill = options.get('fill', '#000000')
+            outline = options.get('outline', '')
+            if fill:
+                self.fill_polygon(xs, ys, fill)
+            if outline:
+                self.stroke(xs, ys, width, outline, closed=True)
+        elif kind == 'text':
+            color = options.get('fill', '#000000')
+            if color and options.get('text'):
+                self.text(xs[0], ys[0], str(options['text']), color, font_pixel_size(options.get('font'), self.scale),
+                          options.get('anchor', 'center'), options.get('justify', 'left'))
+
+    def _transform(self, coords):
+        points = np.asarray(coords, dtype=np.float64)
+        return (points[0::2] - self.origin[0]) * self.scale, (points[1::2] - self.origin[1]) * self.scale
+
+    def _region(self, x1, y1, x2, y2):
+        """
+        Pixel rectangle of target covering the given area, or None when outside.
+        """
+        return self.target.clip(x1 - 1, y1 - 1, x2 + 1, y2 + 1)
+
+    def stroke(self, xs, ys, width, color, closed=False):
+        """
+        Draw a polyline with round joins. The coverage of all segments is
+        combined before compositing, so joints are not painted twice.
+
+        The pixels are visited in bands of stroke_band rows; in every band
+        only the columns the segments pass through are computed, so a long
+        diagonal costs its length times its width, not its bounding box.
+
+        :return: None
+        """
+        if len(xs) == 0:
+            return
+        if closed:
+            xs = np.append(xs, xs[0])
+            ys = np.append(ys, ys[0])
+        half = max(width, 1.0) / 2
+        # Lines thinner than one pixel are drawn one pixel wide and fainter
+        strength = min(width, 1.0)
+        rect = self._region(xs.min() - half, ys.min() - half, xs.max() + half, ys.max() + half)
+        if rect is None:
+            return
+        rx1, ry1, rx2, ry2 = rect
+        if len(xs) == 1:
+            xs = np.append(xs, xs[0])
+            ys = np.append(ys, ys[0])
+        pad = half + 1
+        ax, ay, bx, by = xs[:-1], ys[:-1], xs[1:], ys[1:]
+        top = np.minimum(ay, by) - pad
+        bottom = np.maximum(ay, by) + pad
+        color = paint(color)
+        for band_top in range(ry1, ry2, self.stroke_band):
+            band_bottom = min(band_top + self.stroke_band, ry2)
+            near = np.flatnonzero((top < band_bottom) & (bottom > band_top))
+            if not len(near):
+                continue
+            # Columns of every segment inside the band, widened by pad
+            sax, say, sbx, sby = ax[near], ay[near], bx[near], by[near]
+            dy = sby - say
+            with np.errstate(divide='ignore', invalid='ignore'):
+                t1 = np.where(dy != 0, (band_top - pad - say) / dy, 0.0)
+                t2 = np.where(dy != 0, (band_bottom + pad - say) / dy, 1.0)
+            low = np.clip(np.minimum(t1, t2), 0, 1)
+            high = np.clip(np.maximum(t1, t2), 0, 1)
+            x_low = sax + low * (sbx - sax)
+            x_high = sax + high * (sbx - sax)
+            left = np.maximum(np.floor(np.minimum(x_low, x_high) - pad), rx1).astype(np.intp)
+            right = np.minimum(np.ceil(np.maximum(x_low, x_high) + pad), rx2).astype(np.intp)
+            inside = left < right
+            if not inside.any():
+                continue
+            near, left, right = near[inside], left[inside], right[inside]
+            cx1, cx2 = int(left.min()), int(right.max())
+            rows = band_bottom - band_top
+            if rows * (cx2 - cx1) * len(near) <= self.stroke_block:
+                coverage = self._capsules(ax[near], ay[near], bx[near], by[near], half,
+                                          cx1, band_top, cx2, band_bottom)
+            else:
+                coverage = np.zeros((rows, cx2 - cx1), dtype=np.float64)
+                for index, x1, x2 in zip(near.tolist(), left.tolist(), right.tolist()):
+                    value = self._capsules(ax[index:index + 1], ay[index:index + 1], bx[index:index + 1],
+                                           by[index:index + 1], half, x1, band_top, x2, band_bottom)
+                    window = coverage[:, x1 - cx1:x2 - cx1]
+                    np.maximum(window, value, out=window)
+            self.target.composite(cx1, band_top, coverage * strength, color)
+
+    # Rows of the bands of stroke, and the most pixel and segment pairs
+    # computed in one NumPy operation
+    stroke_band = 64
+    stroke_block = 1 << 18
+
+    @staticmethod
+    def _capsules(ax, ay, bx, by, half, x1, y1, x2, y2):
+        """
+        Coverage of the pixels of the rectangle (x1, y1) - (x2, y2) by the
+        segments a - b drawn half pixels thick with round ends.
+
+        :return: float array (rows, columns)
+        """
+        px = (np.arange(x1, x2) + 0.5)[None, :, None] - ax
+        py = (np.arange(y1, y2) + 0.5)[:, None, None] - ay
+        dx, dy = bx - ax, by - ay
+        length = dx * dx + dy * dy
+        t = np.clip((px * dx + py * dy) / np.where(length > 0, length, 1), 0, 1)
+        distance = np.hypot(px - t * dx, py - t * dy).min(axis=2)
+        return np.clip(half + 0.5 - distance, 0, 1)
+
+    def fill_rectangle(self, x1, y1, x2, y2, color):
+        rect = self._region(x1, y1, x2, y2)
+        if rect is None:
+            return
+        rx1, ry1, rx2, ry2 = rect
+        # Exact area of every pixel covered by the rectangle, separable in x and y
+        columns = np.arange(rx1, rx2)
+        rows = np.arange(ry1, ry2)
+        cx = np.clip(np.minimum(columns + 1, x2) - np.maximum(columns, x1), 0, 1)
+        cy = np.clip(np.minimum(rows + 1, y2) - np.maximum(rows, y1), 0, 1)
+        self.target.composite(rx1, ry1, np.outer(cy, cx), paint(color))
+
+    def _oval_distance(self, x1, y1, x2, y2, pad):
+        rect = self._region(x1 - pad, y1 - pad, x2 + pad, y2 + pad)
+        if rect is None:
+            return None, None
+        rx1, ry1, rx2, ry2 = rect
+        cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+        ax, ay = max((x2 - x1) / 2, 0.5), max((y2 - y1) / 2, 0.5)
+        py, px = np.mgrid[ry1:ry2, rx1:rx2]
+        # Approximate signed distance to the ellipse border, in pixels
+        radius = np.hypot((px + 0.5 - cx) / ax, (py + 0.5 - cy) / ay)
+        return rect, (radius - 1) * min(ax, ay)
+
+    def fill_oval(self, x1, y1, x2, y2, color):
+        rect, distance = self._oval_distance(x1, y1, x2, y2, 0)
+        if rect is not None:
+            self.target.composite(rect[0], rect[1], np.clip(0.5 - distance, 0, 1), paint(color))
+
+    def stroke_oval(self, x1, y1, x2, y2, width, color):
+        half = max(width, 1.0) / 2
+        rect, distance = self._oval_distance(x1, y1, x2, y2, half)
+        if rect is not None:
+            coverage = np.clip(half + 0.5 - np.abs(distance), 0, 1) * min(width, 1.0)
+            self.target.composite(rect[0], rect[1], coverage, paint(color))
+
+    def text(self, x, y, text, color, size, anchor='center', justify='left'):
+        """
+        Draw text with the built-in 5x7 font scaled to size pixels. Each font
+        cell is integrated over the pixels it covers, which gives anti-aliased
+        glyphs at any size.
+
+        :param x: anchor x in pixels
+        :param y: anchor y in pixels
+        :param text: string, may contain new lines
+        :param color: text color
+        :param size: font size in pixels
+        :param anchor: Tk anchor of (x, y) in the text block
+        :param justify: alignment of the lines
+        :return: None
+        """
+        mask = glyph_mask(text.split('\n'), justify)
+        unit = size / (FONT_ROWS + 1)
+        rows, columns = mask.shape
+        # The block ends at the last glyph column and the last glyph row
+        width = (columns - 1) * unit
+        height = (rows - (LINE_HEIGHT - FONT_ROWS)) * unit
+        ax, ay = ANCHORS.get(anchor, ANCHORS['center'])
+        left = x - width * ax
+        top = y - height * ay
+        rect = self._region(left, top, left + columns * unit, top + rows * unit)
+        if rect is None:
+            return
+        rx1, ry1, rx2, ry2 = rect
+        wx = _overlap(left, unit, columns, rx1, rx2 - rx1)
+        wy = _overlap(top, unit, rows, ry1, ry2 - ry1)
+        coverage = wy @ mask.astype(np.float64) @ wx.T
+        self.target.composite(rx1, ry1, np.clip(coverage, 0, 1), paint(color))
+
+    def fill_polygon(self, xs, ys, color, samples=4):
+        """
+        Fill a polygon with the even-odd rule, like Tk. Every pixel row is
+        sampled samples times and spans are accumulated with exact horizontal
+        coverage.
+
+        :return: None
+        """
+        if len(xs) < 3:
+            return
+        rect = self._region(xs.min(), ys.min(), xs.max(), ys.max())
+        if rect is None:
+            return
+        rx1, ry1, rx2, ry2 = rect
+        ax, ay = xs, ys
+        bx, by = np.roll(xs, -1), np.roll(ys, -1)
+        edges = ay != by
+        ax, ay, bx, by = ax[edges], ay[edges], bx[edges], by[edges]
+        low = np.minimum(ay, by)
+        high = np.maximum(ay, by)
+        columns = np.arange(rx1, rx2 + 1, dtype=np.float64)
+
+        coverage = np.zeros((ry2 - ry1, rx2 - rx1), dtype=np.float32)
+        offsets = (np.arange(samples) + 0.5) / samples
+        for row in range(ry1, ry2):
+            line = coverage[row - ry1]
+            for offset in offsets:
+                y = row + offset
+                crossing = (low <= y) & (y < high)
+                if not crossing.any():
+                    continue
+                x = ax[crossing] + (y - ay[crossing]) * (bx[crossing] - ax[crossing]) / (by[crossing] - ay[crossing])
+                x.sort()
+                starts, ends = x[0::2], x[1::2]
+                # Integral of the spans up to every pixel border, then per pixel difference
+                area = np.clip(columns[:, None] - starts[None, :], 0, (ends - starts)[None, :]).sum(axis=1)
+                line += np.diff(area).astype(np.float32)
+        self.target.composite(rx1, ry1, coverage / samples, paint(color))
+
+
+def draw_layers(document, layers, target, scale=1.0, origin=(0, 0)):
+    """
+    Draw the visible layers among the given ones on target, bottom first,
+    applying the opacity of each layer. Only the items whose bounding box
+    falls on target are visited, through the spatial index of each layer.
+
+    :param document: lib.document.Document
+    :param layers: Layer objects, from the bottom to the top
+    :param target: RasterLayer
+    :param scale: pixels per page pixel
+    :param origin: page point mapped to the top left pixel of target
+    :return: None
+    """
+    region = (origin[0], origin[1], origin[0] + target.width / scale, origin[1] + target.height / scale)
+    for layer in layers:
+        if not layer.visible or layer.opacity <= 0:
+            continue
+        layer_target = target if layer.opacity >= 1 else RasterLayer(target.width, target.height)
+        Rasterizer(layer_target, scale, origin).draw_items(
+            document.get(item_id) for item_id in document.find_overlapping(*region, layers=(layer.id,)))
+        if layer_target is not target:
+            target.blend(layer_target, layer.opacity)
+
+
+def draw_page(document, target, scale=1.0, origin=(0, 0), background='#ffffff', raster=None):
+    """
+    Draw the page background, the pixel layer and the visible items on target.
+
+    :param document: lib.document.Document
+    :param target: RasterLayer, usually empty
+    :param scale: pixels per page pixel
+    :param origin: page point mapped to the top left pixel of target
+    :param background: page color, or None for a transparent page
+    :param raster: optional RasterLayer with the pixel layer of the drawing, drawn below the items
+    :return: None
+    """
+    if background:
+        target.pixels[...] = paint(background)
+    if raster is not None:
+        pixels = RasterLayer(target.width, target.height)
+        columns = np.clip(((np.arange(target.width) + 0.5) / scale + origin[0]).astype(np.intp), 0, raster.width - 1)
+        rows = np.clip(((np.arange(target.height) + 0.5) / scale + origin[1]).astype(np.intp), 0, raster.height - 1)
+        pixels.pixels[...] = raster.pixels[rows[:, None], columns[None, :]]
+        target.blend(pixels)
+    draw_layers(document, document.layers, target, scale, origin)
+
+
+def render(document, scale=1.0, region=None, background='#ffffff', raster=None):
+    """
+    Render a drawing without Tk.
+
+    :param document: lib.document.Document
+    :param scale: pixels per page pixel
+    :param region: page rectangle (x1, y1, x2, y2) to render (default: the whole page)
+    :param background: page color, or None for a transparent page
+    :param raster: optional RasterLayer with the pixel layer of the drawing, drawn below the items
+    :return: uint8 array (height, width, 4)
+    """
+    if region is None:
+        region = (0, 0, document.width, document.height)
+    x1, y1, x2, y2 = region
+    target = RasterLayer(max(1, int(round((x2 - x1) * scale))), max(1, int(round((y2 - y1) * scale))))
+    draw_page(document, target, scale, (x1, y1), background, raster)
+    return target.pixels
@@ -0,0 +1,260 @@
+"""
++----------------------------------------------------------------------------------------+
+|                                 This file is part of:                                  |
+|                                      DESENHANDO                                        |
+|                                 www.github.com/...                                     |
++----------------------------------------------------------------------------------------+
+|     Copyright (c) 2021 João Vitor, ...                                                 |
+|                                                                                        |
+|     Permission is hereby granted, free of charge, to any person obtaining a copy       |
+|     of this software and associated documentation files (the "Software"), to deal      |
+|     in the Software without restriction, including without limitation the rights       |
+|     to use, copy, modify, merge, publish, distribute, sublicense, and/or sell          |
+|     copies of the Software, and to permit persons to whom the Software is              |
+|     furnished to do so, subject to the following conditions:                           |
+|                                                                                        |
+|     The above copyright notice and this permission notice shall be included in         |
+|     all copies or substantial portions of the Software.                                |
+|                                                                                        |
+|     THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR         |
+|     IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,           |
+|     FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE        |
+|     AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER             |
+|     LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,      |
+|     OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN          |
+|     THE SOFTWARE.                                                                      |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+|                                         ABSTRACT                                       |
++----------------------------------------------------------------------------------------+
+| Record the input events of the drawing area to a compact file and replay them.         |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+
+File layout:
+
+    magic, version and the length of a JSON header (zoom, page size, ...)
+    zlib stream of RECORD structs: event kind, microseconds since the
+    previous event, page coordinates and the modifier state
+
+Page coordinates do not depend on the zoom or the scrolling, so a session
+replays on the same spots of the drawing whatever the view.
+"""
+
+import json
+import struct
+import time
+import zlib
+
+MAGIC = b'DSESSION'
+VERSION = 1
+HEADER = struct.Struct('<8sHI')
+RECORD = struct.Struct('<BIffH')
+
+# Event kinds, named after the DrawingArea handlers that receive them
+PRESS = 0
+MOTION = 1
+RELEASE = 2
+HANDLERS = {PRESS: 'start_drawing', MOTION: 'update_drawing', RELEASE: 'finish_drawing'}
+
+
+class FormatError(Exception):
+    pass
+
+
+class SessionWriter:
+    """
+    Appends events to a session file as they arrive. The compressor is
+    flushed to the file every flush_interval seconds, so a session cut by
+    a crash keeps all but its last moments.
+    """
+
+    flush_interval = 1.0
+
+    def __init__(self, path, **info):
+        """
+        :param path: output file
+        :param info: values stored in the header, eg. zoom and page size
+        """
+        self.file = open(path, 'wb')
+        header = json.dumps(info).encode('utf-8')
+        self.file.write(HEADER.pack(MAGIC, VERSION, len(header)) + header)
+        self.events = 0
+        self._compressor = zlib.compressobj(6)
+        self._last = None
+        self._last_event_time = None
+        self._flushed = None
+
+    def add(self, kind, x, y, state=0, event_time=None, now=None):
+        """
+        Record an event. Delays come from the timestamps the X server put on
+        the events, so they are the ones of the user's input even when the
+        program was slow to handle it; events without one (synthetic ones,
+        eg. replayed) are timed when they are recorded.
+
+        :param kind: PRESS, MOTION or RELEASE
+        :param x: page x coordinate
+        :param y: page y coordinate
+        :param state: modifier mask of the Tk event
+        :param event_time: time of the Tk event, in milliseconds (wraps around at 2**32)
+        :param now: time.perf_counter() of the event (default: now)
+        :return: None
+        """
+        now = time.perf_counter() if now is None else now
+        if not isinstance(event_time, int) or event_time <= 0:
+            event_time = None
+        if self._last is None:
+            delay = 0
+        elif event_time is not None and self._last_event_time is not None:
+            elapsed = (event_time - self._last_event_time) & 0xffffffff
+            # Events out of order would look like a wrap-around of almost 50 days
+            delay = elapsed * 1000 if elapsed < 1 << 31 else 0
+        else:
+            delay = int((now - self._last) * 1e6)
+        self._last = now
+        self._last_event_time = event_time
+        self.file.write(self._compressor.compress(RECORD.pack(kind, min(0xffffffff, max(0, delay)), x, y,
+                                                              state & 0xffff)))
+        self.events += 1
+        if self._flushed is None:
+            self._flushed = now
+        elif now - self._flushed >= self.flush_interval:
+            self.file.write(self._compressor.flush(zlib.Z_SYNC_FLUSH))
+            self.file.flush()
+            self._flushed = now
+
+    def close(self):
+        if not self.file.closed:
+            self.file.write(self._compressor.flush())
+            self.file.close()
+
+
+def read_session(path):
+    """
+    Events of a session file.
+
+    :param path: file written by SessionWriter
+    :return: (header dict, list of (kind, seconds from the first event, x, y, state))
+    """
+    with open(path, 'rb') as file:
+        data = file.read()
+    try:
+        magic, version, length = HEADER.unpack_from(data)
+    except struct.error:
+        raise FormatError('not a session file')
+    if magic != MAGIC:
+        raise FormatError('not a session file')
+    if version > VERSION:
+        raise FormatError(f'session version {version} is newer than this program')
+    info = json.loads(data[HEADER.size:HEADER.size + length])
+    # A session cut by a crash still replays up to its last complete event
+    records = zlib.decompressobj().decompress(data[HEADER.size + length:])
+    events = []
+    seconds = 0.0
+    for kind, delay, x, y, state in RECORD.iter_unpack(records[:len(records) - len(records) % RECORD.size]):
+        seconds += delay / 1e6
+        events.append((kind, seconds, x, y, state))
+    return info, events
+
+
+class ReplayEvent:
+    """
+    The attributes of a Tk event that the handlers use.
+    """
+
+    __slots__ = ('x', 'y', 'state', 'time', 'num', 'delta', 'widget')
+
+    def __init__(self, x, y, state=0, time_=0, widget=None):
+        self.x = x
+        self.y = y
+        self.state = state
+        self.time = time_
+        self.num = 1
+        self.delta = 0
+        self.widget = widget
+
+
+class Replayer:
+    """
+    Feeds the events of a session back into the handlers of a DrawingArea,
+    in real time (or speed times faster) through after(), or as fast as
+    possible in a loop. In the fast mode the coalesced motion updates are
+    delivered when the recorded time crosses a frame, as they were live.
+    """
+
+    def __init__(self, drawing_area, events, speed=None, on_finish=None):
+        """
+        :param drawing_area: core.DrawingArea.DrawingArea
+        :param events: list returned by read_session
+        :param speed: 1.0 for real time, 2.0 twice as fast..., None as fast as possible
+        :param on_finish: function(replayer) called at the end
+        """
+        self.drawing_area = drawing_area
+        self.events = events
+        self.speed = speed
+        self.on_finish = on_finish
+        self.replayed = 0
+        self.seconds = 0.0
+        self._start = None
+        self._job = None
+
+    def _dispatch(self, kind, x, y, state, seconds):
+        area = self.drawing_area
+        canvas = area.drawing_area
+        # Window coordinates of the page point with the current zoom and scrolling
+        event = ReplayEvent(x * area.zoom - canvas.canvasx(0), y * area.zoom - canvas.canvasy(0),
+                            state, int(seconds * 1000), canvas)
+        getattr(area, HANDLERS[kind])(event)
+        self.replayed += 1
+
+    def run(self):
+        """
+        Replay every event now, as fast as possible.
+
+        :return: seconds taken
+        """
+        start = time.perf_counter()
+        frame = 1.0 / self.drawing_area.motion_rate if self.drawing_area.motion_rate > 0 else 0.0
+        next_frame = 0.0
+        for kind, seconds, x, y, state in self.events:
+            self._dispatch(kind, x, y, state, seconds)
+            if seconds >= next_frame:
+                self.drawing_area.flush_motion()
+                next_frame = seconds + frame
+        self.drawing_area.flush_motion()
+        self.seconds = time.perf_counter() - start
+        if self.on_finish is not None:
+            self.on_finish(self)
+        return self.seconds
+
+    def start(self):
+        """
+        Replay in the background of the main loop, keeping the recorded timing.
+
+        :return: None
+        """
+        if self.speed is None:
+            self.run()
+            return
+        self._start = time.perf_counter()
+        self._step()
+
+    def _step(self):
+        self._job = None
+        elapsed = (time.perf_counter() - self._start) * self.speed
+        events = self.events
+        while self.replayed < len(events) and events[self.replayed][1] <= elapsed:
+            kind, seconds, x, y, state = events[self.replayed]
+            self._dispatch(kind, x, y, state, seconds)
+        if self.replayed < len(events):
+            delay = (events[self.replayed][1] - elapsed) / self.speed
+            self._job = self.drawing_area.drawing_area.after(max(1, int(delay * 1000)), self._step)
+            return
+        self.seconds = time.perf_counter() - self._start
+        if self.on_finish is not None:
+            self.on_finish(self)
+
+    def cancel(self):
+        if self._job is not None:
+            self.drawing_area.drawing_area.after_cancel(self._job)
+            self._job = None
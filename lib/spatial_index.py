@@ -0,0 +1,214 @@
+"""
++----------------------------------------------------------------------------------------+
+|                                 This file is part of:                                  |
+|                                      DESENHANDO                                        |
+|                                 www.github.com/...                                     |
++----------------------------------------------------------------------------------------+
+|     Copyright (c) 2021 João Vitor, ...                                                 |
+|                                                                                        |
+|     Permission is hereby granted, free of charge, to any person obtaining a copy       |
+|     of this software and associated documentation files (the "Software"), to deal      |
+|     in the Software without restriction, including without limitation the rights       |
+|     to use, copy, modify, merge, publish, distribute, sublicense, and/or sell          |
+|     copies of the Software, and to permit persons to whom the Software is              |
+|     furnished to do so, subject to the following conditions:                           |
+|                                                                                        |
+|     The above copyright notice and this permission notice shall be included in         |
+|     all copies or substantial portions of the Software.                                |
+|                                                                                        |
+|     THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR         |
+|     IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,           |
+|     FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE        |
+|     AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER             |
+|     LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,      |
+|     OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN          |
+|     THE SOFTWARE.                                                                      |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+|                                         ABSTRACT                                       |
++----------------------------------------------------------------------------------------+
+| Quadtree used to find the items of the drawing that lie under a region.                |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+"""
+
+from lib.geometry import bbox_contains, bbox_intersects
+
+
+class _Node:
+    """
+    Quadtree node. Items that do not fit entirely inside one of the four
+    quadrants stay in the node itself.
+    """
+
+    __slots__ = ('bounds', 'items', 'children')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.items = {}
+        self.children = None
+
+    def quadrants(self):
+        x1, y1, x2, y2 = self.bounds
+        mx = (x1 + x2) / 2
+        my = (y1 + y2) / 2
+        return ((x1, y1, mx, my), (mx, y1, x2, my),
+                (x1, my, mx, y2), (mx, my, x2, y2))
+
+
+class QuadTree:
+    """
+    Spatial index over axis aligned bounding boxes.
+
+    Each key is stored in the deepest node whose bounds fully contain its
+    box, so inserts, removals and window queries visit O(log n) nodes for
+    the small, scattered boxes that make up a drawing. The root grows
+    automatically when a box falls outside of the indexed area.
+    """
+
+    def __init__(self, bounds=(0, 0, 1024, 1024), capacity=16, min_size=8):
+        """
+        :param bounds: initial indexed area (x1, y1, x2, y2)
+        :param capacity: number of items a leaf holds before being split
+        :param min_size: nodes smaller than this are never split
+        """
+        self.capacity = capacity
+        self.min_size = min_size
+        self._root = _Node(tuple(float(v) for v in bounds))
+        self._nodes = {}
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __contains__(self, key):
+        return key in self._nodes
+
+    @property
+    def bounds(self):
+        return self._root.bounds
+
+    def bbox(self, key):
+        return self._nodes[key].items[key]
+
+    def insert(self, key, bbox):
+        """
+        Index key with the given bounding box, replacing any previous entry.
+
+        :param key: hashable identifier
+        :param bbox: (x1, y1, x2, y2)
+        :return: None
+        """
+        if key in self._nodes:
+            self.remove(key)
+        bbox = tuple(bbox)
+        while not bbox_contains(self._root.bounds, bbox):
+            self._grow(bbox)
+        self._insert(self._root, key, bbox)
+
+    def update(self, key, bbox):
+        """
+        Move key to a new bounding box. Cheap when the box still belongs
+        to the same node, which is the common case for a growing stroke.
+
+        :param key: identifier previously inserted
+        :param bbox: (x1, y1, x2, y2)
+        :return: None
+        """
+        node = self._nodes.get(key)
+        bbox = tuple(bbox)
+        if node is not None and bbox_contains(node.bounds, bbox) and \
+                (node.children is None or not any(bbox_contains(q, bbox) for q in node.quadrants())):
+            node.items[key] = bbox
+        else:
+            self.insert(key, bbox)
+
+    def remove(self, key):
+        """
+        Remove key from the index. Unknown keys are ignored.
+
+        :param key: identifier previously inserted
+        :return: None
+        """
+        node = self._nodes.pop(key, None)
+        if node is not None:
+            del node.items[key]
+
+    def clear(self):
+        self._root = _Node(self._root.bounds)
+        self._nodes.clear()
+
+    def query(self, bbox):
+        """
+        Find every key whose bounding box intersects bbox.
+
+        :param bbox: (x1, y1, x2, y2)
+        :return: list of keys
+        """
+        found = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            for key, item_bbox in node.items.items():
+                if bbox_intersects(bbox, item_bbox):
+                    found.append(key)
+            if node.children is not None:
+                for child in node.children:
+                    if bbox_intersects(bbox, child.bounds):
+                        stack.append(child)
+        return found
+
+    def query_point(self, x, y, halo=0):
+        """
+        Find every key whose bounding box is within halo of the point (x, y).
+
+        :return: list of keys
+        """
+        return self.query((x - halo, y - halo, x + halo, y + halo))
+
+    def _insert(self, node, key, bbox):
+        while node.children is not None:
+            for child in node.children:
+                if bbox_contains(child.bounds, bbox):
+                    node = child
+                    break
+            else:
+                break
+        node.items[key] = bbox
+        self._nodes[key] = node
+        if node.children is None and len(node.items) > self.capacity:
+            self._split(node)
+
+    def _split(self, node):
+        x1, y1, x2, y2 = node.bounds
+        if x2 - x1 < self.min_size or y2 - y1 < self.min_size:
+            return
+        node.children = [_Node(q) for q in node.quadrants()]
+        items, node.items = node.items, {}
+        for key, bbox in items.items():
+            for child in node.children:
+                if bbox_contains(child.bounds, bbox):
+                    child.items[key] = bbox
+                    self._nodes[key] = child
+                    break
+            else:
+                node.items[key] = bbox
+        for child in node.children:
+            if len(child.items) > self.capacity:
+                self._split(child)
+
+    def _grow(self, bbox):
+        """
+        Double the root towards bbox, keeping the old root as one of the quadrants.
+        """
+        old = self._root
+        x1, y1, x2, y2 = old.bounds
+        w, h = x2 - x1, y2 - y1
+        left = bbox[0] < x1
+        up = bbox[1] < y1
+        nx1 = x1 - w if left else x1
+        ny1 = y1 - h if up else y1
+        root = _Node((nx1, ny1, nx1 + 2 * w, ny1 + 2 * h))
+        root.children = [_Node(q) for q in root.quadrants()]
+        index = (2 if up else 0) + (1 if left else 0)
+        root.children[index] = old
+        self._root = root
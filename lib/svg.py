@@ -0,0 +1,285 @@
+"""
++----------------------------------------------------------------------------------------+
+|                                 This file is part of:                                  |
+|                                      DESENHANDO                                        |
+|                                 www.github.com/...                                     |
++----------------------------------------------------------------------------------------+
+|     Copyright (c) 2021 João Vitor, ...                                                 |
+|                                                                                        |
+|     Permission is hereby granted, free of charge, to any person obtaining a copy       |
+|     of this software and associated documentation files (the "Software"), to deal      |
+|     in the Software without restriction, including without limitation the rights       |
+|     to use, copy, modify, merge, publish, distribute, sublicense, and/or sell          |
+|     copies of the Software, and to permit persons to whom the Software is              |
+|     furnished to do so, subject to the following conditions:                           |
+|                                                                                        |
+|     The above copyright notice and this permission notice shall be included in         |
+|     all copies or substantial portions of the Software.                                |
+|                                                                                        |
+|     THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR         |
+|     IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,           |
+|     FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE        |
+|     AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER             |
+|     LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,      |
+|     OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN          |
+|     THE SOFTWARE.                                                                      |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+|                                         ABSTRACT                                       |
++----------------------------------------------------------------------------------------+
+| Streaming SVG writer for documents.                                                    |
+|                                                                                        |
++----------------------------------------------------------------------------------------+
+"""
+
+import base64
+from functools import lru_cache
+from xml.sax.saxutils import escape, quoteattr
+
+from lib.png import encode_png
+from lib.raster import parse_color
+from lib.rasterizer import font_pixel_size
+
+CAP_STYLES = {'butt': 'butt', 'projecting': 'square', 'round': 'round'}
+JOIN_STYLES = {'miter': 'miter', 'round': 'round', 'bevel': 'bevel'}
+# Paint of the colors that can not be parsed, the default fill of Tk items
+FALLBACK_COLOR = '#000000'
+# Tk anchor -> (text-anchor, dominant-baseline)
+TEXT_ANCHORS = {
+    'nw': ('start', 'hanging'), 'n': ('middle', 'hanging'), 'ne': ('end', 'hanging'),
+    'w': ('start', 'central'), 'center': ('middle', 'central'), 'e': ('end', 'central'),
+    'sw': ('start', 'text-after-edge'), 's': ('middle', 'text-after-edge'), 'se': ('end', 'text-after-edge'),
+}
+
+
+def css_string(value):
+    """
+    Text as a quoted CSS string that is also safe inside a <style> element:
+    everything but letters, digits and a few punctuation marks is written
+    as a CSS escape, quotes, backslashes and markup characters included.
+    """
+    return '"' + ''.join(c if c.isalnum() or c in ' -_.,' else f'\\{ord(c):x} ' for c in str(value)) + '"'
+
+
+@lru_cache(maxsize=256)
+def svg_color(color):
+    """
+    Tk color as an SVG paint: '#rrggbb' when it can be parsed, 'none' when
+    empty and FALLBACK_COLOR otherwise. Nothing else reaches the file, so
+    the paint is safe in attributes and in the style sheet.
+    """
+    if not color:
+        return 'none'
+    try:
+        r, g, b, a = parse_color(color)
+    except (ValueError, TypeError):
+        return FALLBACK_COLOR
+    return f'#{r:02x}{g:02x}{b:02x}'
+
+
+class SVGWriter:
+    """
+    Writes an SVG file element by element, without building the XML tree.
+
+    Items sharing the same presentation attributes get the same CSS class;
+    the style sheet is written at the end of the file, when all of them are
+    known (CSS rules apply to the whole document wherever they appear).
+    Paths use relative coordinates rounded to precision decimal places.
+    """
+
+    def __init__(self, file, width, height, precision=2):
+        """
+        :param file: text file object opened for writing
+        :param width: page width in pixels
+        :param height: page height in pixels
+        :param precision: decimal places of coordinates
+        """
+        self.file = file
+        self.precision = precision
+        self._factor = 10 ** precision
+        self.styles = {}
+        self._layer_open = False
+        file.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                   f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+                   f'viewBox="0 0 {width} {height}">\n')
+
+    def number(self, value):
+        return self._format([round(value * self._factor)])
+
+    def path_data(self, coords, closed=False):
+        """
+        'M x y l dx dy ...' with deltas between rounded points, so rounding errors do not add up.
+        """
+        factor = self._factor
+        points = [round(value * factor) for value in coords]
+        data = 'M' + self._format(points[:2])
+        if len(points) > 2:
+            # Every coordinate minus the same coordinate of the previous point
+            data += 'l' + self._format([b - a for a, b in zip(points, points[2:])])
+        return data + 'z' if closed else data
+
+    def _format(self, values):
+        """
+        Space separated values given in units of 10 ** -precision, without trailing zeros.
+        """
+        if not self.precision:
+            return ' '.join(map(str, values))
+        factor = self._factor
+        # repr gives the shortest text that reads back as the same float
+        text = ' '.join(map(repr, [value / factor for value in values])) + ' '
+        return text.replace('.0 ', ' ')[:-1]
+
+    def style_class(self, style):
+        """
+        Class name of a set of presentation attributes, created on first use.
+
+        :param style: tuple of (property, value)
+        :return: str
+        """
+        name = self.styles.get(style)
+        if name is None:
+            name = self.styles[style] = f's{len(self.styles)}'
+        return name
+
+    def begin_layer(self, layer):
+        self.end_layer()
+        opacity = f' opacity="{self.number(layer.opacity)}"' if layer.opacity < 1 else ''
+        self.file.write(f'<g id="layer-{layer.id}"{opacity}>\n')
+        self._layer_open = True
+
+    def end_layer(self):
+        if self._layer_open:
+            self.file.write('</g>\n')
+            self._layer_open = False
+
+    def background(self, color, width, height):
+        self.file.write(f'<rect width="{width}" height="{height}" fill="{svg_color(color)}"/>\n')
+
+    def image(self, pixels, x=0, y=0):
+        """
+        Embed an RGBA array as a PNG image.
+        """
+        height, width = pixels.shape[:2]
+        data = base64.b64encode(encode_png(pixels, level=6)).decode('ascii')
+        self.file.write(f'<image x="{x}" y="{y}" width="{width}" height="{height}" '
+                        f'href="data:image/png;base64,{data}"/>\n')
+
+    def item(self, item):
+        """
+        Write one document item using the Tk defaults for missing options.
+
+        :param item: lib.document.Item
+        :return: None
+        """
+        options = item.options
+        if options.get('state') == 'hidden' or not item.coords:
+            return
+        kind = item.kind
+        coords = item.coords
+        width = ('stroke-width', self.number(float(options.get('width', 1))))
+        if kind == 'line':
+            style = (('fill', 'none'), ('stroke', svg_color(options.get('fill', '#000000'))), width,
+                     ('stroke-linecap', CAP_STYLES.get(options.get('capstyle', 'butt'), 'butt')),
+                     ('stroke-linejoin', JOIN_STYLES.get(options.get('joinstyle', 'round'), 'round')))
+            self._element('path', style, d=self.path_data(coords))
+        elif kind == 'polygon':
+            style = (('fill', svg_color(options.get('fill', '#000000'))),
+                     ('stroke', svg_color(options.get('outline', ''))), width, ('fill-rule', 'evenodd'))
+            self._element('path', style, d=self.path_data(coords, closed=True))
+        elif kind in ('rectangle', 'oval'):
+            x1, x2 = sorted(coords[0:4:2])
+            y1, y2 = sorted(coords[1:4:2])
+            style = (('fill', svg_color(options.get('fill', ''))),
+                     ('stroke', svg_color(options.get('outline', '#000000'))), width)
+            number = self.number
+            if kind == 'rectangle':
+                self._element('rect', style, x=number(x1), y=number(y1), width=number(x2 - x1),
+                              height=number(y2 - y1))
+            else:
+                self._element('ellipse', style, cx=number((x1 + x2) / 2), cy=number((y1 + y2) / 2),
+                              rx=number((x2 - x1) / 2), ry=number((y2 - y1) / 2))
+        elif kind == 'text':
+            self._text(item)
+
+    def _text(self, item):
+        options = item.options
+        text = str(options.get('text', ''))
+        if not text:
+            return
+        font = options.get('font')
+        family = font[0] if isinstance(font, (tuple, list)) else str(font or 'TkDefaultFont').split()[0]
+        anchor, baseline = TEXT_ANCHORS.get(options.get('anchor', 'center'), TEXT_ANCHORS['center'])
+        style = (('fill', svg_color(options.get('fill', '#000000'))), ('font-family', css_string(family)),
+                 ('font-size', f'{self.number(font_pixel_size(font))}px'), ('text-anchor', anchor),
+                 ('dominant-baseline', baseline))
+        x, y = self.number(item.coords[0]), self.number(item.coords[1])
+        lines = text.split('\n')
+        if len(lines) == 1:
+            body = escape(text)
+        else:
+            body = ''.join(f'<tspan x="{x}" dy="{"0" if i == 0 else "1.2em"}">{escape(line)}</tspan>'
+                           for i, line in enumerate(lines))
+        self.file.write(f'<text class="{self.style_class(style)}" x="{x}" y="{y}">{body}</text>\n')
+
+    def _element(self, tag, style, **attributes):
+        text = ' '.join(f'{name}={quoteattr(value)}' for name, value in attributes.items())
+        self.file.write(f'<{tag} class="{self.style_class(style)}" {text}/>\n')
+
+    def close(self):
+        """
+        Write the style sheet and close the svg element. The file itself is not closed.
+
+        :return: None
+        """
+        self.end_layer()
+        self.file.write('<style>\n')
+        for style, name in self.styles.items():
+            rules = ';'.join(f'{key}:{value}' for key, value in style)
+            self.file.write(f'.{name}{{{rules}}}\n')
+        self.file.write('</style>\n</svg>\n')
+
+
+def iter_items(document):
+    """
+    (layer, item) pairs of the visible layers, from the bottom to the top.
+    """
+    layers = {layer.id: layer for layer in document.layers if layer.visible and layer.opacity > 0}
+    for item in document:
+        layer = layers.get(item.layer)
+        if layer is not None:
+            yield layer, item
+
+
+progress_interval = 1000
+
+
+def export_svg(document, path, precision=2, background='#ffffff', raster=None, progress=None):
+    """
+    Write a document as an SVG file.
+
+    :param document: lib.document.Document
+    :param path: output file
+    :param precision: decimal places of coordinates
+    :param background: page color, or None for a transparent page
+    :param raster: optional RasterLayer with the pixel layer of the drawing
+    :param progress: optional function(items written), called every progress_interval
+                     items; the export stops when it returns False
+    :return: size of the file in bytes, or None when stopped
+    """
+    with open(path, 'w', encoding='utf-8') as file:
+        writer = SVGWriter(file, document.width, document.height, precision)
+        if background:
+            writer.background(background, document.width, document.height)
+        if raster is not None and raster.pixels[..., 3].any():
+            writer.image(raster.pixels)
+        layer = None
+        for count, (item_layer, item) in enumerate(iter_items(document), 1):
+            if item_layer is not layer:
+                layer = item_layer
+                writer.begin_layer(layer)
+            writer.item(item)
+            if progress is not None and count % progress_interval == 0 and progress(count) is False:
+                return None
+        writer.close()
+        return file.tell()
+
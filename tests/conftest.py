@@ -0,0 +1,43 @@
+"""
+Fixtures shared by the tests. The fake Tk widgets themselves live in
+lib.benchmark, whose display-free suite runs the same drawing area.
+"""
+
+import os
+import sys
+
+import pytest
+
+# The tests import lib and core like desenhando.py does, from the project folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib.benchmark import headless_drawing_area, headless_tk  # noqa: E402
+from lib.session import ReplayEvent  # noqa: E402
+
+
+@pytest.fixture
+def drawing_area():
+    """
+    Factory of DrawingArea instances on a FakeCanvas, with the Tk widgets
+    replaced for the whole test: drawing_area(width, height, tool) -> (area, canvas).
+    """
+    with headless_tk():
+        yield headless_drawing_area
+
+
+def _drag(area, canvas, points):
+    area.start_drawing(ReplayEvent(*points[0]))
+    for point in points[1:-1]:
+        area.update_drawing(ReplayEvent(*point))
+        canvas.run_pending()
+    area.finish_drawing(ReplayEvent(*points[-1]))
+    canvas.run_pending()
+
+
+@pytest.fixture
+def drag():
+    """
+    Function dragging the mouse through points with the current tool, the
+    pending updates running after every event: drag(area, canvas, points).
+    """
+    return _drag
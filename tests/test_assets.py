@@ -0,0 +1,63 @@
+import os
+import time
+
+import pytest
+
+import core.Assets as assets
+from lib.benchmark import FakeCanvas
+
+ICONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'icons')
+
+
+class CountingPhotoImage:
+    """
+    PhotoImage of a fixed size that counts how many files were decoded.
+    """
+
+    decoded = 0
+
+    def __init__(self, master=None, data=None, file=None, side=32):
+        if file is not None and not os.path.exists(file):
+            raise assets.TclError(f'couldn\'t open "{file}"')
+        if data is not None or file is not None:
+            CountingPhotoImage.decoded += 1
+        self.side = side
+
+    def width(self):
+        return self.side
+
+    def height(self):
+        return self.side
+
+    def subsample(self, factor):
+        return CountingPhotoImage(side=self.side // factor)
+
+    def zoom(self, factor):
+        return CountingPhotoImage(side=self.side * factor)
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(assets, 'PhotoImage', CountingPhotoImage)
+    CountingPhotoImage.decoded = 0
+    canvas = FakeCanvas()
+    yield assets.AssetCache(canvas), canvas
+    del assets.AssetCache.instance
+
+
+def test_preloaded_images_are_decoded_once(cache):
+    cache, canvas = cache
+    paths = [os.path.join(ICONS, name) for name in ('pencil.png', 'borracha.png', 'missing.png')]
+    received = []
+    cache.preload(paths, size=16, callback=received.append)
+    deadline = time.monotonic() + 5
+    while not received and time.monotonic() < deadline:
+        canvas.run_pending()
+        time.sleep(0.005)
+    assert [image.side for image in received[0]] == [16, 16]
+    assert CountingPhotoImage.decoded == 2
+
+    # Other paths to the same file and other sizes reuse the decoded image
+    pencil = cache.get(os.path.join(ICONS, '..', 'icons', 'pencil.png'))
+    assert cache.get(paths[0]) is pencil and cache.get(paths[0], 64).side == 64
+    assert CountingPhotoImage.decoded == 2
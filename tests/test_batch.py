@@ -0,0 +1,27 @@
+import io
+import os
+import subprocess
+import sys
+
+from lib.batch import render_batch
+
+
+def test_missing_inputs_are_reported(tmp_path):
+    empty = tmp_path / 'empty'
+    empty.mkdir()
+    report = io.StringIO()
+    failed = render_batch([str(empty), str(tmp_path / 'nothing.desenhando')], str(tmp_path / 'out'), file=report)
+    assert failed == 2
+    lines = report.getvalue().splitlines()
+    assert lines[0].startswith(f'FAILED {empty}: no ')
+    assert lines[1] == f'FAILED {tmp_path / "nothing.desenhando"}: no such file or directory'
+    assert lines[2].startswith('0 of 0 drawings rendered')
+
+
+def test_spawned_workers_do_not_load_tk():
+    # Spawned workers run desenhando.py again as __mp_main__ before their task
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = ("import runpy, sys; runpy.run_path('desenhando.py', run_name='__mp_main__'); "
+              "print('tkinter' in sys.modules)")
+    result = subprocess.run([sys.executable, '-c', script], cwd=root, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == 'False'
@@ -0,0 +1,35 @@
+import json
+
+from lib.benchmark import compare, main
+
+
+def results(ops_per_sec, peak_memory):
+    return {'benchmarks': {'index.query.1k': {'ops': 100, 'ops_per_sec': ops_per_sec, 'p50_ms': 1.0,
+                                              'p99_ms': 2.0, 'peak_memory': peak_memory}}}
+
+
+def test_compare_flags_slowdowns_and_memory_growth_past_the_tolerance():
+    baseline = results(1000.0, 2 ** 20)
+    lines, regressed = compare(results(900.0, 1.1 * 2 ** 20), baseline, tolerance=0.15)
+    assert regressed == [] and len(lines) == 1
+    lines, regressed = compare(results(800.0, 2 ** 21), baseline, tolerance=0.15)
+    assert regressed == ['index.query.1k']
+    assert lines[0].endswith('REGRESSION: slower, more memory')
+    lines, regressed = compare({'benchmarks': {'new.1k': results(1.0, 1)['benchmarks']['index.query.1k']}},
+                               baseline)
+    assert lines == [f'{"new.1k":<26} new'] and regressed == []
+
+
+def test_main_saves_the_results_and_fails_on_regressions(tmp_path, capsys):
+    out = str(tmp_path / 'out.json')
+    assert main(out, quick=True, only='index.query.1k', memory=False) == 0
+    saved = json.loads(open(out).read())
+    assert list(saved['benchmarks']) == ['index.query.1k'] and saved['quick'] is True
+    assert saved['benchmarks']['index.query.1k']['ops'] > 0
+
+    saved['benchmarks']['index.query.1k']['ops_per_sec'] *= 100
+    baseline = str(tmp_path / 'baseline.json')
+    with open(baseline, 'w') as file:
+        json.dump(saved, file)
+    assert main(None, baseline, quick=True, only='index.query.1k', memory=False) == 1
+    assert 'REGRESSION: slower' in capsys.readouterr().out
@@ -0,0 +1,80 @@
+from tkinter import Tcl
+from types import SimpleNamespace
+
+import pytest
+
+from core.CanvasBatch import CanvasBatch
+
+# Stands for a canvas widget: creates numbered items, logs every command and
+# fails the ones with a 'fail' argument
+FAKE_CANVAS = '''
+set ::log {}
+set ::next 0
+proc fakecanvas {args} {
+    lappend ::log $args
+    if {[lsearch -exact $args fail] >= 0} {
+        error "command failed"
+    }
+    if {[lindex $args 0] eq "create"} {
+        return [incr ::next]
+    }
+    return {}
+}
+'''
+
+
+def fake_canvas():
+    tcl = Tcl()
+    tcl.eval(FAKE_CANVAS)
+    return SimpleNamespace(tk=tcl.tk, _w='fakecanvas')
+
+
+def test_failed_command_in_the_middle_of_a_batch():
+    canvas = fake_canvas()
+    batch = CanvasBatch(canvas)
+    first = batch.create_line(0, 0, 10, 10)
+    batch.itemconfigure(first, fill='fail')
+    second = batch.create_line(5, 5, 20, 20)
+    batch.move(second, 1, 2)
+    assert batch.flush() == [first, second]
+    assert (first.id, second.id) == (1, 2)
+    assert len(batch.errors) == 1
+    command, message = batch.errors[0]
+    assert command[0] == 'itemconfigure' and message == 'command failed'
+    # The commands after the failure ran, on the right item
+    assert canvas.tk.splitlist(canvas.tk.eval('lindex $::log end')) == ('move', '2', '1', '2')
+
+
+def test_failed_creation_leaves_no_id():
+    canvas = fake_canvas()
+    batch = CanvasBatch(canvas)
+    failed = batch.create_line(0, 0, 10, 10, fill='fail')
+    created = batch.create_line(0, 0, 10, 10)
+    batch.flush()
+    assert failed.id is None and created.id == 1
+    # Its index points into the old batch, never into the next one
+    batch.create_line(1, 1, 2, 2)
+    with pytest.raises(ValueError):
+        batch.move(failed, 1, 1)
+
+
+def test_drawing_area_recovers_from_a_failed_batch(drawing_area):
+    area, canvas = drawing_area()
+    coords = canvas.coords
+
+    def failing_coords(item, *values):
+        if values and values[0] == [99, 99, 99, 99]:
+            raise ValueError('bad coords')
+        return coords(item, *values)
+
+    canvas.coords = failing_coords
+    with area.batched():
+        first = area.create_item('line', [0, 0, 10, 10])
+        area.set_item_coords(first, [99, 99, 99, 99])
+        second = area.create_item('line', [20, 20, 30, 30])
+    assert isinstance(area.canvas_id(second), int)
+    canvas.coords = coords
+    canvas.run_pending()
+    shown = {area.document_id(item_id): values[1] for item_id, values in canvas.items.items()
+             if 'document' in values[3]}
+    assert shown == {first: [99.0, 99.0, 99.0, 99.0], second: [20.0, 20.0, 30.0, 30.0]}
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from lib.clipping import Region, boolean, clip_polylines
+
+
+def square(x, y, size):
+    return [x, y, x + size, y, x + size, y + size, x, y + size]
+
+
+def area(rings):
+    """
+    Even-odd area of rings, counted on a grid of quarter pixels.
+    """
+    xs, ys = np.meshgrid(np.arange(-20, 40, 0.5) + 0.25, np.arange(-20, 40, 0.5) + 0.25)
+    return Region(rings).contains(xs.ravel(), ys.ravel()).sum() / 4
+
+
+@pytest.mark.parametrize('operation, expected', [
+    ('union', 175), ('intersection', 25), ('difference', 75), ('xor', 150)])
+def test_boolean_of_overlapping_squares(operation, expected):
+    assert area(boolean([square(0, 0, 10)], [square(5, 5, 10)], operation)) == expected
+
+
+def test_boolean_keeps_holes_and_disjoint_parts():
+    holed = boolean([square(0, 0, 10)], [square(4, 4, 2)], 'difference')
+    assert area(holed) == 96
+    assert not Region(holed).contains(np.array([5.0]), np.array([5.0]))[0]
+    apart = [square(0, 0, 5)], [square(20, 20, 5)]
+    assert boolean(*apart, 'intersection') == []
+    assert area(boolean(*apart, 'union')) == 50
+
+
+def test_clip_polylines_by_a_square():
+    region = Region([square(0, 0, 10)])
+    through, away = [-5, 5, 20, 5], [-5, -5, -1, -5]
+    outside = clip_polylines([through, away], region)
+    assert outside[1] is None
+    assert sorted(outside[0]) == [[-5, 5, 0, 5], [10, 5, 20, 5]]
+    inside = clip_polylines([through, away], region, keep='inside')
+    assert inside[0] == [[0, 5, 10, 5]] and inside[1] == []
@@ -0,0 +1,70 @@
+import os
+import subprocess
+import sys
+
+
+def test_text_without_bbox_keeps_its_anchor(drawing_area):
+    area, canvas = drawing_area(1280, 800)
+    item_id = area.create_item('text', [50, 60], text='', font='Arial 12', fill='black')
+    assert area.document.get(item_id).bbox == (50, 60, 50, 60)
+
+    with area.batched():
+        item_id = area.create_item('text', [80, 90], text='abc', font='Arial 12', fill='black')
+    x1, y1, x2, y2 = area.document.get(item_id).bbox
+    assert x1 < 80 < x2 and y1 < 90 < y2
+
+
+def test_numpy_is_not_loaded_on_startup():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    script = "import sys, core.DrawingArea; print('numpy' in sys.modules)"
+    result = subprocess.run([sys.executable, '-c', script], cwd=root, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == 'False'
+
+
+def test_menu_actions_load_their_modules_on_first_use():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    lazy = ['numpy', 'core.Dialogs', 'core.ReferenceImage', 'lib.SaveImage', 'lib.drawing_file', 'lib.journal',
+            'lib.svg', 'lib.png', 'lib.rasterizer', 'lib.clipping', 'tkinter.filedialog']
+    script = (f"import sys, core.DrawingArea, core.Files, core.Help, core.Editions; "
+              f"print([name for name in {lazy!r} if name in sys.modules])")
+    result = subprocess.run([sys.executable, '-c', script], cwd=root, capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == '[]'
+
+
+def test_motion_coalescer_keeps_the_latest_event_unless_unlimited():
+    from core.DrawingArea import MotionCoalescer
+    from lib.benchmark import FakeCanvas
+
+    canvas = FakeCanvas()
+    received = []
+    coalescer = MotionCoalescer(canvas, received.append, rate=60)
+    for event in range(5):
+        coalescer.push(event)
+    assert received == []
+    canvas.run_pending()
+    assert received == [4]
+
+    coalescer.rate = 0
+    coalescer.push(5)
+    coalescer.push(6)
+    assert received == [4, 5, 6]
+    assert canvas.run_pending() == 0
+
+
+def test_only_the_items_around_the_view_are_on_the_canvas(drawing_area):
+    from lib.benchmark import random_strokes
+    from lib.document import Document
+
+    area, canvas = drawing_area()
+    document = Document(20000, 20000)
+    random_strokes(document, 4000, 6, 20000, 20000)
+    area.load_document(document)
+    for x, y in ((0, 0), (0.9, 0.9)):
+        canvas.xview_moveto(x)
+        canvas.yview_moveto(y)
+        canvas.run_pending()
+        shown = set(area._canvas_ids)
+        assert shown == set(document.find_overlapping(*area._region))
+        assert 0 < len(shown) < len(document) / 20
+    # The items of the first view left the canvas with it
+    assert not shown & set(document.find_overlapping(0, 0, 1280, 800))
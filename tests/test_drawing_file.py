@@ -0,0 +1,93 @@
+import numpy as np
+
+from lib.benchmark import random_strokes
+from lib.document import Document
+from lib.drawing_file import open_drawing, open_drawing_file, save_changes, save_drawing
+
+
+def items_of(document):
+    # Files keep the coordinates as float32
+    return [(item.id, item.kind, np.float32(item.coords).tolist(), item.options, item.layer) for item in document]
+
+
+def big_drawing():
+    document = Document(20000, 20000)
+    random_strokes(document, 3000, 6, 20000, 20000)
+    document.add('line', [], fill='red')
+    document.set_active_layer(document.add_layer().id)
+    document.add('text', [50, 50], text='', font=('Arial', 12))
+    return document
+
+
+def test_round_trip_decodes_chunks_lazily(tmp_path):
+    document = big_drawing()
+    path = str(tmp_path / 'big.desenhando')
+    save_drawing(document, path)
+    opened, raster = open_drawing(path)
+    assert raster is None and len(opened) == len(document)
+    source = opened._source
+    assert source is not None and source.pending_items == len(document)
+
+    opened.find_overlapping(0, 0, 1000, 1000)
+    assert 0 < source.pending_items < len(document)
+    # The bbox-less line was loaded with the first query, though it is nowhere
+    empty = max(item.id for item in document if item.bbox is None)
+    assert empty in opened._items
+    # Lookups by id decode the chunk of the item, and only it
+    far = document.find_overlapping(19000, 19000, 20000, 20000)[-1]
+    pending = source.pending_items
+    assert far in opened and opened.get(far).options == document.get(far).options
+    assert pending - source.pending_items <= 64
+    assert 10 ** 6 not in opened
+    assert items_of(opened) == items_of(document)
+
+
+def test_changes_keep_items_without_bounding_box(tmp_path):
+    path = str(tmp_path / 'changes.desenhando')
+    save_drawing(big_drawing(), path)
+    document, raster, layout = open_drawing_file(path)
+    added = document.add('line', [], fill='blue')
+    far = document.find_overlapping(19000, 19000, 20000, 20000)[-1]
+    document.configure(far, fill='green')
+    layout = save_changes(document, path, layout=layout)
+    assert layout.generation == 2
+
+    reopened, raster = open_drawing(path)
+    assert reopened.get(added).options == {'fill': 'blue'}
+    assert reopened.get(far).options['fill'] == 'green'
+    assert items_of(reopened) == items_of(document)
+
+
+def test_opening_a_drawing_only_decodes_the_view(tmp_path, drawing_area):
+    path = str(tmp_path / 'view.desenhando')
+    document = big_drawing()
+    document.set_active_layer(document.layers[0].id)
+    save_drawing(document, path)
+    opened, raster = open_drawing(path)
+    area, canvas = drawing_area()
+    area.load_document(opened, raster, path)
+    canvas.run_pending()
+    assert opened._source is not None and opened._source.pending_items > len(opened) / 2
+
+
+def test_incremental_save_appends_only_the_changed_chunks(tmp_path):
+    path = str(tmp_path / 'incremental.desenhando')
+    document = big_drawing()
+    layout = save_drawing(document, path)
+    chunks = dict(layout.chunks)
+    size = layout.size
+
+    item_id = document.find_overlapping(0, 0, 2000, 2000)[0]
+    document.set_coords(item_id, [1, 1, 2, 2])
+    layout = save_changes(document, path, layout=layout)
+    kept = [number for number in chunks if layout.chunks.get(number) == chunks[number]]
+    assert len(kept) == len(chunks) - 1
+    # One chunk and the new index were appended
+    largest = max(entry[2] for entry in chunks.values())
+    assert layout.size - size <= largest + layout.index_length
+
+    reopened, raster = open_drawing(path)
+    assert reopened.get(item_id).coords == [1, 1, 2, 2]
+    assert items_of(reopened) == items_of(document)
+    # Nothing changed: nothing is written
+    assert save_changes(document, path, layout=layout).size == layout.size
@@ -0,0 +1,32 @@
+from core.Tools import EraserTool, PencilTool
+from lib.clipping import capsule_chain, cut
+from lib.document import Document
+
+
+def test_capsule_chain_erases_where_capsules_overlap():
+    document = Document(400, 400)
+    item_id = document.add('line', [0, 100, 300, 100], fill='black', width=2)
+    # Both capsules cover the stroke around x = 100, where they overlap
+    rings = capsule_chain([(90, 80), (100, 120), (110, 80)], 8)
+    pieces = cut([document.get(item_id)], rings, nonzero=True)[item_id]
+    assert len(pieces) == 2
+    (_, left, _), (_, right, _) = pieces
+    assert left[0] == 0 and 80 < left[-2] < 100
+    assert right[-2] == 300 and 100 < right[0] < 120
+
+
+def test_eraser_gesture_is_one_undo_step(drawing_area, drag):
+    area, canvas = drawing_area(1280, 800, PencilTool)
+    document = area.document
+    for y in (100, 150, 200):
+        drag(area, canvas, [(100 + i * 5, y) for i in range(60)])
+    strokes = sorted(item.coords for item in document)
+
+    area.tool = EraserTool(area)
+    drag(area, canvas, [(150 + i * 3, 60 + i * 5) for i in range(40)])
+    assert len(document) == 6
+
+    area.undo()
+    assert sorted(item.coords for item in document) == strokes
+    area.redo()
+    assert len(document) == 6
@@ -0,0 +1,54 @@
+import queue
+from concurrent.futures.process import BrokenProcessPool
+from types import SimpleNamespace
+
+import core.Files as files
+from lib.benchmark import FakeWidget
+
+
+def test_a_failed_export_pool_is_reported(monkeypatch):
+    shown = []
+    monkeypatch.setattr(files.messagebox, 'showerror', lambda **options: shown.append(('error', options['message'])))
+    monkeypatch.setattr(files.messagebox, 'showinfo', lambda **options: shown.append(('info', options['message'])))
+    export = files.Export(SimpleNamespace(root=FakeWidget()))
+    export.pipeline = SimpleNamespace(results=queue.Queue(), error=BrokenProcessPool('a worker died'))
+    export.notify_that_the_export_has_finished()
+    assert shown == [('error', 'Não foi possível exportar:\na worker died')]
+
+
+def test_the_pipeline_keeps_the_error_of_its_pool(tmp_path):
+    from lib.SaveImage import ExportPipeline, ExportTarget
+    from lib.document import Document
+
+    target = ExportTarget(str(tmp_path / 'out.png'))
+    # No pool can have a negative number of processes
+    pipeline = ExportPipeline([target], FakeWidget(), Document(100, 100), max_workers=-1)
+    pipeline.run()
+    assert isinstance(pipeline.error, ValueError)
+    assert pipeline.results.empty()
+
+
+def test_a_cancel_after_the_last_band_keeps_the_image(tmp_path, monkeypatch):
+    import lib.SaveImage as save_image
+    from lib.document import Document
+    from lib.png import decode_png
+
+    document = Document(100, 300)
+    document.add('rectangle', [10, 10, 90, 290], fill='red')
+    path = tmp_path / 'late.png'
+    task = save_image.SaveImage(str(path), None, document)
+    draw_page = save_image.draw_page
+
+    def draw_and_cancel(document, band, scale, origin, *args):
+        draw_page(document, band, scale, origin, *args)
+        if origin[1] * scale + band.height == task.height:
+            task.cancel()
+
+    monkeypatch.setattr(save_image, 'draw_page', draw_and_cancel)
+    assert task.export() is True
+    assert decode_png(path.read_bytes()).shape == (300, 100, 4)
+
+    early = save_image.SaveImage(str(tmp_path / 'early.png'), None, document)
+    early.cancel()
+    assert early.export() is False
+    assert not list(tmp_path.glob('early*'))
@@ -0,0 +1,39 @@
+import time
+
+from lib.benchmark import stroke_points
+from lib.geometry import StrokeSimplifier, point_segment_distance, simplify
+
+
+def test_simplify_keeps_the_ends_and_the_tolerance():
+    coords = [0, 0, 5, 0.1, 10, 0, 10, 10]
+    assert simplify(coords, 0.5) == [0.0, 0.0, 10.0, 0.0, 10.0, 10.0]
+    assert simplify([0, 0, 5, 1, 10, 0], 0.5) == [0.0, 0.0, 5.0, 1.0, 10.0, 0.0]
+
+
+def test_simplify_large_looping_stroke_in_bounded_time():
+    points = list(stroke_points(40000, 4096, 4096))
+    coords = [c for point in points for c in point]
+    start = time.perf_counter()
+    simplified = simplify(coords, 0.75)
+    assert time.perf_counter() - start < 2.0
+    kept = list(zip(simplified[0::2], simplified[1::2]))
+    assert kept[0] == points[0] and kept[-1] == points[-1]
+    assert len(kept) < len(points) // 2
+    # Every dropped point stays within tolerance of the segment replacing it
+    index = 0
+    for (ax, ay), (bx, by) in zip(kept, kept[1:]):
+        while points[index] != (bx, by):
+            assert point_segment_distance(*points[index], ax, ay, bx, by) <= 0.75 + 1e-9
+            index += 1
+
+
+def test_stroke_simplifier_keeps_a_turn_back():
+    simplifier = StrokeSimplifier(1.0)
+    for x, y in ((0, 0), (100, 0), (0, 0.5)):
+        simplifier.add(x, y)
+    assert simplifier.finish() == [0, 0, 100, 0, 0, 0.5]
+
+    simplifier = StrokeSimplifier(1.0)
+    for x, y in ((0, 0), (50, 0), (50.5, 0), (100, 0)):
+        simplifier.add(x, y)
+    assert simplifier.finish() == [0, 0, 100, 0]
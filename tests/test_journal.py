@@ -0,0 +1,53 @@
+import os
+
+from lib.document import Document
+from lib.journal import Journal, checkpoints, segments
+
+
+def items_of(document):
+    return [(item.id, item.kind, [round(value, 3) for value in item.coords], item.layer) for item in document]
+
+
+def test_replay_stops_at_a_truncated_record(tmp_path):
+    directory = str(tmp_path / 'journal')
+    document = Document(300, 200)
+    document.add('line', [0, 0, 10, 10], fill='black')
+    journal = Journal(directory)
+    journal.start(document)
+    first = document.add('rectangle', [5, 5, 50, 50], outline='red')
+    journal.items(document, [first])
+    journal.stop()
+    saved = items_of(document)
+
+    second = document.add('line', [20, 20, 40, 60], fill='blue')
+    journal.resume(document)
+    journal.items(document, [second])
+    journal.stop()
+    # The last write was torn by a crash: its frame is incomplete
+    path = segments(directory)[2]
+    with open(path, 'r+b') as file:
+        file.truncate(os.path.getsize(path) - 3)
+
+    recovered, raster = Journal.recover(directory)
+    assert (recovered.width, recovered.height) == (300, 200)
+    assert items_of(recovered) == saved
+    journal.close()
+
+
+def test_compacted_journal_recovers_every_change(tmp_path):
+    directory = str(tmp_path / 'journal')
+    document = Document(300, 200)
+    journal = Journal(directory, sync_interval=0, compact_size=1)
+    journal.start(document)
+    for index in range(20):
+        item_id = document.add('line', [index, 0, index, 100], fill='black')
+        journal.items(document, [item_id])
+    document.remove(5)
+    journal.items(document, [5])
+    journal.stop()
+    assert checkpoints(directory)
+
+    recovered, raster = Journal.recover(directory)
+    assert items_of(recovered) == items_of(document)
+    journal.close()
+    assert not segments(directory) and not checkpoints(directory)
@@ -0,0 +1,49 @@
+from core.Tools import EraserTool, PencilTool
+
+
+def test_undo_after_removing_a_layer(drawing_area, drag):
+    area, canvas = drawing_area(1280, 800, PencilTool)
+    document = area.document
+    layer = area.layers.add()
+    drag(area, canvas, [(100 + i * 5, 100) for i in range(40)])
+    area.tool = EraserTool(area)
+    drag(area, canvas, [(200, 50 + i * 5) for i in range(20)])
+    erased = [(item.id, item.coords) for item in document]
+    assert len(erased) == 2
+
+    area.layers.remove(layer.id)
+    assert len(document) == 0
+    assert [layer.id for layer in document.layers] == [1]
+
+    area.undo()
+    assert [layer.id for layer in document.layers] == [1, layer.id]
+    assert [(item.id, item.coords) for item in document] == erased
+    assert all(item.layer == layer.id for item in document)
+
+    area.undo()
+    assert len(document) == 1
+
+    area.redo()
+    area.redo()
+    assert len(document) == 0
+    assert [layer.id for layer in document.layers] == [1]
+
+
+def test_inactive_layers_only_render_the_tiles_of_the_view(drawing_area):
+    from lib.benchmark import random_strokes
+    from lib.document import Document
+
+    area, canvas = drawing_area(1280, 800, PencilTool)
+    document = Document(20000, 20000)
+    random_strokes(document, 200, 6, 20000, 20000)
+    document.set_active_layer(document.add_layer().id)
+    area.load_document(document)
+    for zoom in (0.25, 1, 4):
+        area.set_zoom(zoom)
+        canvas.run_pending()
+        below = area.layers.below
+        assert below.items
+        # The view and its margin, never the 20000 * zoom pixels of the page
+        page_tiles = (20000 * zoom / below.tile_size) ** 2
+        assert len(below.items) <= 40 < page_tiles
+        assert below.photos.size <= below.max_pixels
@@ -0,0 +1,68 @@
+import io
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+from lib.png import SIGNATURE, PNGReader, PNGWriter, chunk, decode_png, encode_png
+
+
+def paeth(left, above, corner):
+    estimate = left + above - corner
+    left_, above_, corner_ = abs(estimate - left), abs(estimate - above), abs(estimate - corner)
+    return left if left_ <= above_ and left_ <= corner_ else above if above_ <= corner_ else corner
+
+
+def filtered_png(pixels, kinds):
+    """
+    PNG file of an RGBA image with the given filter on every row, filtered
+    byte by byte as the PNG specification describes.
+    """
+    height, width = pixels.shape[:2]
+    rows = pixels.reshape(height, -1).astype(int)
+    data = bytearray()
+    for y, kind in enumerate(kinds):
+        data.append(kind)
+        for x in range(rows.shape[1]):
+            left = rows[y, x - 4] if x >= 4 else 0
+            above = rows[y - 1, x] if y else 0
+            corner = rows[y - 1, x - 4] if x >= 4 and y else 0
+            predictor = (0, left, above, (left + above) // 2, paeth(left, above, corner))[kind]
+            data.append((rows[y, x] - predictor) % 256)
+    return (SIGNATURE + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(bytes(data))) + chunk(b'IEND'))
+
+
+@pytest.fixture
+def pixels():
+    return np.random.default_rng(3).integers(0, 256, (24, 17, 4), dtype=np.uint8)
+
+
+def test_encode_and_decode_round_trip(pixels):
+    assert (decode_png(encode_png(pixels)) == pixels).all()
+    opaque = decode_png(encode_png(pixels[..., :3]))
+    assert (opaque[..., :3] == pixels[..., :3]).all() and (opaque[..., 3] == 255).all()
+
+
+def test_every_filter_is_undone(pixels):
+    kinds = [(0, 1, 2, 3, 4, 4, 3, 3, 4, 2)[y % 10] for y in range(len(pixels))]
+    data = filtered_png(pixels, kinds)
+    assert (decode_png(data) == pixels).all()
+    reader = PNGReader(io.BytesIO(data))
+    bands = [reader.read_rows(5) for _ in range(5)]
+    assert (np.vstack(bands) == pixels).all()
+
+
+def test_reader_reads_back_the_bands_of_the_writer(pixels):
+    file = io.BytesIO()
+    writer = PNGWriter(file, 17, 24, chunk_size=100)
+    for y in range(0, 24, 7):
+        writer.write_rows(pixels[y:y + 7])
+    writer.close()
+    file.seek(0)
+    reader = PNGReader(file)
+    assert (reader.width, reader.height) == (17, 24)
+    assert (np.vstack([reader.read_rows(10) for _ in range(3)]) == pixels).all()
+    with pytest.raises(ValueError):
+        PNGReader(io.BytesIO(file.getvalue()[:40])).read_rows(24)
@@ -0,0 +1,43 @@
+from lib.profiling import EventProfiler
+
+
+def test_counted_events_have_a_rate_without_a_histogram():
+    profiler = EventProfiler()
+    for _ in range(3):
+        profiler.count('motion')
+    handler = profiler.wrap('handler', lambda: None)
+    handler()
+    assert profiler.rate('motion') == 3 / profiler.rate_window
+    assert profiler.rate('handler') == 1 / profiler.rate_window
+    assert list(profiler.histograms) == ['handler']
+
+
+def test_latency_percentiles_are_close_to_the_samples():
+    from lib.profiling import LatencyHistogram
+
+    histogram = LatencyHistogram()
+    for index in range(1000):
+        histogram.add(0.001 + index * 1e-6)
+    assert abs(histogram.percentile(0.5) - 0.0015) < 0.0015 * 0.02
+    assert abs(histogram.percentile(0.99) - 0.00199) < 0.00199 * 0.02
+    assert histogram.percentile(1.0) == histogram.max
+    for microseconds in (0, 1, 15, 16, 17, 1000, 123456, 2 ** 31):
+        low, width = histogram._bounds(histogram._bucket(microseconds))
+        assert low <= microseconds < low + width and width <= max(1, microseconds / 16)
+
+
+def test_phase_timer_reports_every_phase(monkeypatch):
+    from types import SimpleNamespace
+
+    import lib.profiling as profiling
+
+    clock = iter([1.0, 1.25])
+    monkeypatch.setattr(profiling, 'time', SimpleNamespace(perf_counter=lambda: next(clock)))
+    timer = profiling.PhaseTimer(0.5)
+    assert timer.mark('imports') == 0.5
+    assert timer.mark('widgets') == 0.25
+    assert timer.total == 0.75
+    report = timer.report('Startup', 500)
+    assert report.splitlines()[1].split() == ['imports', '500.0', 'ms', '66.7%']
+    assert report.splitlines()[-1].split() == ['target', '500.0', 'ms', 'OVER']
+    assert timer.within(750) and not timer.within(749)
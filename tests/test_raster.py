@@ -0,0 +1,44 @@
+import numpy as np
+
+from lib.raster import RasterLayer, halve, resample
+
+
+def test_operations_only_touch_and_report_their_own_rectangle():
+    layer = RasterLayer(200, 100)
+    layer.fill_rect(10, 10, 20, 30, 'red')
+    layer.dab(150.5, 50.5, 5, 'blue', hardness=1)
+    assert layer.take_dirty() == [(10, 10, 20, 30), (146, 46, 155, 55)]
+    assert layer.take_dirty() == []
+    assert (layer.pixels[10:30, 10:20] == (255, 0, 0, 255)).all()
+    painted = layer.pixels[..., 3] > 0
+    painted[10:30, 10:20] = False
+    painted[46:55, 146:155] = False
+    assert not painted.any()
+    assert layer.take_changes() == (10, 10, 155, 55)
+
+    layer.dab(150.5, 50.5, 5, None, erase=True)
+    assert layer.take_dirty() == [(144, 44, 157, 57)]
+    assert layer.pixels[50, 150, 3] == 0
+
+
+def test_dirty_rectangles_merge_and_collapse():
+    layer = RasterLayer(1000, 1000)
+    layer.clear_rect(0, 0, 10, 10)
+    layer.clear_rect(5, 5, 20, 20)
+    assert layer.take_dirty() == [(0, 0, 20, 20)]
+    for index in range(layer.max_dirty_rects + 1):
+        layer.clear_rect(index * 30, 0, index * 30 + 10, 10)
+    assert layer.take_dirty() == [(0, 0, layer.max_dirty_rects * 30 + 10, 10)]
+    layer.fill_rect(-50, -50, -1, -1, 'red')
+    assert layer.take_dirty() == []
+
+
+def test_scaling_averages_in_premultiplied_alpha():
+    pixels = np.zeros((2, 4, 4), dtype=np.uint8)
+    pixels[:, :2] = (255, 0, 0, 255)
+    # Transparent pixels do not darken their opaque neighbours
+    pixels[:, 2:] = (0, 0, 0, 0)
+    pixels[0, 3] = (0, 0, 255, 255)
+    assert halve(pixels).tolist() == [[[255, 0, 0, 255], [0, 0, 255, 64]]]
+    assert (resample(pixels, 2, 1) == halve(pixels)).all()
+    assert halve(np.full((3, 3, 4), 200, dtype=np.uint8)).shape == (2, 2, 4)
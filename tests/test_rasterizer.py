@@ -0,0 +1,24 @@
+import pytest
+
+from lib.document import Document
+from lib.raster import parse_color
+from lib.rasterizer import render
+
+
+def test_parse_color_knows_the_tk_names_and_formats():
+    assert parse_color('navy') == (0, 0, 128, 255)
+    assert parse_color('Light Sea Green') == (32, 178, 170, 255)
+    assert parse_color('gray50') == (127, 127, 127, 255)
+    assert parse_color('#f00') == parse_color('#ff0000') == parse_color('#ffff00000000') == (255, 0, 0, 255)
+    assert parse_color('#11223380') == (0x11, 0x22, 0x33, 0x80)
+    with pytest.raises(ValueError):
+        parse_color('no such color')
+
+
+def test_unknown_colors_do_not_stop_the_render():
+    document = Document(40, 20)
+    document.add('rectangle', [0, 0, 20, 20], fill='navy', outline='')
+    document.add('rectangle', [20, 0, 40, 20], fill='no such color', outline='')
+    pixels = render(document)
+    assert tuple(pixels[10, 10]) == (0, 0, 128, 255)
+    assert tuple(pixels[10, 30]) == (0, 0, 0, 255)
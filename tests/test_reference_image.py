@@ -0,0 +1,32 @@
+import numpy as np
+
+from core.ReferenceImage import PyramidBuilder
+from lib.benchmark import FakeCanvas
+from lib.png import decode_png, encode_png
+from lib.raster import halve
+
+
+def test_pyramid_levels_average_the_level_below(tmp_path):
+    image = np.random.default_rng(5).integers(0, 256, (300, 600, 4), dtype=np.uint8)
+    image[..., 3] = 255
+    path = tmp_path / 'big.png'
+    path.write_bytes(encode_png(image))
+    widget = FakeCanvas()
+    builder = PyramidBuilder(str(path), widget, cache_root=str(tmp_path / 'tiles'))
+    builder.start()
+    while widget.run_pending():
+        pass
+    assert builder.error is None and builder.progress == 1.0
+    pyramid = builder.pyramid
+
+    def tile(level, row, column):
+        with open(pyramid.tile_path(level, row, column), 'rb') as file:
+            return decode_png(file.read())
+
+    assert pyramid.levels == 3
+    size = pyramid.tile_size
+    assert (tile(0, 1, 2) == image[size:, 2 * size:]).all()
+    level1 = halve(image)
+    assert (tile(1, 0, 0) == level1[:, :size]).all()
+    assert (tile(1, 0, 1) == level1[:, size:]).all()
+    assert (tile(2, 0, 0) == halve(level1)).all()
@@ -0,0 +1,34 @@
+from core.Tools import PencilTool
+from lib.session import MOTION, PRESS, RELEASE, Replayer, SessionWriter, read_session
+
+
+def test_a_session_cut_by_a_crash_keeps_the_flushed_events(tmp_path):
+    path = str(tmp_path / 'crash.session')
+    writer = SessionWriter(path, zoom=1)
+    writer.add(PRESS, 0, 0, now=0.0)
+    for index in range(1, 31):
+        writer.add(MOTION, index, index, now=index * 0.1)
+    # The process dies without close(): the events up to the last flush survive
+    writer.file.close()
+    info, events = read_session(path)
+    assert info == {'zoom': 1}
+    assert 20 <= len(events) <= 31
+    assert [event[2] for event in events] == list(range(len(events)))
+    assert abs(events[10][1] - 1.0) < 1e-4
+
+
+def test_a_recorded_drawing_replays_the_same(tmp_path, drawing_area, drag):
+    path = str(tmp_path / 'drawing.session')
+    area, canvas = drawing_area(800, 600, PencilTool)
+    area.start_recording(path)
+    drag(area, canvas, [(100 + i * 3, 100 + i) for i in range(50)])
+    drag(area, canvas, [(300, 400 - i * 4) for i in range(30)])
+    assert area.stop_recording() == 80
+
+    info, events = read_session(path)
+    assert (info['width'], info['height']) == (800, 600)
+    assert [event[0] for event in events].count(RELEASE) == 2
+    replayed, canvas = drawing_area(800, 600, PencilTool)
+    Replayer(replayed, events).run()
+    canvas.run_pending()
+    assert [item.coords for item in replayed.document] == [item.coords for item in area.document]
@@ -0,0 +1,33 @@
+import xml.etree.ElementTree as ElementTree
+
+from lib.document import Document
+from lib.svg import export_svg
+
+
+def test_font_family_can_not_break_the_style_sheet(tmp_path):
+    document = Document(200, 100)
+    family = 'Evil"}</style><script>alert(1)</script>]]>'
+    document.add('text', [10, 20], text='hello', font=(family, 12), fill='black')
+    path = tmp_path / 'text.svg'
+    export_svg(document, str(path))
+    root = ElementTree.parse(path).getroot()
+    namespace = '{http://www.w3.org/2000/svg}'
+    assert root.find(f'.//{namespace}script') is None
+    style = root.find(f'{namespace}style').text
+    assert 'font-family:"Evil\\22 \\7d \\3c \\2f style\\3e ' in style
+
+
+def test_hostile_colors_and_join_styles_are_not_written(tmp_path):
+    document = Document(200, 100)
+    hostile = 'x}</style><script>alert(1)</script><style>'
+    document.add('line', [0, 0, 50, 50], fill=hostile, joinstyle='a"b', width=2)
+    document.add('rectangle', [10, 10, 40, 40], fill='#12345', outline=hostile)
+    path = tmp_path / 'hostile.svg'
+    export_svg(document, str(path), background=hostile)
+    text = path.read_text()
+    assert 'script' not in text and 'a"b' not in text and '#12345' not in text
+    root = ElementTree.parse(path).getroot()
+    namespace = '{http://www.w3.org/2000/svg}'
+    assert root.find(f'{namespace}rect').get('fill') == '#000000'
+    style = root.find(f'{namespace}style').text
+    assert 'stroke:#000000' in style and 'stroke-linejoin:round' in style